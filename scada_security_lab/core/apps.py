@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Connect the cache invalidation receivers (device table, PDF reports)
+        from . import devices, reports, search  # noqa: F401
+        # Search triggers lost when a migration rebuilds their table (SQLite)
+        post_migrate.connect(search.reinstall_after_migrate, sender=self)
@@ -0,0 +1,21 @@
+import os
+from django.db import connections
+
+# Throwaway databases for the bench_* commands: every configured alias (the
+# main one and the monitoring one, see monitoring/routers.py) gets a fresh,
+# migrated file in `workdir`. The real databases are not touched.
+
+
+def create_bench_databases(workdir):
+    """Returns what destroy_bench_databases() needs to put things back."""
+    old_names = {}
+    for connection in connections.all():
+        old_names[connection.alias] = connection.settings_dict['NAME']
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, f'{connection.alias}.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    return old_names
+
+
+def destroy_bench_databases(old_names):
+    for alias, old_name in old_names.items():
+        connections[alias].creation.destroy_test_db(old_name, verbosity=0)
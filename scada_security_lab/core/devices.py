@@ -0,0 +1,186 @@
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Device, MaintenanceLog
+
+# action -> the devices it applies to, and what it writes
+#   lock    : anything not already in Maintenance -> Maintenance + LOTO
+#   release : anything not already Operational    -> Operational, lock released
+#   toggle  : same as the single-device button (Operational <-> Maintenance,
+#             any other status goes back to Operational)
+ACTIONS = ('toggle', 'lock', 'release')
+
+LOG_TEXT = {
+    'Maintenance': 'Started Maintenance (LOTO applied)',
+    'Operational': 'Released Lockout, back to Operational',
+}
+
+
+class BulkToggleError(ValueError):
+    pass
+
+
+# --- Device table cache ---
+# The dashboards cache their rendered device table under the current
+# version. Any change to a Device bumps the version, so the next page view
+# renders a fresh table and the old one simply expires.
+VERSION_KEY = 'devices:version'
+
+
+def device_table_version():
+    # A timestamp, so a cleared cache never brings back an old number
+    return cache.get_or_set(VERSION_KEY, time.time_ns, None)
+
+
+def bump_device_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def device_changed(sender, **kwargs):
+    # After the commit: bumping earlier would let another request cache
+    # the old rows under the new version.
+    transaction.on_commit(bump_device_version)
+
+
+def new_state(action, status):
+    if action == 'lock' or (action == 'toggle' and status == 'Operational'):
+        return 'Maintenance', True
+    return 'Operational', False
+
+
+def update_values(action):
+    """SET clause for the action. For toggle it depends on each row's current status."""
+    if action == 'lock':
+        return {'status': Value('Maintenance'), 'is_locked_out': Value(True)}
+    if action == 'release':
+        return {'status': Value('Operational'), 'is_locked_out': Value(False)}
+    # Both CASEs read the row's old status: SQL evaluates every SET
+    # expression against the row as it was before the UPDATE.
+    return {
+        'status': Case(When(status='Operational', then=Value('Maintenance')), default=Value('Operational')),
+        'is_locked_out': Case(When(status='Operational', then=Value(True)), default=Value(False)),
+    }
+
+
+def needs_change(action):
+    if action == 'lock':
+        return ~Q(status='Maintenance', is_locked_out=True)
+    if action == 'release':
+        return ~Q(status='Operational', is_locked_out=False)
+    return Q()
+
+
+def chunks(ids):
+    # SQLite caps the number of query parameters
+    size = (connection.features.max_query_params or 10000) - 10
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def bulk_set_status(action='toggle', ids=None, location=None, status=None, technician='system', log=True):
+    """
+    Apply a status change to many devices at once.
+
+    Devices are picked by ids and/or location/status. Inside one transaction
+    the matching rows are locked (SELECT ... FOR UPDATE on PostgreSQL; on
+    SQLite the IMMEDIATE transaction already holds the write lock), then
+    changed with a conditional UPDATE and logged with bulk_create (unless
+    log=False). Two concurrent calls can't overwrite each other: the second
+    one sees the first one's result.
+
+    Returns one result per requested device:
+        {'id', 'name', 'from', 'to', 'result'}  result: changed | unchanged | not_found
+    """
+    if action not in ACTIONS:
+        raise BulkToggleError(f"Unknown action '{action}', use one of {', '.join(ACTIONS)}")
+    if ids is None and not location and not status:
+        raise BulkToggleError("Give device ids or a location/status filter")
+    limit = getattr(settings, 'DEVICE_BULK_MAX', 10000)
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))  # keep order, drop duplicates
+        if len(ids) > limit:
+            raise BulkToggleError(f"At most {limit} devices per call")
+
+    selection = Q()
+    if location:
+        selection &= Q(location=location)
+    if status:
+        selection &= Q(status=status)
+
+    with transaction.atomic():
+        locked = Device.objects.select_for_update().filter(selection).only('id', 'name', 'status', 'is_locked_out')
+        if ids is None:
+            rows = list(locked.order_by('id')[:limit + 1])
+        else:
+            rows = []
+            for chunk in chunks(ids):
+                rows.extend(locked.filter(id__in=chunk))
+        if len(rows) > limit:
+            raise BulkToggleError(f"The filter matches more than {limit} devices, narrow it down")
+
+        # Only rows that actually change are updated and logged
+        change = needs_change(action)
+        to_change = [
+            device.id for device in rows
+            if action == 'toggle' or (device.status, device.is_locked_out) != new_state(action, device.status)
+        ]
+        values = update_values(action)
+        for chunk in chunks(to_change):
+            Device.objects.filter(change, id__in=chunk).update(**values)
+
+        changed = set(to_change)
+        results = {}
+        logs = []
+        for device in rows:
+            target = new_state(action, device.status)[0] if device.id in changed else device.status
+            results[device.id] = {
+                'id': device.id, 'name': device.name, 'from': device.status, 'to': target,
+                'result': 'changed' if device.id in changed else 'unchanged',
+            }
+            if log and device.id in changed:
+                logs.append(MaintenanceLog(technician_name=technician, device_id=device.id, action=LOG_TEXT[target]))
+        MaintenanceLog.objects.bulk_create(logs, batch_size=1000)
+        # update() sends no signals
+        if changed:
+            transaction.on_commit(bump_device_version)
+
+    if ids is None:
+        return [results[device.id] for device in rows]
+    return [results.get(i, {'id': i, 'name': None, 'from': None, 'to': None, 'result': 'not_found'}) for i in ids]
+
+
+def parse_bulk_request(request):
+    """
+    bulk_set_status() arguments from a POST: a JSON body
+        {"action": "lock", "ids": [1, 2, 3]}   or   {"action": "release", "location": "Sector 7"}
+    or the same fields as form data (ids comma separated).
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise BulkToggleError("Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise BulkToggleError("Body must be a JSON object")
+        ids = data.get('ids')
+    else:
+        data = request.POST
+        ids = data['ids'].split(',') if data.get('ids') else None
+    if ids is not None:
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            raise BulkToggleError("ids must be a list of device ids")
+    return {
+        'action': data.get('action', 'toggle'),
+        'ids': ids,
+        'location': data.get('location') or None,
+        'status': data.get('status') or None,
+    }
@@ -0,0 +1,191 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Fleet poller: checks the status URL of many nodes at once.
+# - one shared requests.Session, so connections to a node are kept alive
+#   and reused by the next poll instead of a new TCP handshake every time
+# - a shared thread pool does the blocking requests
+# - at most FLEET_POLL_PER_HOST requests to the same host at a time
+# - the whole batch has a deadline: whatever is not back by then is
+#   reported as 'timeout' and the view answers anyway
+# - results are cached for FLEET_POLL_CACHE_SECONDS, so ten operators
+#   refreshing the page don't poll the plant ten times
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Status pages are small. Anything bigger is not read past this.
+FLEET_MAX_BODY = 64 * 1024
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+_host_slots = {}  # (host, port) -> [semaphore, requests holding or waiting for it]
+_results = {}  # (url, body_bytes) -> (expires at, result)
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            # One connection pool per host, kept for this many hosts
+            adapter = HTTPAdapter(pool_connections=setting('FLEET_POLL_POOL_HOSTS', 1000),
+                                  pool_maxsize=setting('FLEET_POLL_PER_HOST', 4), max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=setting('FLEET_POLL_WORKERS', 64), thread_name_prefix='fleet-poll')
+        return _executor
+
+
+def acquire_host(host, timeout):
+    """One of the host's FLEET_POLL_PER_HOST slots, or None after `timeout` seconds."""
+    with _lock:
+        entry = _host_slots.get(host)
+        if entry is None:
+            entry = _host_slots[host] = [threading.BoundedSemaphore(setting('FLEET_POLL_PER_HOST', 4)), 0]
+        entry[1] += 1
+    if entry[0].acquire(timeout=timeout):
+        return entry
+    release_host(host, entry, acquired=False)
+    return None
+
+
+def release_host(host, entry, acquired=True):
+    if acquired:
+        entry[0].release()
+    with _lock:
+        entry[1] -= 1
+        # Idle: forget the host, or the dict grows with every address ever polled
+        if not entry[1] and _host_slots.get(host) is entry:
+            del _host_slots[host]
+
+
+def cached_results(keys):
+    # In-process: hundreds of tiny entries that live a few seconds don't
+    # belong in the shared cache (LocMemCache keeps only 300 entries).
+    now = time.monotonic()
+    with _lock:
+        found = {key: _results.get(key) for key in keys}
+    return {key: entry[1] for key, entry in found.items() if entry and entry[0] > now}
+
+
+def clear_cache():
+    with _lock:
+        _results.clear()
+
+
+def store_results(entries, ttl):
+    now = time.monotonic()
+    with _lock:
+        for key in [key for key, entry in _results.items() if entry[0] <= now]:
+            del _results[key]
+        for key, result in entries.items():
+            _results[key] = (now + ttl, result)
+
+
+def fetch(url, deadline, body_bytes):
+    """One status request. Never raises: errors are part of the result."""
+    result = {'url': url, 'ok': False, 'status': None, 'error': None, 'elapsed_ms': None, 'cached': False}
+    parts = urlsplit(url)
+    host = (parts.hostname, parts.port)
+    slot = acquire_host(host, max(0.0, deadline - time.monotonic()))
+    if slot is None:
+        result['error'] = 'timeout'
+        return result
+    started = time.monotonic()
+    try:
+        # Never wait past the batch deadline
+        timeout = min(setting('FLEET_POLL_TIMEOUT', 5.0), max(0.01, deadline - started))
+        with get_session().get(url, timeout=timeout, allow_redirects=False, stream=True) as response:
+            result['status'] = response.status_code
+            result['ok'] = response.ok
+            # The body has to be read to the end, or the connection is closed
+            # instead of going back to the pool. Huge bodies are cut off (and
+            # that one connection dropped).
+            body = b''
+            for chunk in response.iter_content(8192):
+                body += chunk
+                if len(body) > FLEET_MAX_BODY:
+                    break
+            if body_bytes:
+                result['body'] = body[:body_bytes].decode('utf-8', errors='replace')
+    except requests.Timeout:
+        result['error'] = 'timeout'
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        release_host(host, slot)
+    result['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+
+def poll(urls, deadline=None, body_bytes=0):
+    """
+    Check every URL concurrently. Returns {url: result} for all of them
+    within `deadline` seconds (FLEET_POLL_DEADLINE by default).
+    result: {'url', 'ok', 'status', 'error', 'elapsed_ms', 'cached'} (+ 'body')
+    """
+    urls = list(dict.fromkeys(urls))
+    ends_at = time.monotonic() + (deadline if deadline is not None else setting('FLEET_POLL_DEADLINE', 10.0))
+    ttl = setting('FLEET_POLL_CACHE_SECONDS', 15)
+
+    results = {}
+    if ttl:
+        for (url, _), result in cached_results([(url, body_bytes) for url in urls]).items():
+            results[url] = dict(result, cached=True)
+
+    executor = get_executor()
+    pending = {executor.submit(fetch, url, ends_at, body_bytes): url for url in urls if url not in results}
+    done, not_done = wait(pending, timeout=max(0.0, ends_at - time.monotonic()))
+    fresh = {}
+    for future in done:
+        result = future.result()
+        results[result['url']] = result
+        if result['error'] != 'timeout':
+            fresh[(result['url'], body_bytes)] = result
+    for future in not_done:
+        # Still running: its own timeout ends it shortly, we don't wait
+        url = pending[future]
+        results[url] = {'url': url, 'ok': False, 'status': None, 'error': 'timeout', 'elapsed_ms': None, 'cached': False}
+    if ttl and fresh:
+        store_results(fresh, ttl)
+    return results
+
+
+def node_url(ip_address, path):
+    host = f"[{ip_address}]" if ':' in ip_address else ip_address
+    port = setting('FLEET_POLL_PORT', 80)
+    return f"http://{host}{'' if port == 80 else f':{port}'}{path}"
+
+
+def poll_devices(devices, path, body_bytes=0):
+    """Poll every device's status URL. One result per device, in order."""
+    urls = [(device, node_url(device.ip_address, path)) for device in devices]
+    results = poll([url for _, url in urls], body_bytes=body_bytes)
+    return [dict(results[url], device=device.id, name=device.name, ip_address=device.ip_address) for device, url in urls]
+
+
+def summary(results):
+    return {
+        'nodes': len(results),
+        'up': sum(1 for r in results if r['ok']),
+        'down': sum(1 for r in results if not r['ok'] and r['error'] != 'timeout'),
+        'timeout': sum(1 for r in results if r['error'] == 'timeout'),
+        'cached': sum(1 for r in results if r['cached']),
+    }
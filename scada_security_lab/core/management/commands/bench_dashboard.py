@@ -0,0 +1,94 @@
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import Device
+from monitoring.writer import get_writer
+
+PAGES = [
+    ('vulnerable', '/vulnerable/dashboard/', '/vulnerable/login/', {'username': 'bench', 'is_admin': 'True'}),
+    ('vulnerable OR', '/vulnerable/dashboard/?connector=OR&is_locked_out=True', '/vulnerable/login/',
+     {'username': 'bench', 'is_admin': 'True'}),
+    ('patched', '/patched/dashboard/', '/patched/login/', None),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Device dashboards at plant scale: cache cold, cache warm, and right after a device changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=20, help='Requests per page and mode')
+
+    def handle(self, *args, **options):
+        # Throwaway file database, seeded by populate_db
+        workdir = tempfile.mkdtemp(prefix='bench_dashboard_')
+        old_names = create_bench_databases(workdir)
+        try:
+            self.stdout.write(f"Seeding {options['devices']} devices...")
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('populate_db', devices=options['devices'], logs=0, reports=0, seed=1337)
+            connection.close()
+            device = Device.objects.exclude(name="NUCLEAR-CORE-CONTROLLER").order_by('id').first()
+
+            self.stdout.write(f"{'page':<16}{'mode':<14}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'KB':>9}")
+            for name, path, login_path, login_data in PAGES:
+                # The views and the monitor print on every request; self.stdout still points at the real one
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    for mode, timings, queries, size in self.run_page(path, login_path, login_data, device, options):
+                        self.stdout.write(
+                            f"{name:<16}{mode:<14}{statistics.median(timings) * 1000:10.1f}"
+                            f"{percentile(timings, 0.95) * 1000:10.1f}{statistics.median(queries):9.0f}{size / 1024:9.0f}"
+                        )
+        finally:
+            # Pending AttackLog rows belong to the throwaway database
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def run_page(self, path, login_path, login_data, device, options):
+        client = Client()
+        # The 'OR' page is an attack on every request: without this the
+        # monitor would throttle it to 429 halfway through
+        with override_settings(MONITOR_THROTTLE_ENABLED=False):
+            if login_data is None:
+                client.post(login_path, {'username': 'bench'})
+            else:
+                client.get(login_path, login_data)
+
+        def cold():
+            cache.clear()
+
+        def after_write():
+            # Saving a device invalidates the cached table
+            device.save()
+
+        for mode, before in (('cache cold', cold), ('cache warm', None), ('after write', after_write)):
+            cache.clear()
+            client.get(path)  # warm up
+            timings, queries, size = [], [], 0
+            for _ in range(options['requests']):
+                if before:
+                    before()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                size = len(response.content)
+            yield mode, timings, queries, size
@@ -0,0 +1,407 @@
+import base64
+import contextlib
+import io
+import json
+import os
+import pickle
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+import requests
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import Device, DiagnosticReport
+from monitoring.writer import get_writer
+
+MONITOR = 'monitoring.middleware.SecurityMonitorMiddleware'
+# Live driver only. A response that stalls (e.g. fewer bytes than its
+# Content-Length) would hang the client thread: count it as an error.
+REQUEST_TIMEOUT = 10
+
+XXE_PAYLOAD = (
+    b'<?xml version="1.0"?>\n'
+    b'<!DOCTYPE r [<!ENTITY xxe SYSTEM "file:///etc/hostname">]>\n'
+    b'<reading><host>&xxe;</host></reading>\n'
+)
+PICKLE_PAYLOAD = base64.b64encode(pickle.dumps({'sensor': 'PT-101', 'pressure': 4.2})).decode()
+# A truncated pickle: exercises the crash path without running any code
+BROKEN_PICKLE = base64.b64encode(pickle.dumps({'sensor': 'PT-101'})[:-4]).decode()
+
+# (name, method, path, kind, data, file)
+# Placeholders in paths and values are filled in from the seeded database:
+#   {device} a standard device, {hidden} NUCLEAR-CORE-CONTROLLER,
+#   {report} a filler report, {admin_report} the admin report,
+#   {stub} a local HTTP server for the SSRF fetches.
+SCENARIOS = [
+    # --- Vulnerable app ---
+    ('vulnerable_login', 'GET', '/vulnerable/login/', 'benign', {'username': 'operator'}, None),
+    ('vulnerable_login', 'GET', '/vulnerable/login/', 'attack',
+     {'username': 'admin', 'password': 'wrong', 'is_admin': 'True'}, None),
+    ('vulnerable_dashboard', 'GET', '/vulnerable/dashboard/', 'benign', {}, None),
+    ('vulnerable_dashboard', 'GET', '/vulnerable/dashboard/', 'attack',
+     {'connector': 'OR', 'is_locked_out': 'True'}, None),
+    ('vulnerable_upload', 'POST', '/vulnerable/upload/', 'benign', {}, ('readings.txt', b'PT-101 4.2 bar\n' * 64)),
+    ('vulnerable_upload', 'POST', '/vulnerable/upload/', 'attack', {}, ('xxe.xml', XXE_PAYLOAD)),
+    ('vulnerable_report', 'GET', '/vulnerable/report/', 'benign', {'id': '{report}'}, None),
+    ('vulnerable_report', 'GET', '/vulnerable/report/', 'attack', {'id': '{admin_report}'}, None),
+    ('toggle_status', 'GET', '/vulnerable/toggle/{device}/', 'benign', {}, None),
+    ('toggle_status', 'GET', '/vulnerable/toggle/{hidden}/', 'attack', {}, None),
+    ('vulnerable_deserialize', 'POST', '/vulnerable/deserialize/', 'benign', {'payload': PICKLE_PAYLOAD}, None),
+    ('vulnerable_deserialize', 'POST', '/vulnerable/deserialize/', 'attack', {'payload': BROKEN_PICKLE}, None),
+    ('vulnerable_ssrf', 'POST', '/vulnerable/ssrf/', 'benign', {'url': '{stub}/status'}, None),
+    ('vulnerable_ssrf', 'POST', '/vulnerable/ssrf/', 'attack', {'url': 'file:///etc/hostname'}, None),
+    # --- Patched app ---
+    ('patched_login', 'POST', '/patched/login/', 'benign', {'username': 'operator'}, None),
+    ('patched_login', 'POST', '/patched/login/', 'attack', {'username': 'admin', 'is_admin': 'True'}, None),
+    ('patched_dashboard', 'GET', '/patched/dashboard/', 'benign', {}, None),
+    ('patched_dashboard', 'GET', '/patched/dashboard/', 'attack', {'connector': 'OR', 'is_locked_out': 'True'}, None),
+    ('patched_upload', 'POST', '/patched/upload/', 'benign', {}, ('readings.txt', b'PT-101 4.2 bar\n' * 64)),
+    ('patched_upload', 'POST', '/patched/upload/', 'attack', {}, ('xxe.xml', XXE_PAYLOAD)),
+    ('patched_report', 'GET', '/patched/report/', 'benign', {'id': '{report}'}, None),
+    ('patched_report', 'GET', '/patched/report/', 'attack', {'id': '{admin_report}'}, None),
+    # The patched SSRF view only fetches allowlisted internet hosts, so both
+    # cases measure the block path (no network access during the benchmark).
+    ('patched_ssrf', 'POST', '/patched/ssrf/', 'benign', {'url': '{stub}/status'}, None),
+    ('patched_ssrf', 'POST', '/patched/ssrf/', 'attack', {'url': 'http://127.0.0.1:22/'}, None),
+    ('patched_deserialize', 'POST', '/patched/diagnostics/', 'benign', {'payload': '{"sensor": "PT-101"}'}, None),
+    ('patched_deserialize', 'POST', '/patched/diagnostics/', 'attack', {'payload': PICKLE_PAYLOAD}, None),
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def fill(text, targets):
+    # Not str.format(): payloads such as JSON contain braces of their own
+    return re.sub(r'\{(\w+)\}', lambda m: str(targets.get(m.group(1), m.group(0))), text)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """The 'remote SCADA node' the SSRF views fetch from."""
+
+    def do_GET(self):
+        body = b'NODE OK\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # Headers and body go out in separate writes; with Nagle on, every
+    # keep-alive response waits ~40 ms for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+class ClientDriver:
+    """Django's test client: the full middleware stack and views, no sockets."""
+
+    def __init__(self):
+        self.client = Client()
+
+    def login(self):
+        self.client.get('/vulnerable/login/', {'username': 'bench', 'is_admin': 'True'})
+
+    def request(self, method, path, data, upload):
+        if method == 'GET':
+            return self.client.get(path, data).status_code
+        if upload:
+            data = dict(data, file=SimpleUploadedFile(upload[0], upload[1]))
+        return self.client.post(path, data).status_code
+
+
+class LiveDriver:
+    """Real HTTP against a threaded local WSGI server (same server class as runserver)."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def login(self):
+        # A page with {% csrf_token %} first, for the CSRF cookie the patched forms need
+        self.session.get(f"{self.base_url}/vulnerable/ssrf/")
+        self.session.get(f"{self.base_url}/vulnerable/login/", params={'username': 'bench', 'is_admin': 'True'})
+
+    def request(self, method, path, data, upload):
+        url = self.base_url + path
+        if method == 'GET':
+            return self.session.get(url, params=data, allow_redirects=False, timeout=REQUEST_TIMEOUT).status_code
+        headers = {'X-CSRFToken': self.session.cookies.get('csrftoken', '')}
+        files = {'file': upload} if upload else None
+        return self.session.post(url, data=data, files=files, headers=headers,
+                                 allow_redirects=False, timeout=REQUEST_TIMEOUT).status_code
+
+
+class Command(BaseCommand):
+    help = 'Load-tests every vulnerable/patched endpoint (benign + attack payloads), with and without the monitor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', choices=['client', 'live'], default='client',
+                            help="'client': Django test client in-process, 'live': HTTP against a local server")
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients per scenario')
+        parser.add_argument('--monitor', choices=['on', 'off', 'both'], default='both',
+                            help='Run with SecurityMonitorMiddleware enabled, disabled, or both')
+        parser.add_argument('--only', default='', help='Only scenarios whose name contains this text')
+        parser.add_argument('--profile-requests', type=int, default=5,
+                            help='Sequential requests per scenario for query counts and allocations')
+        parser.add_argument('--devices', type=int, default=200)
+        parser.add_argument('--logs', type=int, default=2000)
+        parser.add_argument('--reports', type=int, default=200)
+        parser.add_argument('--output', default='bench_endpoints.json', help='JSON results file')
+        parser.add_argument('--compare', default=None, help='Earlier JSON results to compare against')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if options['only'] in s[0]]
+        if not scenarios:
+            raise CommandError(f"No scenario matches '{options['only']}'")
+        monitor_states = {'on': [True], 'off': [False], 'both': [True, False]}[options['monitor']]
+
+        # A throwaway database (a file, so server threads get real separate
+        # connections) seeded with the same data every run. The uploads the
+        # views write to 'media/' land in a throwaway directory too.
+        workdir = tempfile.mkdtemp(prefix='bench_endpoints_')
+        old_cwd = os.getcwd()
+        old_names = create_bench_databases(workdir)
+        stub = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('populate_db', devices=options['devices'], logs=options['logs'],
+                             reports=options['reports'], seed=1337)
+            # populate_db relaxes fsync on its connection, start the runs on a fresh one
+            connection.close()
+            targets = {
+                'device': Device.objects.exclude(name="NUCLEAR-CORE-CONTROLLER").order_by('id').first().id,
+                'hidden': Device.objects.get(name="NUCLEAR-CORE-CONTROLLER").id,
+                'admin_report': DiagnosticReport.objects.get(technician_name="Admin User").id,
+                'report': DiagnosticReport.objects.exclude(technician_name="Admin User").order_by('id').first().id,
+                'stub': f"http://127.0.0.1:{stub.server_address[1]}",
+            }
+            os.chdir(workdir)
+            results = []
+            for monitor in monitor_states:
+                results.extend(self.run_all(scenarios, targets, monitor, options))
+        finally:
+            os.chdir(old_cwd)
+            stub.shutdown()
+            # Pending AttackLog rows belong to the throwaway database
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'date': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'driver': options['driver'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'debug': settings.DEBUG,
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.print_results(results)
+        self.print_monitor_overhead(results)
+        if options['compare']:
+            self.print_comparison(options['compare'], results)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_all(self, scenarios, targets, monitor, options):
+        middleware = [m for m in settings.MIDDLEWARE if monitor or m != MONITOR]
+        results = []
+        # New clients / a new server for each state: middleware is loaded
+        # once per handler, so the setting only applies to handlers built after it.
+        # The throttle stays off: every attack scenario comes from one address
+        # and would be answered 429 after a few requests (bench_flood measures it).
+        with override_settings(MIDDLEWARE=middleware, MONITOR_THROTTLE_ENABLED=False):
+            server = None
+            if options['driver'] == 'live':
+                server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+                server.daemon_threads = True
+                server.set_app(WSGIHandler())
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                make_driver = lambda: LiveDriver(f"http://127.0.0.1:{server.server_address[1]}")
+            else:
+                make_driver = ClientDriver
+            try:
+                for scenario in scenarios:
+                    # The views and the monitor print to stdout on every request;
+                    # self.stdout still points at the real one.
+                    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                        result = self.run_scenario(scenario, targets, make_driver, options)
+                    result['monitor'] = 'on' if monitor else 'off'
+                    results.append(result)
+                    self.stdout.write(
+                        f"  [{result['monitor']:>3}] {result['name']:<24} {result['kind']:<6} "
+                        f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+                        f"{result['throughput_rps']:8.1f} req/s"
+                    )
+            finally:
+                if server:
+                    server.shutdown()
+                    server.server_close()
+        return results
+
+    def run_scenario(self, scenario, targets, make_driver, options):
+        name, method, path, kind, data, upload = scenario
+        path = fill(path, targets)
+        data = {key: fill(value, targets) for key, value in data.items()}
+
+        # --- Profile pass: sequential, in-process, queries + allocations ---
+        profiler = ClientDriver()
+        profiler.login()
+        queries = []
+        allocations = []
+        counted = [0]
+
+        def count_query(execute, sql, params, many, context):
+            counted[0] += 1
+            return execute(sql, params, many, context)
+
+        profiler.request(method, path, data, upload)  # warm-up
+        tracemalloc.start()
+        try:
+            for _ in range(options['profile_requests']):
+                counted[0] = 0
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                with connection.execute_wrapper(count_query):
+                    profiler.request(method, path, data, upload)
+                queries.append(counted[0])
+                allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+
+        # --- Timed pass: `concurrency` logged-in clients share the requests ---
+        drivers = [make_driver() for _ in range(options['concurrency'])]
+        for driver in drivers:
+            driver.login()
+        latencies = []
+        statuses = {}
+        errors = [0]
+        lock = threading.Lock()
+        total = options['requests']
+        per_driver = [total // len(drivers) + (1 if i < total % len(drivers) else 0) for i in range(len(drivers))]
+
+        def work(driver, count):
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    status = driver.request(method, path, data, upload)
+                except Exception:
+                    status = 'error'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+                    if status == 'error' or status >= 500:
+                        errors[0] += 1
+            # Each client thread has its own DB connection
+            connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(drivers)) as pool:
+            list(pool.map(work, drivers, per_driver))
+        wall = time.perf_counter() - started
+
+        return {
+            'name': name,
+            'kind': kind,
+            'method': method,
+            'path': path,
+            'requests': len(latencies),
+            'errors': errors[0],
+            'status_codes': statuses,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'throughput_rps': round(len(latencies) / wall, 1),
+            'queries': round(statistics.median(queries)),
+            'alloc_peak_kb': round(statistics.median(allocations) / 1024, 1),
+        }
+
+    def print_results(self, results):
+        self.stdout.write("")
+        self.stdout.write(f"{'scenario':<24} {'kind':<6} {'mon':>3} {'p50':>8} {'p95':>8} {'p99':>8} "
+                          f"{'req/s':>8} {'queries':>7} {'alloc':>9} {'errors':>6}")
+        for r in results:
+            self.stdout.write(
+                f"{r['name']:<24} {r['kind']:<6} {r['monitor']:>3} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+                f"{r['p99_ms']:8.2f} {r['throughput_rps']:8.1f} {r['queries']:7d} "
+                f"{r['alloc_peak_kb']:7.1f}KB {r['errors']:6d}"
+            )
+
+    def print_monitor_overhead(self, results):
+        by_key = {(r['name'], r['kind'], r['monitor']): r for r in results}
+        pairs = [(by_key[(n, k, 'on')], by_key[(n, k, 'off')])
+                 for (n, k, m) in by_key if m == 'on' and (n, k, 'off') in by_key]
+        if not pairs:
+            return
+        self.stdout.write("")
+        self.stdout.write("SecurityMonitorMiddleware overhead (monitor on - off, p50):")
+        for on, off in pairs:
+            self.stdout.write(f"  {on['name']:<24} {on['kind']:<6} {on['p50_ms'] - off['p50_ms']:+8.2f} ms")
+        extra = statistics.median(on['p50_ms'] - off['p50_ms'] for on, off in pairs)
+        self.stdout.write(f"  median: {extra:+.2f} ms per request")
+
+    def print_comparison(self, path, results):
+        with open(path) as f:
+            previous = json.load(f)
+        old = {(r['name'], r['kind'], r['monitor']): r for r in previous['results']}
+        self.stdout.write("")
+        self.stdout.write(f"Compared with {path} (commit {previous['meta'].get('commit')}):")
+        for r in results:
+            before = old.get((r['name'], r['kind'], r['monitor']))
+            if not before or not before['p50_ms']:
+                continue
+            change = (r['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            self.stdout.write(
+                f"  {r['name']:<24} {r['kind']:<6} {r['monitor']:>3} "
+                f"p50 {before['p50_ms']:7.2f} -> {r['p50_ms']:7.2f} ms ({change:+.0f}%)"
+            )
@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import urllib.request
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.fleet import clear_cache, node_url, poll_devices, summary
+from core.models import Device
+
+
+class StubPlant:
+    """
+    Hundreds of fake nodes in one thread: an asyncio HTTP/1.1 server with
+    keep-alive on 127.0.<n>.<m> (all of 127/8 is loopback on Linux), same
+    port everywhere. Every node answers after `latency` seconds (the
+    network and the PLC), every `slow_every`-th after `slow_delay`, every
+    `down_every`-th has no server at all.
+    """
+
+    def __init__(self, nodes, latency, slow_every, slow_delay, down_every):
+        self.hosts = [f"127.0.{1 + i // 250}.{1 + i % 250}" for i in range(nodes)]
+        self.slow = {host for i, host in enumerate(self.hosts) if slow_every and i % slow_every == 1}
+        self.down = {host for i, host in enumerate(self.hosts) if down_every and i % down_every == 2}
+        self.connections = 0
+        self.requests = 0
+        self.latency = latency
+        self.slow_delay = slow_delay
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        host = writer.get_extra_info('sockname')[0]
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                self.requests += 1
+                await asyncio.sleep(self.slow_delay if host in self.slow else self.latency)
+                body = f'{{"node": "{host}", "state": "RUN"}}'.encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+                await writer.drain()
+                if b'connection: close' in head.lower():
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        # Pick a port that is free on the first address, then use it everywhere
+        with socket.socket() as s:
+            s.bind((self.hosts[0], 0))
+            self.port = s.getsockname()[1]
+        self.servers = [await asyncio.start_server(self.handle, host, self.port, backlog=64)
+                        for host in self.hosts if host not in self.down]
+
+    def __enter__(self):
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start())
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        async def stop():
+            for server in self.servers:
+                server.close()
+            # Idle keep-alive connections are still waiting for a request
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def reset_counts(self):
+        self.connections = self.requests = 0
+
+
+class Command(BaseCommand):
+    help = 'Fleet status poll against a local stub plant: one-by-one urlopen vs the concurrent, pooled, cached poller'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=500)
+        parser.add_argument('--latency', type=float, default=0.02, help='Seconds every node takes to answer')
+        parser.add_argument('--slow-every', type=int, default=50, help='Every Nth node answers slowly (0 = none)')
+        parser.add_argument('--slow-delay', type=float, default=2.0)
+        parser.add_argument('--down-every', type=int, default=100, help='Every Nth node is down (0 = none)')
+        parser.add_argument('--deadline', type=float, default=3.0, help='Batch deadline for the poller')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_fleet_')
+        old_names = create_bench_databases(workdir)
+        try:
+            with StubPlant(options['nodes'], options['latency'], options['slow_every'], options['slow_delay'], options['down_every']) as plant:
+                Device.objects.bulk_create([
+                    Device(name=f"PLC-{i}", ip_address=host, location=f"Line {i % 10}", status='Operational')
+                    for i, host in enumerate(plant.hosts)
+                ])
+                devices = list(Device.objects.only('id', 'name', 'ip_address').order_by('id'))
+                self.stdout.write(f"{len(devices)} nodes on port {plant.port}, {options['latency'] * 1000:.0f} ms each: "
+                                  f"{len(plant.slow)} slow ({options['slow_delay']} s), {len(plant.down)} down")
+                with override_settings(FLEET_POLL_PORT=plant.port, FLEET_POLL_DEADLINE=options['deadline'],
+                                       FLEET_POLL_ALLOWED_NETWORKS=('127.0.0.0/8',),
+                                       FLEET_POLL_TIMEOUT=options['slow_delay'] + 1):
+                    self.run(plant, devices, options)
+        finally:
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def row(self, name, elapsed, counts, plant):
+        self.stdout.write(
+            f"{name:<34}{elapsed:9.2f} s   up {counts['up']:4}  down {counts['down']:4}  timeout {counts['timeout']:4}  "
+            f"cached {counts['cached']:4}   connections {plant.connections:4}  requests {plant.requests:4}"
+        )
+
+    def run(self, plant, devices, options):
+        # 1. What the single node checker does, once per node
+        plant.reset_counts()
+        started = time.perf_counter()
+        counts = {'up': 0, 'down': 0, 'timeout': 0, 'cached': 0}
+        for device in devices:
+            try:
+                with urllib.request.urlopen(node_url(device.ip_address, '/status'), timeout=options['slow_delay'] + 1) as r:
+                    r.read()
+                counts['up'] += 1
+            except Exception:
+                counts['down'] += 1
+        self.row('one by one (urlopen)', time.perf_counter() - started, counts, plant)
+
+        # 2. The poller: cold, then warm connections, then cached
+        with override_settings(FLEET_POLL_CACHE_SECONDS=0):
+            for name in ('fleet poll (new connections)', 'fleet poll (keep-alive)'):
+                plant.reset_counts()
+                started = time.perf_counter()
+                results = poll_devices(devices, '/status')
+                self.row(name, time.perf_counter() - started, summary(results), plant)
+                # Let the slow nodes finish before the next round
+                time.sleep(options['slow_delay'])
+        poll_devices(devices, '/status')
+        plant.reset_counts()
+        started = time.perf_counter()
+        results = poll_devices(devices, '/status')
+        self.row('fleet poll (cached)', time.perf_counter() - started, summary(results), plant)
+
+        # 3. Through the views
+        clear_cache()
+        time.sleep(options['slow_delay'])
+        client = Client()
+        client.post('/patched/login/', {'username': 'bench'})
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            response = client.post('/patched/ssrf/fleet/')
+        self.stdout.write(f"{'POST /patched/ssrf/fleet/':<34}{time.perf_counter() - started:9.2f} s   "
+                          f"HTTP {response.status_code} {response.json()['summary']}")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            response = Client().post('/vulnerable/ssrf/fleet/', {'path': '/status', 'location': 'Line 3'})
+        first = response.json()['results'][0]
+        self.stdout.write(f"{'POST /vulnerable/ssrf/fleet/':<34}HTTP {response.status_code} {response.json()['summary']}  "
+                          f"body: {first.get('body')}")
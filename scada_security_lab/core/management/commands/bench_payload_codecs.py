@@ -0,0 +1,109 @@
+import base64
+import pickle
+import random
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from core import payloads
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import DiagnosticReport, DiagnosticResult
+
+
+def sample_payloads(seed=11):
+    """What DiagnosticResult holds: a small XML upload result, a vibration capture, a PLC event log."""
+    rng = random.Random(seed)
+    sensors = ['pressure', 'temperature', 'flow', 'valve', 'pump_rpm', 'vibration', 'voltage', 'current']
+    return {
+        'upload (20 readings)': {f"{rng.choice(sensors)}_{i}": f"{rng.uniform(0, 1000):.3f}" for i in range(20)},
+        'waveform (10k floats)': {
+            'sensor': 'vibration', 'sample_rate_hz': 2000, 'unit': 'mm/s',
+            'samples': [round(rng.gauss(0, 3), 4) for _ in range(10000)],
+        },
+        'event log (2k entries)': {
+            'plc': 'PLC-0042',
+            'events': [{'seq': i, 'code': rng.choice(['E101', 'E204', 'W007', 'I000']),
+                        'register': rng.randrange(40001, 40100), 'value': rng.randrange(65536), 'ack': rng.random() < 0.8}
+                       for i in range(2000)],
+        },
+    }
+
+
+def best_time(func, arg, budget=0.2):
+    # Repeat until `budget` seconds are spent, keep the fastest run
+    best = float('inf')
+    spent = 0.0
+    while spent < budget:
+        started = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - started
+        best = min(best, elapsed)
+        spent += elapsed
+    return best
+
+
+class Command(BaseCommand):
+    help = 'DiagnosticResult codecs: stored size and encode/decode time, the old base64 pickle vs msgpack/CBOR/JSON (+zstd/zlib)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Rows written and read back per format in the database run')
+
+    def handle(self, *args, **options):
+        samples = sample_payloads()
+        # Compress everything here, whatever DIAGNOSTIC_COMPRESS_MIN_BYTES says
+        with override_settings(DIAGNOSTIC_COMPRESS_MIN_BYTES=0):
+            formats = [fmt for fmt in payloads.available_formats() if not fmt.startswith('pickle')]
+            self.stdout.write(f"Formats installed: {', '.join(payloads.available_formats())}")
+            self.stdout.write(f"Default: {payloads.default_format()}\n")
+            for name, data in samples.items():
+                self.codec_table(name, data, formats)
+            self.database_run(samples['upload (20 readings)'], options['rows'])
+
+    def codec_table(self, name, data, formats):
+        self.stdout.write(name)
+        self.stdout.write(f"  {'format':<26}{'bytes':>10}{'vs old':>8}{'encode us':>12}{'decode us':>12}")
+        # The old TextField: pickle, then base64
+        old = base64.b64encode(pickle.dumps(data)).decode()
+        rows = [('pickle + base64 (old)', len(old),
+                 best_time(lambda d: base64.b64encode(pickle.dumps(d)).decode(), data),
+                 best_time(lambda s: pickle.loads(base64.b64decode(s)), old))]
+        for fmt in formats:
+            tag, blob = payloads.encode(data, fmt)
+            rows.append((fmt, len(blob), best_time(lambda d: payloads.encode(d, fmt), data),
+                         best_time(lambda b: payloads.decode(tag, b), blob)))
+        for fmt, size, encode_s, decode_s in rows:
+            self.stdout.write(f"  {fmt:<26}{size:10}{size / len(old):8.2f}{encode_s * 1e6:12.1f}{decode_s * 1e6:12.1f}")
+        self.stdout.write('')
+
+    def database_run(self, data, count):
+        # Throwaway file database: write `count` rows with set_data(), read them all back with get_data()
+        workdir = tempfile.mkdtemp(prefix='bench_codecs_')
+        old_names = create_bench_databases(workdir)
+        try:
+            report = DiagnosticReport.objects.create(technician_name='bench', file_path='-', content='')
+            self.stdout.write(f"Database, {count} upload-sized rows (default compression threshold)")
+            self.stdout.write(f"  {'format':<26}{'write s':>10}{'read s':>10}{'data MB':>10}")
+            with override_settings(DIAGNOSTIC_COMPRESS_MIN_BYTES=512):
+                for fmt in ['pickle', 'json', payloads.default_format()]:
+                    DiagnosticResult.objects.all().delete()
+                    started = time.perf_counter()
+                    results = []
+                    for _ in range(count):
+                        result = DiagnosticResult(report=report)
+                        result.set_data(data, fmt)
+                        results.append(result)
+                    DiagnosticResult.objects.bulk_create(results, batch_size=1000)
+                    written = time.perf_counter() - started
+                    started = time.perf_counter()
+                    for result in DiagnosticResult.objects.only('data', 'data_format').iterator(chunk_size=2000):
+                        result.get_data()
+                    read = time.perf_counter() - started
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT SUM(LENGTH(data)) FROM core_diagnosticresult")
+                        stored = cursor.fetchone()[0]
+                    self.stdout.write(f"  {fmt:<26}{written:10.2f}{read:10.2f}{stored / 2**20:10.2f}")
+        finally:
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
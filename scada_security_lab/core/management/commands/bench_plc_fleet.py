@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import random
+import resource
+import shutil
+import statistics
+import struct
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import Device
+from core.plcsim import PLCFleet, SETPOINT, load_devices
+
+READ = struct.Struct('>HHHBBHH')     # MBAP header, function, first register, count
+WRITE = struct.Struct('>HHHBBHH')    # MBAP header, function, register, value
+READ_COUNT = 10                      # status .. device id, what a SCADA poll reads
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def serve_fleet(devices, layout, port, pipe):
+    """The simulator in its own process: it gets the rows, it never touches the database."""
+    async def main():
+        started = time.perf_counter()
+        fleet = PLCFleet(devices, port=port, layout=layout)
+        await fleet.start()
+        setup = time.perf_counter() - started
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_reader(pipe.fileno(), stop.set)
+        pipe.send({'setup': setup, 'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                   'ports': len(fleet.ports())})
+        cpu = cpu_seconds()
+        serving = asyncio.create_task(fleet.serve(sync_interval=0))
+        await stop.wait()
+        serving.cancel()
+        pipe.send({'cpu': cpu_seconds() - cpu, 'requests': fleet.requests, 'exceptions': fleet.exceptions})
+
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        pipe.send({'error': f"{type(e).__name__}: {e}"})
+
+
+class Command(BaseCommand):
+    help = 'Modbus/TCP client load against the PLC simulator (core/plcsim.py) as the fleet grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Fleet sizes, comma separated')
+        parser.add_argument('--layouts', default='gateway,device', help='gateway and/or device')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Load per fleet size and layout')
+        parser.add_argument('--connections', type=int, default=64, help='Client connections')
+        parser.add_argument('--pipeline', type=int, default=1, help='Requests sent at once on a connection')
+        parser.add_argument('--write-every', type=int, default=10, help='Every Nth request writes the setpoint (0 = reads only)')
+        parser.add_argument('--port', type=int, default=20000, help='First port of the simulator')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        workdir = tempfile.mkdtemp(prefix='bench_plc_fleet_')
+        old_names = create_bench_databases(workdir)
+        try:
+            # 1 in 100 devices is tagged out: its writes are refused
+            Device.objects.bulk_create([
+                Device(name=f"PLC-{i}", ip_address=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                       location=f"Line {i % 10}", status='Maintenance' if i % 100 == 99 else 'Operational',
+                       is_locked_out=i % 100 == 99)
+                for i in range(max(sizes))
+            ], batch_size=5000)
+            devices = load_devices()
+        finally:
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"{options['connections']} connections, {options['pipeline']} request(s) in flight each, "
+                          f"{options['seconds']:.0f} s per run; reads of {READ_COUNT} registers"
+                          + (f", every {options['write_every']}th request a write" if options['write_every'] else "") + "\n")
+        self.stdout.write(f"{'layout':<9}{'PLCs':>7}{'ports':>7}{'setup':>8}{'RSS':>8}{'req/s':>9}"
+                          f"{'p50':>8}{'p95':>8}{'p99':>8}{'server us/req':>15}{'exceptions':>12}")
+        for layout in options['layouts'].split(','):
+            for size in sizes:
+                self.run(devices[:size], layout, options)
+        self.stdout.write("(setup s, RSS MB, latencies ms: one round trip of the requests in flight)")
+
+    def run(self, devices, layout, options):
+        context = multiprocessing.get_context('fork')
+        pipe, child_pipe = context.Pipe()
+        process = context.Process(target=serve_fleet, args=(devices, layout, options['port'], child_pipe))
+        process.start()
+        ready = pipe.recv()
+        if 'error' in ready:
+            process.join()
+            self.stdout.write(f"{layout:<9}{len(devices):7}  {ready['error']}")
+            return
+        # Where every client connection goes, the same in both layouts: spread over the fleet
+        fleet = PLCFleet(devices, port=options['port'], layout=layout)
+        targets = []
+        for number in range(options['connections']):
+            if layout == 'gateway':
+                port, first, count = fleet.ports()[number % len(fleet.ports())]
+                targets.append((port, list(range(1, count + 1))))
+            else:
+                port, _ = fleet.address(fleet.ids[number * len(devices) // options['connections']])
+                targets.append((port, [0]))
+
+        latencies, sent = asyncio.run(self.load(targets, options))
+        pipe.send('stop')
+        result = pipe.recv()
+        process.join()
+        requests = result['requests']
+        self.stdout.write(
+            f"{layout:<9}{len(devices):7}{ready['ports']:7}{ready['setup']:8.2f}{ready['rss']:8.0f}"
+            f"{sent / options['seconds']:9.0f}{statistics.median(latencies) * 1000:8.2f}"
+            f"{percentile(latencies, 0.95) * 1000:8.2f}{percentile(latencies, 0.99) * 1000:8.2f}"
+            f"{result['cpu'] / max(requests, 1) * 1e6:15.1f}{result['exceptions']:12}"
+        )
+        assert requests == sent, (requests, sent)
+
+    async def load(self, targets, options):
+        deadline = time.perf_counter() + options['seconds']
+        latencies = []
+        sent = 0
+
+        async def client(number, port, units):
+            nonlocal sent
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            rng = random.Random(number)
+            transaction_id = 0
+            while time.perf_counter() < deadline:
+                requests = []
+                for _ in range(options['pipeline']):
+                    transaction_id = (transaction_id + 1) & 0xFFFF
+                    unit = rng.choice(units)
+                    if options['write_every'] and transaction_id % options['write_every'] == 0:
+                        requests.append(WRITE.pack(transaction_id, 0, 6, unit, 0x06, SETPOINT, 400 + transaction_id % 200))
+                    else:
+                        requests.append(READ.pack(transaction_id, 0, 6, unit, 0x03, 0, READ_COUNT))
+                started = time.perf_counter()
+                writer.write(b''.join(requests))
+                for _ in requests:
+                    header = await reader.readexactly(6)
+                    await reader.readexactly(struct.unpack_from('>H', header, 4)[0])
+                latencies.append(time.perf_counter() - started)
+                sent += len(requests)
+            writer.close()
+            await writer.wait_closed()
+
+        await asyncio.gather(*(client(number, port, units) for number, (port, units) in enumerate(targets)))
+        return latencies, sent
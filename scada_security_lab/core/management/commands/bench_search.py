@@ -0,0 +1,152 @@
+import itertools
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import DiagnosticReport
+from core.search import fts_table, install, rebuild, search, uninstall
+
+# A made-up vocabulary, used with Zipf frequencies like real text: a few
+# words are in most reports, most words in few of them.
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'zi', 'pe', 'so')
+VOCABULARY = [''.join(parts) for parts in itertools.product(SYLLABLES, repeat=3)]
+FIRST_NAMES = ('Ada', 'Ben', 'Cem', 'Dana', 'Elif', 'Femi', 'Gus', 'Hana', 'Ivo', 'Jun', 'Kemal', 'Lia', 'Mert',
+               'Nia', 'Oren', 'Pia', 'Raul', 'Sena', 'Tom', 'Ula')
+LAST_NAMES = ('Yilmaz', 'Kaya', 'Demir', 'Smith', 'Garcia', 'Novak', 'Sato', 'Okafor', 'Berg', 'Rossi', 'Ivanov',
+              'Haddad', 'Kowalski', 'Nguyen', 'Silva', 'Murphy', 'Jensen', 'Cohen', 'Dubois', 'Park')
+WORDS_PER_REPORT = 12
+
+
+def serial(number):
+    # Unique per report (7919 and 10**8 have no common factor)
+    return f"{number * 7919 % 10 ** 8:08d}"
+
+
+def reports(count, seed, start=0):
+    rng = random.Random(seed)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+    for number in range(start, start + count):
+        words = ' '.join(rng.choices(VOCABULARY, cum_weights=weights, k=WORDS_PER_REPORT))
+        name = f"{FIRST_NAMES[number % 20]} {LAST_NAMES[number // 20 % 20]}"
+        yield (name, f"/tmp/reports/{number}.xml",
+               f"<report><serial>{serial(number)}</serial><note>{words}</note></report>")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Search latency at N diagnostic reports: the FTS5 index (core/search.py) against icontains scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query with the index')
+        parser.add_argument('--scan-repeat', type=int, default=3, help='Runs per query with icontains')
+        parser.add_argument('--per-page', type=int, default=20)
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_search_')
+        old_names = create_bench_databases(workdir)
+        try:
+            alias = router.db_for_write(DiagnosticReport)
+            connection = connections[alias]
+            if connection.vendor != 'sqlite':
+                self.stdout.write("bench_search runs on SQLite (FTS5)")
+                return
+            self.load(connection, options['reports'])
+            self.queries(options)
+        finally:
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def insert(self, connection, rows):
+        quote = connection.ops.quote_name
+        sql = (f"INSERT INTO {quote(DiagnosticReport._meta.db_table)} "
+               f"({quote('technician_name')}, {quote('file_path')}, {quote('content')}, {quote('created_at')}) "
+               f"VALUES (%s, %s, %s, %s)")
+        now = DiagnosticReport._meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+        rows = iter(rows)
+        started = time.perf_counter()
+        inserted = 0
+        while True:
+            batch = [row + (now,) for row in itertools.islice(rows, 20000)]
+            if not batch:
+                return inserted / (time.perf_counter() - started)
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            inserted += len(batch)
+
+    def load(self, connection, count):
+        sample = min(100_000, count // 10)
+        # Bulk load without the triggers, then one rebuild: the fast way in
+        uninstall(connection.alias, ['reports'])
+        plain = self.insert(connection, reports(count - sample, 1))
+        started = time.perf_counter()
+        rebuild('reports', connection.alias)
+        rebuilt = time.perf_counter() - started
+        # The rest through the triggers, like live writes: one row per
+        # INSERT (populate_db's executemany) and bulk_create()'s multi-row ones
+        install(connection.alias)
+        indexed = self.insert(connection, reports(sample // 2, 2, start=count - sample))
+        started = time.perf_counter()
+        DiagnosticReport.objects.bulk_create(
+            [DiagnosticReport(technician_name=name, file_path=path, content=content)
+             for name, path, content in reports(sample - sample // 2, 3, start=count - sample + sample // 2)],
+            batch_size=1000,
+        )
+        bulk = (sample - sample // 2) / (time.perf_counter() - started)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")
+            sizes = dict(cursor.fetchall())
+        table = sizes.get(DiagnosticReport._meta.db_table, 0)
+        index = sum(size for name, size in sizes.items() if name.startswith(fts_table(DiagnosticReport)))
+        self.stdout.write(
+            f"{count:,} reports, {table / 1e6:.0f} MB table + {index / 1e6:.0f} MB FTS5 index\n"
+            f"  insert without the index: {plain:9,.0f} rows/s\n"
+            f"  insert with the triggers: {indexed:9,.0f} rows/s ({sample // 2:,} rows, one per INSERT)\n"
+            f"  bulk_create with them:    {bulk:9,.0f} rows/s ({sample - sample // 2:,} rows)\n"
+            f"  rebuild_search_index:     {(count - sample) / rebuilt:9,.0f} rows/s ({rebuilt:.1f} s for {count - sample:,})\n"
+        )
+
+    def queries(self, options):
+        rng = random.Random(3)
+        cases = [
+            ('serial number', [serial(rng.randrange(options['reports'])) for _ in range(options['repeat'])]),
+            ('technician name', [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(options['repeat'])]),
+            ('rare word', [rng.choice(VOCABULARY[800:]) for _ in range(options['repeat'])]),
+            ('medium word', [rng.choice(VOCABULARY[40:60]) for _ in range(options['repeat'])]),
+            ('two words', [f"{rng.choice(VOCABULARY[:10])} {rng.choice(VOCABULARY[100:200])}" for _ in range(options['repeat'])]),
+            ('prefix', [rng.choice(VOCABULARY[200:400])[:4] + '*' for _ in range(options['repeat'])]),
+            ('common word', [rng.choice(VOCABULARY[:3]) for _ in range(options['repeat'])]),
+        ]
+        self.stdout.write(f"First page ({options['per_page']} rows) and the total, ms:")
+        self.stdout.write(f"{'query':<17}{'matches':>10}{'FTS5 p50':>10}{'p95':>8}{'icontains p50':>15}{'speedup':>9}")
+        for label, texts in cases:
+            timings, matches = [], []
+            for text in texts:
+                started = time.perf_counter()
+                result = search('reports', text, per_page=options['per_page'])
+                timings.append(time.perf_counter() - started)
+                matches.append(result['total'])
+            scans = []
+            for text in texts[:options['scan_repeat']]:
+                started = time.perf_counter()
+                search('reports', text, per_page=options['per_page'], method='scan')
+                scans.append(time.perf_counter() - started)
+            fts, scan = statistics.median(timings), statistics.median(scans)
+            self.stdout.write(f"{label:<17}{statistics.median(matches):>10,.0f}{fts * 1000:10.1f}"
+                              f"{percentile(timings, 0.95) * 1000:8.1f}{scan * 1000:15.1f}{scan / fts:8.0f}x")
+
+        text = VOCABULARY[50]
+        for page in (1, 10, 100):
+            started = time.perf_counter()
+            search('reports', text, page=page, per_page=options['per_page'])
+            self.stdout.write(f"  '{text}' page {page}: {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PATHS = ['/vulnerable/dashboard/', '/monitoring/', '/monitoring/api/logs/']
+
+SEED_ATTACKS = """
+import random
+from datetime import timedelta
+from django.utils import timezone
+from monitoring.dedup import fingerprint
+from monitoring.models import AttackLog, AttackPayload
+rng = random.Random(7)
+now = timezone.now()
+kinds = ['SQL Injection', 'XSS / Scripting', 'Auth Bypass', 'Path Traversal / XXE', 'Command Injection']
+text = '/vulnerable/dashboard/?connector=OR&is_locked_out=True'
+payload = AttackPayload.objects.create(fingerprint=fingerprint(text), text=text)
+AttackLog.objects.bulk_create([
+    AttackLog(ip_address=f"10.66.{rng.randrange(256)}.{rng.randrange(256)}", endpoint='/vulnerable/dashboard/',
+              attack_type=rng.choice(kinds), payload=payload,
+              timestamp=now - timedelta(seconds=rng.randrange(86400)))
+    for _ in range(COUNT)
+], batch_size=5000)
+"""
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Requests/second of the dashboard and SOC views: runserver vs the production profile (manage.py serve)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Workers for the multi-worker run')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=10.0, help='Load duration per view')
+        parser.add_argument('--devices', type=int, default=200)
+        parser.add_argument('--attacks', type=int, default=20000, help='AttackLog rows for the SOC views')
+        parser.add_argument('--output', default=None, help='Also write the results as JSON')
+
+    def handle(self, *args, **options):
+        # Same throwaway, seeded database for every server
+        workdir = tempfile.mkdtemp(prefix='bench_serving_')
+        env = dict(os.environ, DJANGO_SQLITE_PATH=os.path.join(workdir, 'bench.sqlite3'),
+                   DJANGO_MONITOR_SQLITE_PATH=os.path.join(workdir, 'monitoring.sqlite3'))
+        manage = [sys.executable, 'manage.py']
+        try:
+            self.stdout.write("Seeding a throwaway database...")
+            for command in (
+                ['migrate', '-v', '0'],
+                ['migrate', '-v', '0', '--database', 'monitoring'],
+                ['populate_db', '--devices', str(options['devices']), '--logs', '1000', '--reports', '100'],
+                ['shell', '-c', SEED_ATTACKS.replace('COUNT', str(options['attacks']))],
+            ):
+                subprocess.run(manage + command, cwd=settings.BASE_DIR, env=env, check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+            servers = [
+                # What the Dockerfile runs: dev server, DEBUG on, one process
+                ('runserver', lambda port: manage + ['runserver', '--noreload', f'127.0.0.1:{port}'], {'DJANGO_DEBUG': '1'}),
+                ('serve --workers 1', lambda port: manage + ['serve', '--workers', '1', '--host', '127.0.0.1', '--port', str(port)], {}),
+                (f"serve --workers {options['workers']}",
+                 lambda port: manage + ['serve', '--workers', str(options['workers']), '--host', '127.0.0.1', '--port', str(port)], {}),
+            ]
+            results = []
+            for name, argv, extra_env in servers:
+                port = free_port()
+                server = subprocess.Popen(argv(port), cwd=settings.BASE_DIR, env=dict(env, **extra_env),
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    self.wait_until_up(base_url)
+                    for path in PATHS:
+                        result = self.load(base_url, path, options['concurrency'], options['seconds'])
+                        result.update(server=name, path=path)
+                        results.append(result)
+                        self.stdout.write(
+                            f"  {name:<20} {path:<24} {result['rps']:8.1f} req/s  "
+                            f"p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}"
+                        )
+                finally:
+                    os.killpg(server.pid, signal.SIGTERM)
+                    server.wait(timeout=30)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write("")
+        self.stdout.write(f"{'server':<20} " + ''.join(f"{path:>26}" for path in PATHS))
+        baseline = {r['path']: r['rps'] for r in results if r['server'] == 'runserver'}
+        for name in dict.fromkeys(r['server'] for r in results):
+            cells = []
+            for r in results:
+                if r['server'] == name:
+                    gain = r['rps'] / baseline[r['path']] if baseline.get(r['path']) else 0
+                    cells.append(f"{r['rps']:9.1f} req/s ({gain:4.1f}x)")
+            self.stdout.write(f"{name:<20} " + ''.join(f"{cell:>26}" for cell in cells))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'cpus': os.cpu_count(), 'concurrency': options['concurrency'], 'results': results}, f, indent=2)
+
+    def wait_until_up(self, base_url, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"{base_url}/vulnerable/login/", timeout=2)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        raise RuntimeError(f"Server at {base_url} did not start")
+
+    def load(self, base_url, path, concurrency, seconds):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        start_at = time.perf_counter() + 1.0
+        stop_at = start_at + seconds
+
+        def client():
+            session = requests.Session()
+            # The dashboard needs a session (Scenario 1 login)
+            session.get(f"{base_url}/vulnerable/login/", params={'username': 'bench', 'is_admin': 'True'})
+            while time.perf_counter() < start_at:
+                time.sleep(0.01)
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                try:
+                    ok = session.get(base_url + path, allow_redirects=False, timeout=30).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                    errors[0] += not ok
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'requests': len(latencies),
+            'errors': errors[0],
+            'rps': round(len(latencies) / seconds, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+        }
@@ -0,0 +1,223 @@
+import contextlib
+import json
+import math
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from array import array
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import Device, TelemetryChunk, TelemetryLatest, TelemetryRollup
+from core.telemetry import TelemetryBuffer, get_telemetry, latest_values, series, to_datetime
+
+# Telemetry as a plain table would store it: one row per sample
+ROW_TABLE = 'bench_telemetry_sample'
+ROW_SCHEMA = [
+    f'CREATE TABLE "{ROW_TABLE}" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, "device_id" bigint NOT NULL, '
+    '"metric" varchar(50) NOT NULL, "timestamp" datetime NOT NULL, "value" real NOT NULL)',
+    f'CREATE INDEX "bench_sample_series_idx" ON "{ROW_TABLE}" ("device_id", "metric", "timestamp")',
+]
+METRICS = ('pressure', 'temperature', 'flow', 'valve', 'vibration', 'current', 'voltage', 'level')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def table_bytes(cursor, tables):
+    """Pages used by the tables and their indexes (SQLite dbstat), None if unavailable."""
+    names = list(tables)
+    for table in tables:
+        names += [name for name, info in cursor.db.introspection.get_constraints(cursor, table).items() if info['index']]
+    try:
+        cursor.execute(f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(['%s'] * len(names))})", names)
+    except Exception:
+        return None
+    return cursor.fetchone()[0]
+
+
+def workload(device_ids, metrics, rate, seconds, end):
+    """One batch list per second: [(device id, metric, times 'd', values 'f')], `rate` samples per series and second."""
+    step = 1.0 / rate
+    start = end - seconds
+    for second in range(seconds):
+        base = start + second
+        times = array('d', [base + i * step for i in range(rate)])
+        batches = []
+        for device_id in device_ids:
+            for number, metric in enumerate(metrics):
+                # A slow wave with some noise, so min/max/avg mean something
+                phase = device_id * 0.1 + number
+                values = array('f', [50 + 20 * math.sin((base + i * step) / 30 + phase) + (i * 7919 % 13) / 10
+                                     for i in range(rate)])
+                batches.append((device_id, metric, times, values))
+        yield batches
+
+
+class Command(BaseCommand):
+    help = 'Telemetry ingestion: one row per sample vs. ring buffers flushed as chunks + rollups + latest values'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=250)
+        parser.add_argument('--metrics', type=int, default=4, help=f'Metrics per device (at most {len(METRICS)})')
+        parser.add_argument('--rate', type=int, default=100, help='Samples per second, each series')
+        parser.add_argument('--seconds', type=int, default=20, help='Seconds of telemetry written')
+        parser.add_argument('--flush-intervals', default='1,5', help='Seconds between flushes, comma separated')
+        parser.add_argument('--queries', type=int, default=50, help='Repetitions of each read')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_telemetry_')
+        old_names = create_bench_databases(workdir)
+        try:
+            Device.objects.bulk_create([
+                Device(name=f"PLC-{i}", ip_address=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                       location=f"Line {i % 10}", status='Operational')
+                for i in range(options['devices'])
+            ])
+            self.device_ids = list(Device.objects.order_by('id').values_list('id', flat=True))
+            self.metrics = METRICS[:options['metrics']]
+            series_count = len(self.device_ids) * len(self.metrics)
+            self.samples = series_count * options['rate'] * options['seconds']
+            self.stdout.write(f"{len(self.device_ids)} devices x {len(self.metrics)} metrics x {options['rate']} samples/s "
+                              f"for {options['seconds']} s = {self.samples} samples "
+                              f"({series_count * options['rate']} samples per simulated second)\n")
+            self.stdout.write(f"{'write':<26}{'samples/s':>11}{'flush p50':>11}{'max':>9}{'rows':>10}{'bytes/sample':>14}")
+            self.end = time.time()
+            # Built once up front, so the timings are the writes only
+            self.data = list(workload(self.device_ids, self.metrics, options['rate'], options['seconds'], self.end))
+            self.write_rows(options)
+            for interval in [int(value) for value in options['flush_intervals'].split(',')]:
+                self.write_buffered(interval, options)
+            self.stdout.write("")
+            self.reads(options)
+            self.stdout.write("")
+            self.endpoint(options)
+        finally:
+            get_telemetry().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def clear(self):
+        for model in (TelemetryChunk, TelemetryRollup, TelemetryLatest):
+            model.objects.all().delete()
+
+    def write_rows(self, options):
+        connection = connections[router.db_for_write(TelemetryChunk)]
+        with connection.cursor() as cursor:
+            for sql in ROW_SCHEMA:
+                cursor.execute(sql)
+        prep_time = TelemetryChunk._meta.get_field('start').get_db_prep_value
+        sql = f'INSERT INTO "{ROW_TABLE}" ("device_id", "metric", "timestamp", "value") VALUES (%s, %s, %s, %s)'
+        # One executemany per second of telemetry, the cheapest a row per
+        # sample gets (what bulk_create would send, without the objects)
+        started = time.perf_counter()
+        for batches in self.data:
+            rows = [(device_id, metric, prep_time(to_datetime(t), connection), v)
+                    for device_id, metric, times, values in batches for t, v in zip(times, values)]
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        elapsed = time.perf_counter() - started
+        with connection.cursor() as cursor:
+            size = table_bytes(cursor, [ROW_TABLE])
+        self.stdout.write(f"{'one row per sample':<26}{self.samples / elapsed:11.0f}{'':>11}{'':>9}{self.samples:10}"
+                          f"{size / self.samples if size else float('nan'):14.1f}")
+
+    def write_buffered(self, interval, options):
+        self.clear()
+        buffer = TelemetryBuffer(capacity=options['rate'] * interval * 2, flush_interval=3600)
+        flushes = []
+        started = time.perf_counter()
+        for second, batches in enumerate(self.data, 1):
+            buffer.record_many(batches)
+            if second % interval == 0 or second == options['seconds']:
+                flush_started = time.perf_counter()
+                buffer.flush()
+                flushes.append(time.perf_counter() - flush_started)
+        elapsed = time.perf_counter() - started
+        buffer.close()
+        assert buffer.stats()['flushed'] == self.samples, buffer.stats()
+        connection = connections[router.db_for_write(TelemetryChunk)]
+        tables = [model._meta.db_table for model in (TelemetryChunk, TelemetryRollup, TelemetryLatest)]
+        with connection.cursor() as cursor:
+            size = table_bytes(cursor, tables)
+        rows = sum(model.objects.count() for model in (TelemetryChunk, TelemetryRollup, TelemetryLatest))
+        self.stdout.write(f"{f'buffered, flush every {interval} s':<26}{self.samples / elapsed:11.0f}"
+                          f"{statistics.median(flushes) * 1000:9.0f}ms{max(flushes) * 1000:7.0f}ms{rows:10}"
+                          f"{size / self.samples if size else float('nan'):14.1f}")
+
+    def timed(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000, percentile(timings, 0.95) * 1000, result
+
+    def reads(self, options):
+        connection = connections[router.db_for_write(TelemetryChunk)]
+        prep_time = TelemetryChunk._meta.get_field('start').get_db_prep_value
+        device_id, metric = self.device_ids[len(self.device_ids) // 2], self.metrics[0]
+        now = to_datetime(self.end)
+
+        def rows_latest():
+            # Newest row of every series: the whole index is walked
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT s."device_id", s."metric", s."value" FROM "{ROW_TABLE}" s JOIN '
+                    f'(SELECT "device_id", "metric", MAX("timestamp") AS newest FROM "{ROW_TABLE}" GROUP BY "device_id", "metric") n '
+                    f'ON s."device_id" = n."device_id" AND s."metric" = n."metric" AND s."timestamp" = n.newest'
+                )
+                return cursor.fetchall()
+
+        def rows_range(minutes):
+            def query():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT "timestamp", "value" FROM "{ROW_TABLE}" WHERE "device_id" = %s AND "metric" = %s '
+                        f'AND "timestamp" >= %s ORDER BY "timestamp"',
+                        [device_id, metric, prep_time(now - timedelta(minutes=minutes), connection)],
+                    )
+                    return cursor.fetchall()
+            return query
+
+        def telemetry_range(minutes, resolution=None):
+            return lambda: series(device_id, metric, now - timedelta(minutes=minutes), now, resolution)[1]
+
+        repeat = options['queries']
+        self.stdout.write(f"{'read':<40}{'p50 ms':>9}{'p95 ms':>9}{'points':>9}")
+        for name, function in (
+            ('latest, every series (rows: GROUP BY)', rows_latest),
+            ('latest, every series (TelemetryLatest)', latest_values),
+            ('one series, 10 min (rows)', rows_range(10)),
+            ('one series, 10 min (raw chunks)', telemetry_range(10)),
+            ('one series, 6 h (minute rollups)', telemetry_range(360)),
+            ('one series, 7 days (hour rollups)', telemetry_range(7 * 24 * 60)),
+        ):
+            p50, p95, result = self.timed(function, repeat)
+            points = sum(map(len, result.values())) if isinstance(result, dict) else len(result)
+            self.stdout.write(f"{name:<40}{p50:9.2f}{p95:9.2f}{points:9}")
+
+    def endpoint(self, options):
+        # The JSON endpoint: parsing and checking the body costs more than buffering it
+        client = Client()
+        per_request = 10000
+        rate = options['rate']
+        body = json.dumps({'samples': [
+            {'device': device_id, 'metric': metric, 't': [self.end - 1 + i / rate for i in range(rate)],
+             'v': [20.0 + i % 7 for i in range(rate)]}
+            for device_id in self.device_ids for metric in self.metrics
+        ][:per_request // rate]})
+        samples = (per_request // rate) * rate
+        with override_settings(DEBUG=False), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            p50, p95, response = self.timed(
+                lambda: client.post('/vulnerable/telemetry/', body, content_type='application/json'), options['queries'])
+        assert response.status_code == 200, response.content
+        self.stdout.write(f"POST /vulnerable/telemetry/, {samples} samples per request ({len(body) // 1024} KiB): "
+                          f"p50 {p50:.1f} ms, p95 {p95:.1f} ms = {samples / p50 * 1000:.0f} samples/s")
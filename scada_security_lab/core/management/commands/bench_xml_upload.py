@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from lxml import etree
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import DiagnosticReport, DiagnosticResult
+from core.xmlstream import ingest
+
+SENSORS = ['pressure', 'temperature', 'flow', 'valve', 'pump_rpm', 'vibration', 'voltage', 'current']
+
+
+def write_dump(path, megabytes, seed=7):
+    """A diagnostics dump of about `megabytes` MB: reports with a text block and 20 readings each."""
+    rng = random.Random(seed)
+    target = megabytes * 1024 * 1024
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<diagnostics technician="bench">\n')
+        number = 0
+        while written < target:
+            number += 1
+            readings = ''.join(
+                f'<result name="{rng.choice(SENSORS)}_{i}">{rng.uniform(0, 1000):.3f}</result>' for i in range(20)
+            )
+            text = ' '.join(f"PLC-{rng.randrange(100000)} cycle {rng.randrange(10**6)} ok" for _ in range(12))
+            block = f'  <report technician="tech-{number % 97}"><content>{text}</content>{readings}</report>\n'
+            f.write(block)
+            written += len(block)
+        f.write('</diagnostics>\n')
+    return os.path.getsize(path), number
+
+
+def run_dom(path):
+    # What the upload views did: the whole tree in memory, then printed back
+    parser = etree.XMLParser(resolve_entities=True)
+    root = etree.parse(path, parser=parser).getroot()
+    output = etree.tostring(root, pretty_print=True).decode()
+    return {'elements': sum(1 for _ in root.iter()), 'reports': 0, 'output_bytes': len(output)}
+
+
+def run_stream(path):
+    result = ingest(path, technician='bench', resolve_entities=True, echo_limit=64 * 1024)
+    return {'elements': result['elements'], 'reports': result['reports'], 'output_bytes': len(result['echo'])}
+
+
+def child(mode, path, memory_limit, queue):
+    # A runaway DOM build fails with MemoryError instead of taking the box down
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    started = time.perf_counter()
+    try:
+        result = {'dom': run_dom, 'stream': run_stream}[mode](path)
+    except MemoryError:
+        result = {'error': f"MemoryError (limit {memory_limit // 2**20} MB)"}
+    except Exception as e:
+        result = {'error': str(e)}
+    result['seconds'] = time.perf_counter() - started
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put(result)
+
+
+class Command(BaseCommand):
+    help = 'XML upload parsing: etree.parse + pretty print (old) vs the streaming parser, on a large diagnostics dump'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mb', type=int, default=500, help='Size of the dump for the streaming parser')
+        parser.add_argument('--dom-mb', type=int, default=100,
+                            help='Size of the dump for the old full-tree parse (it needs several times the file in RAM)')
+        parser.add_argument('--memory-limit-mb', type=int, default=4096, help='Address space limit per run')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_xml_')
+        old_names = create_bench_databases(workdir)
+        try:
+            runs = [('dom', options['dom_mb']), ('stream', options['dom_mb']), ('stream', options['mb'])]
+            dumps = {}
+            for size in sorted({size for _, size in runs}):
+                path = os.path.join(workdir, f"dump_{size}mb.xml")
+                self.stdout.write(f"Writing a {size} MB dump...")
+                dumps[size] = (path,) + write_dump(path, size)
+
+            # Children are forked: they must not share the parent's connection
+            connections.close_all()
+            base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(f"\n(parent process before the runs: {base_rss:.0f} MB RSS)")
+            self.stdout.write(f"{'parser':<34}{'file MB':>8}{'seconds':>9}{'MB/s':>8}{'peak RSS MB':>13}{'elements':>11}{'reports':>9}")
+            context = multiprocessing.get_context('fork')
+            for mode, size in runs:
+                path, file_bytes, _ = dumps[size]
+                queue = context.Queue()
+                # DEBUG off like in production: with it on, Django keeps the SQL
+                # of the last 9000 queries, and bulk INSERTs are big.
+                with override_settings(DEBUG=False, XML_MAX_BYTES=file_bytes + 1, XML_BATCH_SIZE=2000):
+                    process = context.Process(target=child, args=(mode, path, options['memory_limit_mb'] * 2**20, queue))
+                    process.start()
+                    result = queue.get()
+                    process.join()
+                name = {'dom': 'etree.parse + tostring (before)', 'stream': 'iterparse stream + store'}[mode]
+                megabytes = file_bytes / 2**20
+                if 'error' in result:
+                    self.stdout.write(f"{name:<34}{megabytes:8.0f}{result['seconds']:9.1f}{'':>8}{result['peak_rss_mb']:13.0f}  {result['error']}")
+                    continue
+                self.stdout.write(
+                    f"{name:<34}{megabytes:8.0f}{result['seconds']:9.1f}{megabytes / result['seconds']:8.1f}"
+                    f"{result['peak_rss_mb']:13.0f}{result['elements']:11}{result['reports']:9}"
+                )
+            self.stdout.write(f"\nStored: {DiagnosticReport.objects.count()} reports, {DiagnosticResult.objects.count()} results")
+        finally:
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
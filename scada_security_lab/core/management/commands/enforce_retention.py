@@ -0,0 +1,46 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from core.retention import enforce_retention
+
+
+class Command(BaseCommand):
+    help = 'Archives and deletes expired AttackLog / MaintenanceLog rows (RETENTION_POLICIES), then compacts the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be removed')
+        parser.add_argument('--no-archive', action='store_true', help='Delete without writing archive files')
+        parser.add_argument('--no-vacuum', action='store_true', help='Skip ANALYZE / VACUUM')
+        parser.add_argument('--full-vacuum', action='store_true', help='Always VACUUM (SQLite rewrites the whole file)')
+        parser.add_argument('--every', type=int, default=None, metavar='SECONDS',
+                            help='Scheduler mode: keep running and enforce retention every N seconds')
+        parser.add_argument('--json', action='store_true', help='Print the run report as JSON')
+
+    def handle(self, *args, **options):
+        while True:
+            report = enforce_retention(
+                archive=not options['no_archive'],
+                vacuum=not options['no_vacuum'],
+                full_vacuum=options['full_vacuum'],
+                dry_run=options['dry_run'],
+                log=self.stdout.write,
+            )
+            self.print_report(report, options)
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def print_report(self, report, options):
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        verb = 'would remove' if options['dry_run'] else 'removed'
+        for result in report['models']:
+            line = f"{result['model']}: {verb} {result['deleted'] or result['archived']} rows older than {result['cutoff'][:19]}"
+            if result['archive_file']:
+                line += f" -> {result['archive_file']} ({result['archive_bytes']} bytes)"
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(
+            f"Retention done in {report['seconds']}s: {report['rows_archived']} rows archived, "
+            f"{report['rows_deleted']} deleted, {report['bytes_reclaimed']} bytes reclaimed."
+        ))
@@ -1,76 +1,250 @@
+import multiprocessing
 import random
+import time
+from datetime import timedelta
 from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
 from faker import Faker
-from core.models import Device, MaintenanceLog, DiagnosticReport
+from core import search
+from core.devices import bump_device_version
+from core.models import (Device, MaintenanceLog, DiagnosticReport, DiagnosticResult, TelemetryChunk, TelemetryLatest,
+                         TelemetryRollup)
+from core.reports import report_cache
+
+ACTIONS = ['Reboot', 'Firmware Update', 'Valve Test', 'Pressure Check']
+# We weight 'Operational' higher so the dashboard looks normal initially
+STATUSES = ['Operational', 'Operational', 'Offline']
+
+# Rows generated and committed per unit of work. Every chunk gets its own
+# RNG seeded from (seed, table, chunk number), so the data is the same no
+# matter how many workers share the chunks.
+CHUNK_ROWS = 50000
+
+# Columns written for each generated table
+COLUMNS = {
+    'devices': (Device, ['name', 'ip_address', 'location', 'status', 'is_locked_out']),
+    'logs': (MaintenanceLog, ['technician_name', 'device', 'action', 'timestamp']),
+    'reports': (DiagnosticReport, ['technician_name', 'file_path', 'content', 'created_at']),
+}
+
+# Generator state, set by the command before any chunk runs. Worker
+# processes are forked, so they inherit it instead of receiving the pools
+# and the device ID list with every chunk.
+_state = {}
+
+
+def build_pools(seed, size=2000):
+    """
+    Pre-generate the Faker values once. Faker calls cost tens of
+    microseconds each, picking from a list costs almost nothing.
+    """
+    fake = Faker()
+    fake.seed_instance(seed)
+    return {
+        'names': [fake.name() for _ in range(size)],
+        'cities': [fake.city() for _ in range(size // 4)],
+        'ips': [fake.ipv4_private() for _ in range(size)],
+        'files': [f"/tmp/reports/{fake.file_name(extension='pdf')}" for _ in range(size)],
+    }
+
+
+def timestamp_pool(seed, now, days=30, size=5000):
+    """History timestamps spread over the last `days`, already in database format."""
+    rng = random.Random(f"{seed}:timestamps")
+    field = MaintenanceLog._meta.get_field('timestamp')
+    connection = connections[router.db_for_write(MaintenanceLog)]
+    return [
+        field.get_db_prep_value(now - timedelta(seconds=rng.randrange(days * 86400)), connection)
+        for _ in range(size)
+    ]
+
+
+def tune_connection():
+    connection = connections[router.db_for_write(Device)]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            # Several workers share one SQLite file: wait for the write lock
+            # instead of failing with "database is locked".
+            cursor.execute('PRAGMA busy_timeout = 60000')
+            # Throwaway lab data: skip the fsync on every commit during the load
+            cursor.execute('PRAGMA synchronous = OFF')
+
+
+def generate_rows(table, rng, start, stop):
+    pools = _state['pools']
+    choice = rng.choice
+    if table == 'devices':
+        return [
+            (f"SCADA-PLC-{i}", choice(pools['ips']), choice(pools['cities']), choice(STATUSES), False)
+            for i in range(start, stop)
+        ]
+    if table == 'logs':
+        device_ids = _state['device_ids']
+        rows = [
+            (choice(pools['names']), choice(device_ids), choice(ACTIONS), choice(_state['timestamps']))
+            for _ in range(start, stop)
+        ]
+        # Inserting in device_id order keeps the device_id index writes local
+        rows.sort(key=lambda row: row[1])
+        return rows
+    return [
+        (choice(pools['names']), choice(pools['files']), "<xml>Standard Diagnostic Data</xml>", choice(_state['timestamps']))
+        for _ in range(start, stop)
+    ]
+
+
+def insert_rows(model, fields, rows):
+    """
+    One INSERT statement run with executemany() inside one transaction.
+    bulk_create() builds a model instance and runs pre_save() for every
+    row, which made it the bottleneck (about 8x slower) at millions of rows.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})"
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def delete_all(model):
+    connection = connections[router.db_for_write(model)]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def write_chunk(job):
+    """Generate and insert one chunk. Runs in the command or in a worker process."""
+    table, number, start, stop = job
+    rng = random.Random(f"{_state['seed']}:{table}:{number}")
+    model, fields = COLUMNS[table]
+    insert_rows(model, fields, generate_rows(table, rng, start, stop))
+    return stop - start
+
 
 class Command(BaseCommand):
     help = 'Populates the database with dummy data + SECRET TARGET for security scenarios'
 
-    def handle(self, *args, **kwargs):
-        fake = Faker()
-        
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=20, help='Standard devices to create (default: 20)')
+        parser.add_argument('--logs', type=int, default=100, help='Maintenance logs to create (default: 100)')
+        parser.add_argument('--reports', type=int, default=50, help='Filler diagnostic reports (default: 50)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes for logs and reports (default: 1, no workers)')
+        parser.add_argument('--seed', type=int, default=1337, help='Random seed, same seed = same data')
+
+    def handle(self, *args, **options):
+        # The search index triggers would update it row by row during the
+        # load (and delete the old rows from it one by one first): about 10x
+        # slower. Drop it, load, and build it once at the end.
+        search.uninstall()
+        try:
+            self.populate(options)
+        finally:
+            started = time.perf_counter()
+            indexed = {kind: search.rebuild(kind, drop=True) for kind in search.INDEXES}
+            self.stdout.write(f"Search index built: {', '.join(f'{rows} {kind}' for kind, rows in indexed.items())} "
+                              f"({time.perf_counter() - started:.1f}s)")
+
+    def populate(self, options):
+        started = time.perf_counter()
+        seed = options['seed']
+        _state.update(seed=seed, pools=build_pools(seed), timestamps=timestamp_pool(seed, timezone.now()))
+        tune_connection()
+
         self.stdout.write("Cleaning old data...")
-        # Clear existing data to avoid duplicates on multiple runs
-        Device.objects.all().delete()
-        MaintenanceLog.objects.all().delete()
-        DiagnosticReport.objects.all().delete()
+        # Clear existing data to avoid duplicates on multiple runs.
+        # Children first, one plain DELETE per table: Device and
+        # DiagnosticReport have signal receivers (cache invalidation), so
+        # QuerySet.delete() would load every row to send them. The telemetry
+        # tables point at Device too: their samples go with the devices.
+        for model in (MaintenanceLog, DiagnosticResult, TelemetryChunk, TelemetryRollup, TelemetryLatest,
+                      Device, DiagnosticReport):
+            delete_all(model)
 
         self.stdout.write("Generating Devices...")
-        
+
         # --- CRITICAL: SECRET TARGET DEVICE ---
         # This device is in 'Maintenance' mode and has 'is_locked_out=True'.
         # It will NOT appear on the dashboard normally due to the default filter.
         # The goal is to reveal this device using the SQL Injection vulnerability (Scenario 2).
+        # Always created first, before any generated data, whatever the options.
         Device.objects.create(
             name="NUCLEAR-CORE-CONTROLLER",
             ip_address="10.0.0.99",
             location="Sector 7 (Restricted)",
             status="Maintenance",
-            is_locked_out=True 
+            is_locked_out=True
         )
         self.stdout.write(self.style.WARNING('Created SECRET Device: NUCLEAR-CORE-CONTROLLER (Hidden Target)'))
         # --------------------------------------
 
-        # Generate 20 random standard devices
-        devices = []
-        for i in range(20):
-            d = Device.objects.create(
-                name=f"SCADA-PLC-{i}",
-                ip_address=fake.ipv4_private(),
-                location=fake.city(),
-                # We weight 'Operational' higher so the dashboard looks normal initially
-                status=random.choice(['Operational', 'Operational', 'Offline']),
-                is_locked_out=False
-            )
-            devices.append(d)
-
-        self.stdout.write("Generating Maintenance Logs...")
-        
-        # Generate 100 random logs attached to the random devices
-        for _ in range(100):
-            MaintenanceLog.objects.create(
-                technician_name=fake.name(),
-                device=random.choice(devices), 
-                action=random.choice(['Reboot', 'Firmware Update', 'Valve Test', 'Pressure Check']),
-            )
-
-        self.stdout.write("Generating Diagnostic Reports...")
-        
         # --- IDOR VULNERABILITY SETUP ---
         # Create a specific Sensitive Report belonging to an Admin.
         # Users should try to access this by guessing the ID (Vulnerability A).
+        # Also created before the filler, so it keeps the lowest report ID.
         DiagnosticReport.objects.create(
             technician_name="Admin User",
             file_path="/protected/admin_secrets.pdf",
             content="CONFIDENTIAL: Root Password is 'supersecret123' - Do not share!"
         )
 
-        # Generate 50 standard filler reports
-        for _ in range(50):
-            DiagnosticReport.objects.create(
-                technician_name=fake.name(),
-                file_path=f"/tmp/reports/{fake.file_name(extension='pdf')}",
-                content="<xml>Standard Diagnostic Data</xml>"
-            )
+        # Devices run in this process: the logs need their IDs afterwards
+        self.run_chunks('devices', options['devices'], workers=1)
+        # Logs are only attached to the standard devices, never to the hidden one
+        device_ids = list(
+            Device.objects.exclude(name="NUCLEAR-CORE-CONTROLLER").order_by('id').values_list('id', flat=True)
+        )
+        if options['logs'] and not device_ids:
+            self.stderr.write(self.style.ERROR("--logs needs at least one standard device (--devices)"))
+            return
+        _state['device_ids'] = device_ids
+
+        self.stdout.write("Generating Maintenance Logs...")
+        self.run_chunks('logs', options['logs'], options['workers'])
+
+        self.stdout.write("Generating Diagnostic Reports...")
+        self.run_chunks('reports', options['reports'], options['workers'])
+
+        # Raw SQL sends no signals: drop the cached device tables and PDFs
+        bump_device_version()
+        report_cache.clear()
+
+        total = 2 + options['devices'] + options['logs'] + options['reports']
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully populated database with {total} records and hidden targets! '
+            f'({elapsed:.1f}s, {total / max(elapsed, 1e-9):,.0f} rows/s)'
+        ))
+
+    def run_chunks(self, table, count, workers):
+        jobs = [
+            (table, number, start, min(start + CHUNK_ROWS, count))
+            for number, start in enumerate(range(0, count, CHUNK_ROWS))
+        ]
+        if not jobs:
+            return
+        started = time.perf_counter()
+
+        if workers <= 1 or len(jobs) == 1:
+            self.report_progress(table, map(write_chunk, jobs), count, started)
+            return
+
+        # Workers generate rows and build SQL parameters in parallel. On
+        # SQLite the INSERTs themselves still take turns on the write lock.
+        # Connections must not be shared with the forked children.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, initializer=tune_connection) as pool:
+            self.report_progress(table, pool.imap_unordered(write_chunk, jobs), count, started)
+        tune_connection()
 
-        self.stdout.write(self.style.SUCCESS('Successfully populated database with 100+ records and hidden targets!'))
\ No newline at end of file
+    def report_progress(self, table, results, count, started):
+        done = 0
+        for rows in results:
+            done += rows
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {table}: {done:,}/{count:,} ({done / max(elapsed, 1e-9):,.0f} rows/s)")
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+from core.models import DiagnosticReport
+from core.search import INDEXES, backend, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Re-indexes DiagnosticReport and MaintenanceLog for search (FTS5 on SQLite, GIN tsvector on PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(INDEXES), action='append',
+                            help='Only this index (repeatable, default: all)')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop and recreate the index and its triggers first')
+
+    def handle(self, *args, **options):
+        alias = router.db_for_write(DiagnosticReport)
+        method = backend(connections[alias])
+        if method == 'scan':
+            self.stdout.write(f"{connections[alias].vendor} has no search index here, search scans with icontains.")
+            return
+        for kind in options['kind'] or INDEXES:
+            started = time.perf_counter()
+            rows = rebuild(kind, alias, drop=options['drop'])
+            self.stdout.write(f"  {kind}: {rows} rows indexed in {time.perf_counter() - started:.1f}s ({method})")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Production server: uvicorn with several worker processes, DEBUG off, static files collected'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Server processes (default: one per CPU)')
+        parser.add_argument('--debug', action='store_true', help='Keep DEBUG on (error pages, query log)')
+        parser.add_argument('--access-log', action='store_true', help='Log every request (off by default, it costs)')
+        parser.add_argument('--no-collectstatic', action='store_true')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        # The workers are new processes, so they read their settings from
+        # this environment, not from the settings this command was loaded with.
+        env = dict(os.environ)
+        env['DJANGO_DEBUG'] = '1' if options['debug'] else '0'
+        # Each worker has its own AttackLog writer: with more than one, the
+        # live feed has to read new events from the database to see them all.
+        env.setdefault('MONITOR_FEED_SOURCE', 'database' if workers > 1 else 'local')
+        # Same for the cache (dashboard device tables): share it through files
+        if workers > 1:
+            env.setdefault('DJANGO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'scada_cache'))
+
+        if not options['no_collectstatic']:
+            self.stdout.write("Collecting static files...")
+            subprocess.run([sys.executable, 'manage.py', 'collectstatic', '--noinput', '-v', '0'],
+                           cwd=settings.BASE_DIR, env=env, check=True)
+
+        argv = [
+            sys.executable, '-m', 'uvicorn', 'scada_system.asgi:application',
+            '--host', options['host'], '--port', str(options['port']),
+            '--workers', str(workers),
+            # Django's ASGI handler does not implement the lifespan protocol
+            '--lifespan', 'off',
+            '--access-log' if options['access_log'] else '--no-access-log',
+        ]
+        self.stdout.write(self.style.SUCCESS(
+            f"Serving on http://{options['host']}:{options['port']}/ with {workers} worker(s), "
+            f"DEBUG={'on' if options['debug'] else 'off'}, live feed source: {env['MONITOR_FEED_SOURCE']}"
+        ))
+        sys.stdout.flush()
+        # Replace this process: uvicorn's supervisor handles signals and restarts
+        os.chdir(settings.BASE_DIR)
+        os.execve(sys.executable, argv, env)
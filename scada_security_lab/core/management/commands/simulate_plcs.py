@@ -0,0 +1,48 @@
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Device
+from core.plcsim import PLCFleet, PLCSimError, REGISTERS, load_devices
+
+
+class Command(BaseCommand):
+    help = 'Runs a virtual PLC (Modbus/TCP subset, core/plcsim.py) for every Device row until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=settings.PLC_SIM_HOST)
+        parser.add_argument('--port', type=int, default=settings.PLC_SIM_PORT, help='First port')
+        parser.add_argument('--layout', choices=('gateway', 'device'), default=settings.PLC_SIM_LAYOUT)
+        parser.add_argument('--units-per-port', type=int, default=settings.PLC_SIM_UNITS_PER_PORT)
+        parser.add_argument('--sync-interval', type=float, default=settings.PLC_SIM_SYNC_INTERVAL,
+                            help='Seconds between reads of the Device table (0 = never)')
+        parser.add_argument('--tick', type=float, default=settings.PLC_SIM_TICK)
+        parser.add_argument('--show', type=int, default=25, help='Devices to list with their address')
+
+    def handle(self, *args, **options):
+        devices = load_devices()
+        if not devices:
+            raise CommandError("No devices. Run `python manage.py populate_db` first.")
+        try:
+            fleet = PLCFleet(devices, options['host'], options['port'], options['layout'], options['units_per_port'])
+        except PLCSimError as e:
+            raise CommandError(str(e))
+
+        ports = fleet.ports()
+        self.stdout.write(f"{len(fleet)} PLCs on {options['host']}:{ports[0][0]}-{ports[-1][0]} "
+                          f"({options['layout']} layout), {REGISTERS} holding registers each")
+        names = dict(Device.objects.filter(id__in=fleet.ids[:options['show']]).values_list('id', 'name'))
+        for device_id, status, locked in devices[:options['show']]:
+            port, unit = fleet.address(device_id)
+            self.stdout.write(f"  {names[device_id]:<28} port {port}  unit {unit or 'any':<4} "
+                              f"{status}{' (LOTO)' if locked else ''}")
+        if len(devices) > options['show']:
+            self.stdout.write(f"  ... {len(devices) - options['show']} more")
+        self.stdout.write(self.style.SUCCESS("Serving. Ctrl-C to stop."))
+
+        try:
+            asyncio.run(fleet.serve(options['sync_interval'], options['tick']))
+        except PLCSimError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            self.stdout.write(f"\nStopped after {fleet.requests} requests ({fleet.exceptions} answered with an exception).")
+
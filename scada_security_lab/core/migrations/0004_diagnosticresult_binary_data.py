@@ -0,0 +1,111 @@
+# Generated by Django 6.0 on 2026-10-18 16:27
+
+import base64
+import io
+import pickle
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Plain data types a pickled payload may need. Anything else (a class or
+# function, like the os.system gadget of the vulnerable demo) is refused.
+SAFE_BUILTINS = {'bool', 'bytearray', 'bytes', 'complex', 'dict', 'float', 'frozenset',
+                 'int', 'list', 'set', 'str', 'tuple'}
+
+
+class DataUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == 'builtins' and name in SAFE_BUILTINS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed")
+
+
+def load(raw):
+    return DataUnpickler(io.BytesIO(raw)).load()
+
+
+def batches(DiagnosticResult, fields):
+    # By primary key, one batch in memory at a time
+    last_id = 0
+    while True:
+        batch = list(DiagnosticResult.objects.filter(id__gt=last_id).order_by('id').only('id', *fields)[:BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def write(schema_editor, DiagnosticResult, columns, rows):
+    # One parameterized UPDATE run per row: bulk_update() builds a CASE over
+    # the whole batch and is several times slower here
+    quote = schema_editor.quote_name
+    assignments = ', '.join(f"{quote(column)} = %s" for column in columns)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(f"UPDATE {quote(DiagnosticResult._meta.db_table)} SET {assignments} WHERE id = %s", rows)
+
+
+def to_binary(apps, schema_editor):
+    from core import payloads
+
+    DiagnosticResult = apps.get_model('core', 'DiagnosticResult')
+    fmt = payloads.default_format()
+    for batch in batches(DiagnosticResult, ['serialized_data']):
+        rows = []
+        for result in batch:
+            raw = base64.b64decode(result.serialized_data or '')
+            try:
+                # Every row was written by set_data() with a plain dict, but
+                # the table also holds whatever the vulnerable form accepted:
+                # never run a stored pickle, only read plain data from it
+                tag, data = payloads.encode(load(raw), fmt)
+            except Exception:
+                # Refused, unreadable (or not a dict we can re-encode): keep the pickle bytes as they are
+                tag, data = 'pickle', raw
+            rows.append((data, tag, result.id))
+        write(schema_editor, DiagnosticResult, ['data', 'data_format'], rows)
+
+
+def to_base64_pickle(apps, schema_editor):
+    from core import payloads
+
+    DiagnosticResult = apps.get_model('core', 'DiagnosticResult')
+    for batch in batches(DiagnosticResult, ['data', 'data_format']):
+        rows = []
+        for result in batch:
+            if result.data_format == 'pickle':
+                raw = bytes(result.data or b'')
+            else:
+                raw = pickle.dumps(payloads.decode(result.data_format, result.data))
+            rows.append((base64.b64encode(raw).decode('utf-8'), result.id))
+        write(schema_editor, DiagnosticResult, ['serialized_data'], rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_device_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnosticresult',
+            name='data',
+            field=models.BinaryField(help_text='Serialized payload, raw bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='diagnosticresult',
+            name='data_format',
+            field=models.CharField(default='pickle', help_text="Codec of data, e.g. 'msgpack+zstd' or 'pickle'", max_length=16),
+        ),
+        # Blank allowed, so going backwards can add the column back before filling it
+        migrations.AlterField(
+            model_name='diagnosticresult',
+            name='serialized_data',
+            field=models.TextField(blank=True, default='', help_text='Base64-encoded pickle data'),
+        ),
+        migrations.RunPython(to_binary, to_base64_pickle),
+        migrations.RemoveField(
+            model_name='diagnosticresult',
+            name='serialized_data',
+        ),
+    ]
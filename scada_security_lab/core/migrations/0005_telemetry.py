@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 20:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_diagnosticresult_binary_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('times', models.BinaryField()),
+                ('values', models.BinaryField()),
+                ('device', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_chunks', to='core.device')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['device', 'metric', 'start'], name='telemetry_chunk_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetryLatest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('value', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+                ('device', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_latest', to='core.device')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'metric'), name='telemetry_latest_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=10)),
+                ('metric', models.CharField(max_length=50)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('device', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_rollups', to='core.device')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='telemetry_rollup_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('device', 'metric', 'resolution', 'bucket'), name='telemetry_rollup_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 6.0 on 2026-10-18 21:05
+
+import re
+from django.conf import settings
+from django.db import migrations
+
+# The search index as this migration created it, frozen here: core/search.py
+# may change (and reinstalls its own version after every migrate, see
+# reinstall_after_migrate), this must not.
+# model: indexed columns with their weight
+INDEXES = {
+    'DiagnosticReport': (('technician_name', 'A'), ('content', 'B')),
+    'MaintenanceLog': (('action', 'A'), ('technician_name', 'B')),
+}
+TRIGGERS = ('insert', 'delete', 'update')
+
+
+def postgres_config():
+    config = getattr(settings, 'SEARCH_POSTGRES_CONFIG', 'english')
+    if not re.fullmatch(r'\w+', config):
+        raise ValueError(f"Bad SEARCH_POSTGRES_CONFIG: {config!r}")
+    return config
+
+
+def create_sql(connection, db_table, columns):
+    quote = connection.ops.quote_name
+    table, fts = quote(db_table), quote(f"{db_table}_fts")
+    if connection.vendor == 'sqlite':
+        names = [column for column, _ in columns]
+        listed = ', '.join(quote(name) for name in names)
+        new = ', '.join(f"new.{quote(name)}" for name in names)
+        old = ', '.join(f"old.{quote(name)}" for name in names)
+        delete = f"INSERT INTO {fts} ({fts}, rowid, {listed}) VALUES ('delete', old.id, {old});"
+        insert = f"INSERT INTO {fts} (rowid, {listed}) VALUES (new.id, {new});"
+        trigger = quote(f"{db_table}_fts_%s")
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({listed}, content={table}, content_rowid='id', "
+            f"tokenize='porter unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS {trigger % 'insert'} AFTER INSERT ON {table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {trigger % 'delete'} AFTER DELETE ON {table} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {trigger % 'update'} AFTER UPDATE OF {listed} ON {table} "
+            f"BEGIN {delete} {insert} END",
+            # Index the rows already there (the triggers only see new writes),
+            # then merge the b-tree segments the rebuild left behind
+            f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+            f"INSERT INTO {fts} ({fts}) VALUES ('optimize')",
+        ]
+    if connection.vendor == 'postgresql':
+        config = postgres_config()
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{config}', coalesce({quote(column)}, '')), '{weight}')"
+            for column, weight in columns
+        )
+        return [f"CREATE INDEX IF NOT EXISTS {quote(db_table + '_search')} ON {table} USING GIN (({vector}))"]
+    # Any other backend: search falls back to icontains scans
+    return []
+
+
+def drop_sql(connection, db_table):
+    quote = connection.ops.quote_name
+    if connection.vendor == 'sqlite':
+        return [f"DROP TRIGGER IF EXISTS {quote(f'{db_table}_fts_{name}')}" for name in TRIGGERS] \
+            + [f"DROP TABLE IF EXISTS {quote(f'{db_table}_fts')}"]
+    if connection.vendor == 'postgresql':
+        return [f"DROP INDEX IF EXISTS {quote(db_table + '_search')}"]
+    return []
+
+
+def run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    for model_name, columns in INDEXES.items():
+        db_table = apps.get_model('core', model_name)._meta.db_table
+        # Drop first: a leftover index would not get the rows written since
+        run(schema_editor, drop_sql(connection, db_table) + create_sql(connection, db_table, columns))
+
+
+def drop_index(apps, schema_editor):
+    for model_name in INDEXES:
+        run(schema_editor, drop_sql(schema_editor.connection, apps.get_model('core', model_name)._meta.db_table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_telemetry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,7 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-import pickle
-import base64
+from . import payloads
 
 # 1. Device Model (The machines you control)
 class Device(models.Model):
@@ -12,6 +11,14 @@ class Device(models.Model):
     status = models.CharField(max_length=50, default='Operational')
     is_locked_out = models.BooleanField(default=False) # LOTO (Lockout/Tagout)
 
+    class Meta:
+        # The dashboards filter on status / is_locked_out, the bulk toggle on location
+        indexes = [
+            models.Index(fields=['status'], name='device_status_idx'),
+            models.Index(fields=['is_locked_out'], name='device_locked_idx'),
+            models.Index(fields=['location'], name='device_location_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.ip_address})"
 
@@ -36,27 +43,85 @@ class DiagnosticReport(models.Model):
 class DiagnosticResult(models.Model):
     """
     Vulnerability B: Deserialization Bug
-    Uses pickle for serialization - DANGEROUS!
+    Rows tagged 'pickle' are loaded with pickle - DANGEROUS!
+    Everything else goes through msgpack/CBOR/JSON, see core/payloads.py
     """
     # Establishing a connection to DiagnosticReport 
     report = models.ForeignKey(DiagnosticReport, on_delete=models.CASCADE, related_name='results')
-    serialized_data = models.TextField(help_text='Base64-encoded pickle data')
+    data = models.BinaryField(null=True, help_text='Serialized payload, raw bytes')
+    data_format = models.CharField(max_length=16, default='pickle',
+                                   help_text="Codec of data, e.g. 'msgpack+zstd' or 'pickle'")
     created_at = models.DateTimeField(auto_now_add=True)
 
-    def set_data(self, data_dict):
-        """Serialize data using pickle (VULNERABLE)"""
-        pickled = pickle.dumps(data_dict)
-        self.serialized_data = base64.b64encode(pickled).decode('utf-8')
+    def set_data(self, data_dict, fmt=None):
+        """Serialize with DIAGNOSTIC_DATA_FORMAT (or `fmt`), the tag is stored with it"""
+        self.data_format, self.data = payloads.encode(data_dict, fmt)
 
     def get_data(self):
         """
-        VULNERABLE: Deserialize using pickle
-        Corrupted/malicious payload can crash or execute code!
+        Decode with the format the row was written in.
+        VULNERABLE: a 'pickle' row goes straight to pickle.loads,
+        a corrupted/malicious payload can crash or execute code!
         """
-        if not self.serialized_data:
+        if not self.data:
             return None
         try:
-            decoded = base64.b64decode(self.serialized_data)
-            return pickle.loads(decoded)  # VULNERABLE!
+            return payloads.decode(self.data_format, self.data)  # VULNERABLE for 'pickle'!
         except Exception as e:
-            return str(e)
\ No newline at end of file
+            return str(e)
+
+# 5. Telemetry (process values per device, see core/telemetry.py)
+class TelemetryChunk(models.Model):
+    """
+    The samples of one device and metric from one flush, packed: `times` is
+    uint32 milliseconds since `start`, `values` float32, both little-endian.
+    One row per flush instead of one per sample.
+    """
+    # No index of its own on device: the one below starts with it
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='telemetry_chunks', db_index=False)
+    metric = models.CharField(max_length=50)  # e.g. 'pressure', 'temperature', 'valve_position'
+    start = models.DateTimeField()  # first sample
+    end = models.DateTimeField()    # last sample
+    count = models.PositiveIntegerField()
+    times = models.BinaryField()
+    values = models.BinaryField()
+
+    class Meta:
+        # Range queries: one device and metric, by time
+        indexes = [models.Index(fields=['device', 'metric', 'start'], name='telemetry_chunk_idx')]
+
+
+class TelemetryRollup(models.Model):
+    """count / sum / min / max of one device and metric per minute or hour, for long ranges."""
+    RESOLUTIONS = [('minute', 'Minute'), ('hour', 'Hour')]
+
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='telemetry_rollups', db_index=False)
+    metric = models.CharField(max_length=50)
+    bucket = models.DateTimeField()  # start of the minute / hour, UTC
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index of the range queries (same column order)
+            models.UniqueConstraint(fields=['device', 'metric', 'resolution', 'bucket'], name='telemetry_rollup_uniq'),
+        ]
+        indexes = [models.Index(fields=['resolution', 'bucket'], name='telemetry_rollup_bucket_idx')]  # retention
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+
+class TelemetryLatest(models.Model):
+    """The newest sample of every device and metric, so the dashboards never read history."""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='telemetry_latest', db_index=False)
+    metric = models.CharField(max_length=50)
+    value = models.FloatField()
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['device', 'metric'], name='telemetry_latest_uniq')]
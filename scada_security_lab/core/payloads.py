@@ -0,0 +1,91 @@
+import json
+import pickle
+import zlib
+from django.conf import settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codecs for DiagnosticResult payloads.
+#
+# A row stores raw bytes plus a format tag: '<serializer>' or
+# '<serializer>+<compressor>', e.g. 'msgpack', 'msgpack+zstd', 'pickle'.
+# The tag is per row, so rows written with different settings (or before
+# the switch away from pickle) can all be read back.
+#
+# msgpack, cbor2 and zstandard are optional: formats whose library is not
+# installed are just not offered. pickle stays for the vulnerable demo and
+# for old rows; it runs code on load, never decode it from untrusted input.
+
+SERIALIZERS = {
+    'pickle': (pickle.dumps, pickle.loads),
+    'json': (lambda data: json.dumps(data, separators=(',', ':')).encode(), json.loads),
+}
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = (
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda blob: msgpack.unpackb(blob, raw=False, strict_map_key=False),
+    )
+if cbor2 is not None:
+    SERIALIZERS['cbor'] = (cbor2.dumps, cbor2.loads)
+
+COMPRESSORS = {
+    'zlib': (zlib.compress, zlib.decompress),
+}
+if zstandard is not None:
+    # The module level functions make a fresh (de)compressor per call: safe across threads
+    COMPRESSORS['zstd'] = (zstandard.compress, zstandard.decompress)
+
+# Picked when DIAGNOSTIC_DATA_FORMAT is not set: the first one installed
+PREFERRED_FORMATS = ['msgpack+zstd', 'cbor+zstd', 'msgpack+zlib', 'json+zlib']
+
+
+def available_formats():
+    """Every format that can be written here, plain and compressed."""
+    return list(SERIALIZERS) + [f"{name}+{comp}" for name in SERIALIZERS for comp in COMPRESSORS]
+
+
+def default_format():
+    configured = getattr(settings, 'DIAGNOSTIC_DATA_FORMAT', None)
+    if configured:
+        return configured
+    return next(fmt for fmt in PREFERRED_FORMATS if fmt in available_formats())
+
+
+def split_format(fmt):
+    name, _, compressor = fmt.partition('+')
+    if name not in SERIALIZERS or (compressor and compressor not in COMPRESSORS):
+        raise ValueError(f"Data format '{fmt}' is unknown or its library is not installed")
+    return name, compressor
+
+
+def encode(data, fmt=None):
+    """
+    Serialize `data` with `fmt` (default_format() if None). Returns
+    (tag, bytes). The compressor is skipped for payloads smaller than
+    DIAGNOSTIC_COMPRESS_MIN_BYTES, the tag says what was actually done.
+    """
+    name, compressor = split_format(fmt or default_format())
+    blob = SERIALIZERS[name][0](data)
+    if compressor and len(blob) >= getattr(settings, 'DIAGNOSTIC_COMPRESS_MIN_BYTES', 512):
+        return f"{name}+{compressor}", COMPRESSORS[compressor][0](blob)
+    return name, blob
+
+
+def decode(fmt, blob):
+    name, compressor = split_format(fmt)
+    # BinaryField gives memoryview on some backends
+    blob = bytes(blob)
+    if compressor:
+        blob = COMPRESSORS[compressor][1](blob)
+    return SERIALIZERS[name][1](blob)
@@ -0,0 +1,338 @@
+import asyncio
+import math
+import resource
+import struct
+import time
+from asgiref.sync import sync_to_async
+from .models import Device
+
+# Virtual PLCs for the Device rows, all in one asyncio event loop.
+#
+# They speak a subset of Modbus/TCP: read holding / input registers (0x03,
+# 0x04), write one register (0x06) and write several (0x10). Every PLC has
+# the same 16 registers; the registers of the whole fleet live in one
+# bytearray, in Device id order. Requests are parsed where they were
+# received and answers are packed into a per-connection buffer with
+# struct, so serving a request allocates no buffers.
+#
+# Two layouts:
+#   gateway: up to `units_per_port` PLCs behind each port, addressed by the
+#            Modbus unit id 1..N, like a TCP-to-serial gateway. The unit id
+#            is one byte, so bigger fleets get more ports (base, base+1...).
+#   device:  one port per PLC (base + position), the unit id is ignored.
+#
+# The state comes from the database: Device.status and is_locked_out are
+# read again every `sync_interval` seconds. The simulator never writes
+# them back. Devices created after the start are not served.
+
+# MBAP header + function code: transaction id, protocol id (0), length of
+# what follows, unit id, function
+HEADER = struct.Struct('>HHHBB')
+ADDRESS_COUNT = struct.Struct('>HH')   # read request, write-one request, write replies
+WRITE_MULTIPLE = struct.Struct('>HHB')  # first register, count, byte count
+READ_REPLY = struct.Struct('>HHHBBB')   # header + function + byte count
+WRITE_REPLY = struct.Struct('>HHHBBHH')
+EXCEPTION_REPLY = struct.Struct('>HHHBBB')
+REGISTER = struct.Struct('>H')
+STATE = struct.Struct('>HHH')           # STATUS, LOCKOUT, RUN
+PROCESS = struct.Struct('>HHHH')        # PRESSURE, TEMPERATURE, FLOW, UPTIME
+
+READ_HOLDING, READ_INPUT, WRITE_REGISTER, WRITE_REGISTERS = 0x03, 0x04, 0x06, 0x10
+ILLEGAL_FUNCTION, ILLEGAL_ADDRESS, ILLEGAL_VALUE, DEVICE_FAILURE, TARGET_FAILED = 0x01, 0x02, 0x03, 0x04, 0x0B
+MAX_READ = 125
+MAX_ADU = 260  # largest Modbus/TCP frame
+
+# Register map (big-endian 16-bit words)
+(STATUS,        # 0 Operational, 1 Maintenance, 2 Offline, 3 anything else
+ LOCKOUT,       # 1 = Lockout/Tagout
+ RUN,           # 1 running, 0 stopped (writable)
+ SETPOINT,      # pressure setpoint, 0.1 bar (writable)
+ PRESSURE,      # 0.01 bar
+ TEMPERATURE,   # 0.1 °C
+ FLOW,          # 0.1 m³/h
+ UPTIME,        # seconds since the simulator started, wraps at 65536
+ DEVICE_ID_HIGH, DEVICE_ID_LOW) = range(10)
+REGISTERS = 16
+STRIDE = REGISTERS * 2
+STATUS_CODES = {'Operational': 0, 'Maintenance': 1, 'Offline': 2}
+OFFLINE = STATUS_CODES['Offline']
+DEFAULT_SETPOINT = 500
+
+
+class PLCSimError(ValueError):
+    pass
+
+
+def load_devices():
+    """(id, status, is_locked_out) of every Device, in id order."""
+    return list(Device.objects.order_by('id').values_list('id', 'status', 'is_locked_out'))
+
+
+def raise_fd_limit(needed):
+    """Lift the soft open-files limit towards the hard one; PLCSimError if `needed` still does not fit."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        raise PLCSimError(f"Needs {needed} open files, the limit is {soft} (ulimit -n); use the gateway layout")
+
+
+class PLCFleet:
+    """The registers of every simulated PLC, and the servers that expose them."""
+
+    def __init__(self, devices, host='127.0.0.1', port=15020, layout='gateway', units_per_port=247):
+        if layout not in ('gateway', 'device'):
+            raise PLCSimError("layout is 'gateway' or 'device'")
+        if not 1 <= units_per_port <= 247:
+            raise PLCSimError("units_per_port is 1..247 (Modbus unit ids)")
+        self.host = host
+        self.port = port
+        self.layout = layout
+        self.units_per_port = units_per_port if layout == 'gateway' else 1
+        self.ids = [device_id for device_id, _, _ in devices]
+        self.positions = {device_id: position for position, device_id in enumerate(self.ids)}
+        self.memory = bytearray(len(self.ids) * STRIDE)
+        self.view = memoryview(self.memory)
+        self.started = time.monotonic()
+        self.servers = []
+        # Counters
+        self.requests = 0
+        self.exceptions = 0
+        self.connections = 0
+
+        for position, device_id in enumerate(self.ids):
+            base = position * STRIDE
+            struct.pack_into('>HH', self.memory, base + DEVICE_ID_HIGH * 2, device_id >> 16 & 0xFFFF, device_id & 0xFFFF)
+            REGISTER.pack_into(self.memory, base + SETPOINT * 2, DEFAULT_SETPOINT)
+            # Not a state any device has, so apply() sets every one
+            STATE.pack_into(self.memory, base, 0xFFFF, 0, 0)
+        self.apply(devices)
+        self.tick()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Addresses ---
+
+    def ports(self):
+        """[(port, first position, PLC count)]"""
+        size = self.units_per_port
+        return [(self.port + number, first, min(size, len(self.ids) - first))
+                for number, first in enumerate(range(0, len(self.ids), size))]
+
+    def address(self, device_id):
+        """(port, unit id) of a device; unit id 0 in the device layout (any id is accepted)."""
+        position = self.positions[device_id]
+        if self.layout == 'device':
+            return self.port + position, 0
+        return self.port + position // self.units_per_port, position % self.units_per_port + 1
+
+    # --- State ---
+
+    def apply(self, devices):
+        """Status and lockout from (id, status, is_locked_out) rows. A PLC runs while Operational and not locked out."""
+        memory = self.memory
+        for device_id, status, locked in devices:
+            position = self.positions.get(device_id)
+            if position is None:
+                continue
+            base = position * STRIDE
+            code = STATUS_CODES.get(status, 3)
+            locked = 1 if locked else 0
+            old_code, old_locked, run = STATE.unpack_from(memory, base)
+            if (code, locked) != (old_code, old_locked):
+                # LOTO or maintenance stops the machine, release starts it again.
+                # Otherwise RUN stays what the last write made it.
+                run = 1 if code == 0 and not locked else 0
+                STATE.pack_into(memory, base, code, locked, run)
+
+    def tick(self):
+        """Move the process values of the running PLCs (a slow wave around the setpoint)."""
+        memory = self.memory
+        now = time.monotonic()
+        uptime = int(now - self.started) & 0xFFFF
+        phase = now / 20
+        sin, cos = math.sin, math.cos
+        for position in range(len(self.ids)):
+            base = position * STRIDE
+            if memory[base + RUN * 2 + 1]:
+                wave = sin(phase + position)
+                setpoint = REGISTER.unpack_from(memory, base + SETPOINT * 2)[0]
+                PROCESS.pack_into(memory, base + PRESSURE * 2, min(0xFFFF, int(setpoint * (10 + 0.2 * wave))),
+                                  int(650 + 30 * wave), int(1200 + 50 * cos(phase + position)), uptime)
+            else:
+                # Stopped: no pressure, no flow, ambient temperature
+                PROCESS.pack_into(memory, base + PRESSURE * 2, 0, 200, 0, uptime)
+
+    # --- Serving ---
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        ports = self.ports()
+        if self.layout == 'device':
+            raise_fd_limit(len(ports) + 1024)
+        for port, first, count in ports:
+            self.servers.append(await loop.create_server(
+                lambda first=first, count=count: PLCProtocol(self, first, count),
+                self.host, port, reuse_address=True, backlog=128,
+            ))
+
+    async def serve(self, sync_interval=2.0, tick=1.0):
+        """Serve until cancelled; the process values move every `tick` s, the database is read every `sync_interval` s."""
+        if not self.servers:
+            await self.start()
+        next_sync = time.monotonic() + sync_interval
+        try:
+            while True:
+                await asyncio.sleep(tick)
+                self.tick()
+                if sync_interval and time.monotonic() >= next_sync:
+                    try:
+                        self.apply(await sync_to_async(load_devices, thread_sensitive=True)())
+                    except Exception as e:
+                        print(f"!!! PLC SIM: could not read the devices: {e} !!!")
+                    next_sync = time.monotonic() + sync_interval
+        finally:
+            self.close()
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        self.servers = []
+
+
+class PLCProtocol(asyncio.BufferedProtocol):
+    """
+    One client connection. The event loop reads straight into `buffer`;
+    every complete frame in it is answered into `out`, and all the
+    answers of one read go out in one write.
+    """
+
+    def __init__(self, fleet, first, count):
+        self.fleet = fleet
+        self.first = first    # position of unit 1 (or of the one PLC)
+        self.count = count    # PLCs behind this port
+        self.gateway = fleet.layout == 'gateway'
+        self.buffer = bytearray(4096)
+        self.view = memoryview(self.buffer)
+        self.filled = 0
+        self.out = bytearray(8192)
+        self.out_view = memoryview(self.out)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.fleet.connections += 1
+
+    def connection_lost(self, exc):
+        self.fleet.connections -= 1
+        self.transport = None
+
+    def get_buffer(self, sizehint):
+        return self.view[self.filled:]
+
+    def pause_writing(self):
+        # The client does not read its answers: stop reading its requests
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+    def buffer_updated(self, nbytes):
+        self.filled += nbytes
+        buffer, end = self.buffer, self.filled
+        start = pos = 0
+        while end - start >= HEADER.size:
+            transaction_id, protocol, length, unit, function = HEADER.unpack_from(buffer, start)
+            if protocol != 0 or not 2 <= length <= MAX_ADU - 6:
+                # Not Modbus: a PLC would drop the connection too
+                self.transport.close()
+                return
+            frame_end = start + 6 + length
+            if frame_end > end:
+                break
+            if pos + MAX_ADU > len(self.out):
+                self.send(pos)
+                pos = 0
+            pos = self.answer(transaction_id, unit, function, start + HEADER.size, frame_end, pos)
+            start = frame_end
+        if pos:
+            self.send(pos)
+        if start:
+            rest = end - start
+            self.view[:rest] = self.view[start:end]
+            self.filled = rest
+
+    def send(self, pos):
+        self.transport.write(self.out_view[:pos])
+        if self.transport.get_write_buffer_size():
+            # Not all sent: the transport may keep a view of `out` (Python
+            # 3.12+ does not copy), so the next answers go to a new buffer
+            self.out = bytearray(len(self.out))
+            self.out_view = memoryview(self.out)
+
+    def answer(self, transaction_id, unit, function, data, frame_end, pos):
+        """Answer one request (its body is buffer[data:frame_end]) at out[pos:]; returns the new end of out."""
+        fleet = self.fleet
+        memory = fleet.memory
+        fleet.requests += 1
+        if self.gateway:
+            if not 1 <= unit <= self.count:
+                return self.exception(transaction_id, unit, function, TARGET_FAILED, pos)
+            base = (self.first + unit - 1) * STRIDE
+        else:
+            base = self.first * STRIDE
+        if memory[base + STATUS * 2 + 1] == OFFLINE:
+            return self.exception(transaction_id, unit, function, TARGET_FAILED, pos)
+
+        size = frame_end - data
+        if function == READ_HOLDING or function == READ_INPUT:
+            if size != 4:
+                return self.exception(transaction_id, unit, function, ILLEGAL_VALUE, pos)
+            address, count = ADDRESS_COUNT.unpack_from(self.buffer, data)
+            if not 1 <= count <= MAX_READ:
+                return self.exception(transaction_id, unit, function, ILLEGAL_VALUE, pos)
+            if address + count > REGISTERS:
+                return self.exception(transaction_id, unit, function, ILLEGAL_ADDRESS, pos)
+            nbytes = count * 2
+            READ_REPLY.pack_into(self.out, pos, transaction_id, 0, 3 + nbytes, unit, function, nbytes)
+            first = base + address * 2
+            self.out_view[pos + READ_REPLY.size:pos + READ_REPLY.size + nbytes] = fleet.view[first:first + nbytes]
+            return pos + READ_REPLY.size + nbytes
+
+        if function == WRITE_REGISTER:
+            if size != 4:
+                return self.exception(transaction_id, unit, function, ILLEGAL_VALUE, pos)
+            address, value = ADDRESS_COUNT.unpack_from(self.buffer, data)
+            count = 1
+            values = data + 2
+        elif function == WRITE_REGISTERS:
+            if size < WRITE_MULTIPLE.size:
+                return self.exception(transaction_id, unit, function, ILLEGAL_VALUE, pos)
+            address, count, nbytes = WRITE_MULTIPLE.unpack_from(self.buffer, data)
+            values = data + WRITE_MULTIPLE.size
+            if not 1 <= count <= 123 or nbytes != count * 2 or size != WRITE_MULTIPLE.size + nbytes:
+                return self.exception(transaction_id, unit, function, ILLEGAL_VALUE, pos)
+        else:
+            return self.exception(transaction_id, unit, function, ILLEGAL_FUNCTION, pos)
+
+        # Only RUN and SETPOINT can be written
+        if address < RUN or address + count > SETPOINT + 1:
+            return self.exception(transaction_id, unit, function, ILLEGAL_ADDRESS, pos)
+        if memory[base + LOCKOUT * 2 + 1]:
+            # Tagged out: the PLC refuses every command
+            return self.exception(transaction_id, unit, function, DEVICE_FAILURE, pos)
+        if address == RUN and REGISTER.unpack_from(self.buffer, values)[0] > 1:
+            return self.exception(transaction_id, unit, function, ILLEGAL_VALUE, pos)
+        first = base + address * 2
+        fleet.view[first:first + count * 2] = self.view[values:values + count * 2]
+        if function == WRITE_REGISTER:
+            count = value  # the reply echoes address and value
+        WRITE_REPLY.pack_into(self.out, pos, transaction_id, 0, 6, unit, function, address, count)
+        return pos + WRITE_REPLY.size
+
+    def exception(self, transaction_id, unit, function, code, pos):
+        self.fleet.exceptions += 1
+        EXCEPTION_REPLY.pack_into(self.out, pos, transaction_id, 0, 3, unit, function | 0x80, code)
+        return pos + EXCEPTION_REPLY.size
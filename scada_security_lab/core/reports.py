@@ -0,0 +1,175 @@
+import hashlib
+import io
+import threading
+import zipfile
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from reportlab.pdfgen import canvas
+from .models import DiagnosticReport
+
+
+def draw_report(pdf, report):
+    """One report page. Same layout the report view always had."""
+    pdf.drawString(100, 800, f"SCADA CONFIDENTIAL REPORT #{report.id}")
+    pdf.drawString(100, 780, f"Technician: {report.technician_name}")
+    pdf.drawString(100, 760, f"Data: {report.content}")
+
+
+def render_pdf(report):
+    """Render one report into memory and return the PDF bytes (no file on disk)."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    draw_report(pdf, report)
+    pdf.save()
+    return buffer.getvalue()
+
+
+def content_hash(report):
+    # Everything that ends up on the page. A report edited by another
+    # process gets a new hash, so a stale cached PDF is never served.
+    text = f"{report.id}\x00{report.technician_name}\x00{report.content}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class PDFCache:
+    """
+    Rendered PDFs keyed by (report id, content hash), least recently used
+    evicted first once the total size goes over max_bytes. Thread-safe.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (report id, hash) -> bytes
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key, pdf):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = pdf
+            self._size += len(pdf)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self, report_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == report_id]:
+                self._size -= len(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+report_cache = PDFCache(getattr(settings, 'REPORT_PDF_CACHE_BYTES', 32 * 1024 * 1024))
+
+
+def get_report_pdf(report):
+    """The report's PDF bytes, from the cache or freshly rendered. Returns (pdf, was_cached)."""
+    key = (report.id, content_hash(report))
+    pdf = report_cache.get(key)
+    if pdf is not None:
+        return pdf, True
+    pdf = render_pdf(report)
+    report_cache.put(key, pdf)
+    return pdf, False
+
+
+@receiver(post_save, sender=DiagnosticReport)
+@receiver(post_delete, sender=DiagnosticReport)
+def drop_cached_pdf(sender, instance, **kwargs):
+    # Frees the memory right away; the content hash already keeps other
+    # processes from serving the old version.
+    report_cache.invalidate(instance.id)
+
+
+# --- Bulk export ---
+
+class ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file that hands out whatever was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(reports):
+    """
+    Yield a ZIP archive of report PDFs chunk by chunk. One PDF is in memory
+    at a time: each is written, flushed to the client, then dropped.
+    The sink is not seekable, so zipfile writes sizes after each entry
+    (data descriptors) instead of going back to patch the headers.
+    """
+    sink = ChunkSink()
+    # PDFs are already compressed, deflating them again buys nothing
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for report in reports:
+            pdf, _ = get_report_pdf(report)
+            archive.writestr(f"report_{report.id}.pdf", pdf)
+            yield sink.take()
+    yield sink.take()  # central directory
+
+
+def stream_multipage_pdf(reports, chunk_size=64 * 1024):
+    """
+    One PDF with a page per report. reportlab only writes the file on save(),
+    so the page contents (a few hundred bytes each, not rendered PDFs) are
+    kept until then; the finished bytes are sent in chunks.
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for report in reports:
+        draw_report(pdf, report)
+        pdf.showPage()
+    pdf.save()
+    data = buffer.getbuffer()
+    for start in range(0, len(data), chunk_size):
+        yield bytes(data[start:start + chunk_size])
+
+
+async def async_chunks(chunks):
+    # Under ASGI Django would list() a sync iterator before sending it, the
+    # whole archive in memory. Pull one chunk at a time in a thread instead.
+    iterator = iter(chunks)
+    done = object()
+    while True:
+        chunk = await sync_to_async(next, thread_sensitive=True)(iterator, done)
+        if chunk is done:
+            return
+        yield chunk
@@ -0,0 +1,173 @@
+import base64
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+# The archive keeps the payload text, not just the AttackPayload id
+ATTACKLOG_ARCHIVE_FIELDS = ('id', 'timestamp', 'last_seen', 'count', 'ip_address', 'endpoint', 'attack_type',
+                            'payload__text')
+
+# Used when settings.RETENTION_POLICIES is not set.
+# 'days': rows older than this are archived then deleted
+# 'field': the timestamp column the age is measured on
+# 'filter': optional extra filter, e.g. only the fine-grained rollups
+# 'archive_fields': optional, what goes into the archive (default: every column)
+DEFAULT_POLICIES = {
+    'monitoring.AttackLog': {'days': 30, 'field': 'timestamp', 'archive_fields': ATTACKLOG_ARCHIVE_FIELDS},
+    # Payloads no row points to any more (after AttackLog, which frees them)
+    'monitoring.AttackPayload': {'days': 30, 'field': 'first_seen', 'filter': {'logs__isnull': True}},
+    'monitoring.AttackRollup': {'days': 7, 'field': 'bucket', 'filter': {'resolution': 'minute'}},
+    'core.MaintenanceLog': {'days': 365, 'field': 'timestamp'},
+    'core.TelemetryChunk': {'days': 7, 'field': 'end'},
+    'core.TelemetryRollup': {'days': 30, 'field': 'bucket', 'filter': {'resolution': 'minute'}},
+}
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    # Packed telemetry samples (BinaryField) go into the archive as base64
+    def default(self, o):
+        if isinstance(o, (bytes, memoryview)):
+            return base64.b64encode(o).decode('ascii')
+        return super().default(o)
+
+
+def archive_path(archive_dir, label, started):
+    folder = Path(archive_dir) / label.replace('.', '_').lower()
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder / f"{started:%Y%m%dT%H%M%S}.jsonl.gz"
+
+
+def expire_model(label, policy, archive_dir, chunk_size=5000, pause=0.05, archive=True, dry_run=False, log=print):
+    """
+    Archive + delete the expired rows of one model, chunk by chunk.
+
+    For every chunk: read it, append it to a gzip JSONL file, fsync, and only
+    then delete exactly those primary keys in a short transaction. A crash
+    between the two steps leaves the rows in the database (they get archived
+    again next run), never deleted without an archive copy.
+    """
+    model = apps.get_model(label)
+    alias = router.db_for_write(model)
+    cutoff = timezone.now() - timedelta(days=policy['days'])
+    expired = model.objects.using(alias).filter(
+        **{f"{policy['field']}__lt": cutoff}, **policy.get('filter', {})
+    ).order_by('pk')
+
+    result = {'model': label, 'cutoff': cutoff.isoformat(), 'archived': 0, 'deleted': 0, 'archive_bytes': 0, 'archive_file': None}
+    if dry_run:
+        result['archived'] = expired.count()
+        return result
+
+    pk_name = model._meta.pk.attname
+    path = archive_path(archive_dir, label, timezone.now()) if archive else None
+    raw_file = open(path, 'ab') if archive else None
+    archive_file = gzip.GzipFile(fileobj=raw_file, mode='ab') if archive else None
+    try:
+        while True:
+            rows = list(expired.values(*policy.get('archive_fields', ()))[:chunk_size])
+            if not rows:
+                break
+            if archive_file:
+                lines = ''.join(json.dumps(row, cls=ArchiveEncoder) + '\n' for row in rows)
+                archive_file.write(lines.encode('utf-8'))
+                archive_file.flush()
+                raw_file.flush()
+                os.fsync(raw_file.fileno())
+                result['archived'] += len(rows)
+            with transaction.atomic(using=alias):
+                # Filtered again: a row that stopped matching since (an unused
+                # payload that got a new hit) stays
+                deleted, _ = expired.filter(pk__in=[row[pk_name] for row in rows]).delete()
+            result['deleted'] += deleted
+            log(f"  {label}: {result['deleted']} rows removed so far")
+            # Small transactions + a short pause: live writes get the lock in between
+            time.sleep(pause)
+    finally:
+        if archive_file:
+            archive_file.close()
+            raw_file.close()
+
+    if path is not None:
+        if result['archived']:
+            result['archive_file'] = str(path)
+            result['archive_bytes'] = path.stat().st_size
+        else:
+            path.unlink(missing_ok=True)
+    return result
+
+
+def database_size(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA page_count')
+            pages = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return pages * cursor.fetchone()[0]
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_database_size(current_database())')
+            return cursor.fetchone()[0]
+    return None
+
+
+def compact(alias, full_vacuum=False, log=print):
+    """
+    ANALYZE (refresh planner statistics) and VACUUM the database.
+    On SQLite, VACUUM rewrites the whole file, so it only runs when at least
+    10% of the pages are free (or full_vacuum=True).
+    Returns the bytes reclaimed (None if the backend cannot tell).
+    """
+    connection = connections[alias]
+    before = database_size(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('ANALYZE')
+            cursor.execute('PRAGMA freelist_count')
+            free_pages = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_count')
+            total_pages = cursor.fetchone()[0] or 1
+            if full_vacuum or free_pages / total_pages >= 0.10:
+                log(f"  VACUUM {alias} ({free_pages} free pages of {total_pages})")
+                cursor.execute('VACUUM')
+        elif connection.vendor == 'postgresql':
+            # Plain VACUUM marks space reusable without locking out writers
+            cursor.execute('VACUUM FULL ANALYZE' if full_vacuum else 'VACUUM ANALYZE')
+    after = database_size(connection)
+    if before is None or after is None:
+        return None
+    return max(0, before - after)
+
+
+def enforce_retention(policies=None, archive=True, vacuum=True, full_vacuum=False, dry_run=False, log=print):
+    """Apply every retention policy, then compact the databases that were touched."""
+    policies = policies if policies is not None else getattr(settings, 'RETENTION_POLICIES', DEFAULT_POLICIES)
+    archive_dir = getattr(settings, 'RETENTION_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive')
+    chunk_size = getattr(settings, 'RETENTION_CHUNK_SIZE', 5000)
+
+    started = time.perf_counter()
+    report = {'models': [], 'rows_archived': 0, 'rows_deleted': 0, 'archive_bytes': 0, 'bytes_reclaimed': 0}
+    touched = set()
+    for label, policy in policies.items():
+        result = expire_model(label, policy, archive_dir, chunk_size=chunk_size,
+                              archive=archive, dry_run=dry_run, log=log)
+        report['models'].append(result)
+        report['rows_archived'] += result['archived']
+        report['rows_deleted'] += result['deleted']
+        report['archive_bytes'] += result['archive_bytes']
+        if result['deleted']:
+            touched.add(router.db_for_write(apps.get_model(label)))
+
+    if vacuum and not dry_run:
+        for alias in sorted(touched) if not full_vacuum else sorted(connections):
+            reclaimed = compact(alias, full_vacuum=full_vacuum, log=log)
+            report['bytes_reclaimed'] += reclaimed or 0
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
@@ -0,0 +1,298 @@
+import math
+import re
+from django.conf import settings
+from django.db import connections, router
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Q
+from .models import DiagnosticReport, MaintenanceLog
+
+# Full-text search over the diagnostic reports and the maintenance log.
+#
+# SQLite: one FTS5 table per model. It indexes the text columns without
+# keeping a second copy of them (content=<the model's table>) and triggers
+# keep it in step with every INSERT, UPDATE and DELETE. Triggers, not
+# signals: populate_db's raw INSERTs, bulk_create() (device toggles) and
+# QuerySet.delete() (retention) send none.
+# PostgreSQL: a GIN index on the tsvector of the same columns. Postgres
+# updates it on every write, nothing else to keep in sync.
+# Any other backend falls back to icontains scans.
+
+# kind: (model, indexed columns with their weight, other columns in the results)
+INDEXES = {
+    'reports': (DiagnosticReport, (('technician_name', 'A'), ('content', 'B')), ('file_path', 'created_at')),
+    'logs': (MaintenanceLog, (('action', 'A'), ('technician_name', 'B')), ('device_id', 'timestamp')),
+}
+# bm25() column weights on SQLite, the same ratio as ts_rank's defaults for A and B
+BM25_WEIGHTS = {'A': 2.5, 'B': 1.0}
+SNIPPET_WORDS = 16
+WORD_RE = re.compile(r'\w+')
+
+
+class SearchError(ValueError):
+    pass
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def backend(connection):
+    return {'sqlite': 'fts5', 'postgresql': 'tsvector'}.get(connection.vendor, 'scan')
+
+
+def search_terms(text):
+    """
+    The words of a search box, AND-ed together, and whether the last one is a
+    prefix ('valve pass*'). Everything else in the text is ignored, so nothing
+    typed reaches the FTS5 / tsquery syntax.
+    """
+    terms = WORD_RE.findall((text or '').lower())[:setting('SEARCH_MAX_TERMS', 8)]
+    if not terms:
+        raise SearchError("Give at least one word to search for")
+    return terms, text.rstrip().endswith('*')
+
+
+def postgres_config():
+    config = setting('SEARCH_POSTGRES_CONFIG', 'english')
+    if not WORD_RE.fullmatch(config):
+        raise SearchError(f"Bad SEARCH_POSTGRES_CONFIG: {config!r}")
+    return config
+
+
+def fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+def tsvector_sql(connection, columns):
+    # Must be the exact expression of the GIN index, or Postgres will not use it
+    config = postgres_config()
+    return ' || '.join(
+        f"setweight(to_tsvector('{config}', coalesce({connection.ops.quote_name(column)}, '')), '{weight}')"
+        for column, weight in columns
+    )
+
+
+def schema_sql(connection, kind):
+    """CREATE statements for one kind (all IF NOT EXISTS, safe to run again)."""
+    model, columns, _ = INDEXES[kind]
+    quote = connection.ops.quote_name
+    table, fts = quote(model._meta.db_table), quote(fts_table(model))
+    names = [column for column, _ in columns]
+    if backend(connection) == 'fts5':
+        listed = ', '.join(quote(name) for name in names)
+        new = ', '.join(f"new.{quote(name)}" for name in names)
+        old = ', '.join(f"old.{quote(name)}" for name in names)
+        # The 'delete' command needs the values that were indexed, hence old.*
+        delete = f"INSERT INTO {fts} ({fts}, rowid, {listed}) VALUES ('delete', old.id, {old});"
+        insert = f"INSERT INTO {fts} (rowid, {listed}) VALUES (new.id, {new});"
+        trigger = quote(fts_table(model) + '_%s')
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({listed}, content={table}, content_rowid='id', "
+            f"tokenize='porter unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS {trigger % 'insert'} AFTER INSERT ON {table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {trigger % 'delete'} AFTER DELETE ON {table} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {trigger % 'update'} AFTER UPDATE OF {listed} ON {table} "
+            f"BEGIN {delete} {insert} END",
+        ]
+    if backend(connection) == 'tsvector':
+        return [f"CREATE INDEX IF NOT EXISTS {quote(model._meta.db_table + '_search')} ON {table} "
+                f"USING GIN (({tsvector_sql(connection, columns)}))"]
+    return []
+
+
+def drop_sql(connection, kind):
+    model = INDEXES[kind][0]
+    quote = connection.ops.quote_name
+    if backend(connection) == 'fts5':
+        return [f"DROP TRIGGER IF EXISTS {quote(fts_table(model) + '_' + name)}" for name in ('insert', 'delete', 'update')] \
+            + [f"DROP TABLE IF EXISTS {quote(fts_table(model))}"]
+    if backend(connection) == 'tsvector':
+        return [f"DROP INDEX IF EXISTS {quote(model._meta.db_table + '_search')}"]
+    return []
+
+
+def install(using=None, kinds=None):
+    """Create whatever is missing of the search indexes. Returns the backend."""
+    connection = connections[using or router.db_for_write(DiagnosticReport)]
+    with connection.cursor() as cursor:
+        for kind in kinds or INDEXES:
+            for sql in schema_sql(connection, kind):
+                cursor.execute(sql)
+    return backend(connection)
+
+
+def uninstall(using=None, kinds=None):
+    connection = connections[using or router.db_for_write(DiagnosticReport)]
+    with connection.cursor() as cursor:
+        for kind in kinds or INDEXES:
+            for sql in drop_sql(connection, kind):
+                cursor.execute(sql)
+
+
+def reinstall_after_migrate(using, **kwargs):
+    # post_migrate. SQLite alters a table by copying it into a new one and
+    # dropping the old one, and the triggers go with it: any later migration
+    # of these two models would stop the index from following writes.
+    connection = connections[using]
+    if backend(connection) != 'fts5' or not router.allow_migrate(using, 'core'):
+        return
+    if ('core', '0006_search_index') in MigrationRecorder(connection).applied_migrations():
+        install(using)
+
+
+def rebuild(kind, using=None, drop=False):
+    """
+    Re-index one kind from its table (after a restore, or to get rid of a
+    damaged index). drop=True also recreates the index and its triggers.
+    """
+    model = INDEXES[kind][0]
+    connection = connections[using or router.db_for_write(model)]
+    if drop:
+        uninstall(connection.alias, [kind])
+    install(connection.alias, [kind])
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if backend(connection) == 'fts5':
+            fts = quote(fts_table(model))
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            # Merge the b-tree segments the rebuild left behind into one
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+        elif backend(connection) == 'tsvector' and not drop:
+            cursor.execute(f"REINDEX INDEX {quote(model._meta.db_table + '_search')}")
+    return model.objects.using(connection.alias).count()
+
+
+def make_snippet(texts, terms):
+    """About SNIPPET_WORDS words around the first match, matching words in [brackets]."""
+    prefixes = tuple(terms)
+    for text in texts:
+        text = text or ''
+        words = list(WORD_RE.finditer(text))
+        hits = [number for number, word in enumerate(words) if word.group().lower().startswith(prefixes)]
+        if hits:
+            break
+    else:
+        # Matched through stemming only ('ran' for 'running'): the beginning
+        return ' '.join(text or '' for text in texts)[:SNIPPET_WORDS * 8]
+    first = max(0, hits[0] - SNIPPET_WORDS // 4)
+    window = words[first:first + SNIPPET_WORDS]
+    parts = ['...'] if first else []
+    position = window[0].start() if first else 0
+    for word in window:
+        parts.append(text[position:word.start()])
+        parts.append(f"[{word.group()}]" if word.group().lower().startswith(prefixes) else word.group())
+        position = word.end()
+    parts.append('...' if first + SNIPPET_WORDS < len(words) else text[position:])
+    return ''.join(parts)
+
+
+def search(kind, text, page=1, per_page=None, using=None, method=None):
+    """
+    Ranked search. Returns {'backend', 'terms', 'total', 'more', 'ranked', 'page', 'pages', 'results'},
+    results being dicts of id, the indexed and extra columns, 'snippet' and 'rank'
+    (higher is better). method='scan' forces the icontains fallback.
+
+    Ranking reads every match, so a query that matches more than
+    SEARCH_RANK_LIMIT rows (a word in half the reports) is not ranked: it
+    gets the newest matches first, total stops at the limit and more=True.
+    """
+    if kind not in INDEXES:
+        raise SearchError(f"kind is one of {', '.join(INDEXES)}")
+    model, columns, extra = INDEXES[kind]
+    connection = connections[using or router.db_for_read(model)]
+    method = method or backend(connection)
+    terms, prefix = search_terms(text)
+    per_page = per_page or setting('SEARCH_PAGE_SIZE', 20)
+    page = max(1, page)
+    offset = (page - 1) * per_page
+
+    if method == 'scan':
+        total, more, hits = scan(model, columns, terms, connection.alias, offset, per_page)
+    else:
+        find = fts5_search if method == 'fts5' else tsvector_search
+        total, more, hits = find(connection, model, columns, terms, prefix, offset, per_page,
+                                 setting('SEARCH_RANK_LIMIT', 10000))
+
+    # The ids and ranks come from the index, the rows from the table. The
+    # snippets are made here, from the page's rows: in the ranking query
+    # they would be made for every match before the sort.
+    names = [column for column, _ in columns]
+    rows = model.objects.using(connection.alias).in_bulk([row_id for row_id, _ in hits])
+    results = []
+    for row_id, rank in hits:
+        row = rows.get(row_id)
+        if row is None:
+            continue  # deleted in between
+        result = {'id': row_id, 'rank': None if rank is None else round(rank, 4)}
+        for name in names + list(extra):
+            result[name] = getattr(row, name)
+        result['snippet'] = make_snippet([result[name] for name in reversed(names)], terms)
+        if kind == 'reports':
+            # Reports can be large XML uploads: the snippet, not the whole content
+            result['content'] = result['content'][:200]
+        results.append(result)
+    return {'backend': method, 'terms': terms, 'total': total, 'more': more, 'ranked': method != 'scan' and not more,
+            'page': page, 'pages': math.ceil(total / per_page), 'results': results}
+
+
+def fts5_search(connection, model, columns, terms, prefix, offset, limit, rank_limit):
+    fts = connection.ops.quote_name(fts_table(model))
+    # No prefix index: a prefix of a common word merges its whole doclist
+    # (tens of ms), a word alone is read lazily (about 1 ms)
+    match = ' '.join(f'"{term}"' for term in terms) + ('*' if prefix else '')
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM (SELECT 1 FROM {fts} WHERE {fts} MATCH %s LIMIT %s)", [match, rank_limit + 1])
+        total = cursor.fetchone()[0]
+        if total > rank_limit:
+            # FTS5 reads the matches in rowid order: newest first needs no sort
+            cursor.execute(f"SELECT rowid, NULL FROM {fts} WHERE {fts} MATCH %s ORDER BY rowid DESC LIMIT %s OFFSET %s",
+                           [match, limit, offset])
+            return rank_limit, True, cursor.fetchall()
+        # bm25() is lower for better matches
+        weights = ', '.join(str(BM25_WEIGHTS[weight]) for _, weight in columns)
+        cursor.execute(f"SELECT rowid, bm25({fts}, {weights}) AS score FROM {fts} WHERE {fts} MATCH %s "
+                       f"ORDER BY score, rowid DESC LIMIT %s OFFSET %s", [match, limit, offset])
+        return total, False, [(row_id, -score) for row_id, score in cursor.fetchall()]
+
+
+def tsvector_search(connection, model, columns, terms, prefix, offset, limit, rank_limit):
+    config = postgres_config()
+    vector = tsvector_sql(connection, columns)
+    query = ' & '.join(terms) + (':*' if prefix else '')
+    matches = f"FROM {connection.ops.quote_name(model._meta.db_table)}, to_tsquery('{config}', %s) AS q WHERE ({vector}) @@ q"
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM (SELECT 1 {matches} LIMIT %s) AS found", [query, rank_limit + 1])
+        total = cursor.fetchone()[0]
+        if total > rank_limit:
+            cursor.execute(f"SELECT id, NULL {matches} ORDER BY id DESC LIMIT %s OFFSET %s", [query, limit, offset])
+            return rank_limit, True, cursor.fetchall()
+        cursor.execute(f"SELECT id, ts_rank({vector}, q) AS rank {matches} ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s",
+                       [query, limit, offset])
+        return total, False, cursor.fetchall()
+
+
+def scan(model, columns, terms, alias, offset, limit):
+    """icontains on every column, every term: a full table scan, newest first, no ranking."""
+    condition = Q()
+    for term in terms:
+        either = Q()
+        for column, _ in columns:
+            either |= Q(**{f"{column}__icontains": term})
+        condition &= either
+    rows = model.objects.using(alias).filter(condition)
+    hits = [(row_id, None) for row_id in rows.order_by('-id').values_list('id', flat=True)[offset:offset + limit]]
+    return rows.count(), False, hits
+
+
+def parse_search_request(request, max_per_page=None):
+    """search() arguments from a GET: ?q=valve+test[&kind=reports|logs][&page=2][&per_page=20]"""
+    try:
+        page = int(request.GET.get('page', 1))
+        per_page = int(request.GET.get('per_page') or setting('SEARCH_PAGE_SIZE', 20))
+    except ValueError:
+        raise SearchError("page and per_page are numbers")
+    if page < 1 or per_page < 1:
+        raise SearchError("page and per_page start at 1")
+    if max_per_page is not None:
+        per_page = min(per_page, max_per_page)
+    return {'kind': request.GET.get('kind', 'reports'), 'text': request.GET.get('q', ''), 'page': page, 'per_page': per_page}
@@ -0,0 +1,499 @@
+import atexit
+import bisect
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connections, router, transaction
+from .devices import chunks
+from .models import Device, TelemetryChunk, TelemetryLatest, TelemetryRollup
+
+# Device telemetry: process values (pressure, temperature, valve position...)
+# sampled per device.
+#
+# Samples are not written one row each. Every (device, metric) series has a
+# ring buffer in memory, two flat arrays (float64 times, float32 values)
+# that grow from a few samples up to `capacity` and overwrite the oldest
+# samples once full. A background thread drains all buffers every
+# `flush_interval` seconds and writes, in one transaction:
+#   - one TelemetryChunk per series: the samples packed as bytes
+#   - TelemetryRollup count/sum/min/max per minute and hour, for long ranges
+#   - TelemetryLatest, the newest value per series, for the dashboards
+# One buffer per process (get_telemetry()), like the AttackLog writer.
+
+METRIC_RE = re.compile(r'^[a-z][a-z0-9_.]{0,49}$')
+RESOLUTIONS = ('minute', 'hour')
+BUCKET_SECONDS = {'minute': 60, 'hour': 3600}
+# The chunk arrays are stored little-endian whatever the machine
+SWAP_BYTES = sys.byteorder != 'little'
+
+
+class TelemetryError(ValueError):
+    pass
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def to_datetime(seconds):
+    return datetime.fromtimestamp(seconds, dt_timezone.utc)
+
+
+class RingBuffer:
+    __slots__ = ('times', 'values', 'head', 'size', 'max_capacity', 'ordered', 'last_time')
+
+    def __init__(self, max_capacity, capacity=64):
+        capacity = min(capacity, max_capacity)
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('f', bytes(4 * capacity))
+        self.head = 0
+        self.size = 0
+        self.max_capacity = max_capacity
+        self.ordered = True  # times never went backwards since the last drain
+        self.last_time = -math.inf
+
+    def push(self, times, values):
+        """Append samples (arrays 'd' and 'f' of the same length). Returns how many old ones were overwritten."""
+        n = len(times)
+        if not n:
+            return 0
+        dropped = 0
+        if n > self.max_capacity:
+            dropped = n - self.max_capacity
+            times, values = times[dropped:], values[dropped:]
+            n = self.max_capacity
+        if self.size + n > len(self.times) and len(self.times) < self.max_capacity:
+            self._grow(self.size + n)
+        capacity = len(self.times)
+        overflow = self.size + n - capacity
+        if overflow > 0:
+            # Full: the oldest samples make room
+            self.head = (self.head + overflow) % capacity
+            self.size -= overflow
+            dropped += overflow
+
+        if times[0] < self.last_time or any(map(float.__gt__, times, times[1:])):
+            self.ordered = False
+        self.last_time = max(self.last_time, times[-1])
+
+        end = (self.head + self.size) % capacity
+        first = min(n, capacity - end)
+        self.times[end:end + first] = times[:first]
+        self.values[end:end + first] = values[:first]
+        if first < n:
+            self.times[:n - first] = times[first:]
+            self.values[:n - first] = values[first:]
+        self.size += n
+        return dropped
+
+    def _grow(self, needed):
+        capacity = len(self.times)
+        while capacity < needed and capacity < self.max_capacity:
+            capacity *= 2
+        times, values = self._ordered_copy()
+        self.times = times + array('d', bytes(8 * (min(capacity, self.max_capacity) - len(times))))
+        self.values = values + array('f', bytes(4 * (len(self.times) - len(values))))
+        self.head = 0
+
+    def _ordered_copy(self):
+        end = self.head + self.size
+        capacity = len(self.times)
+        if end <= capacity:
+            return self.times[self.head:end], self.values[self.head:end]
+        return (self.times[self.head:] + self.times[:end - capacity],
+                self.values[self.head:] + self.values[:end - capacity])
+
+    def drain(self):
+        """(times, values, ordered) of everything buffered, and empty the buffer."""
+        times, values = self._ordered_copy()
+        ordered = self.ordered
+        self.head = self.size = 0
+        self.ordered = True
+        self.last_time = -math.inf
+        return times, values, ordered
+
+
+class TelemetryBuffer:
+    """
+    Ring buffers of every series this process receives, and the thread that
+    flushes them. record() only copies into the buffer; the database is
+    written by flush(), on the flusher thread (or when called directly).
+    """
+
+    def __init__(self, capacity=4096, flush_interval=1.0, max_series=100000):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_series = max_series
+        self.series = {}  # (device id, metric) -> RingBuffer
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        # Counters (samples)
+        self.received = 0
+        self.flushed = 0
+        self.dropped = 0  # overwritten in a full buffer
+        self.failed = 0   # lost in a failed write
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    # --- Internal API ---
+
+    def record(self, device_id, metric, values, times=None):
+        """
+        Buffer samples of one series. `values` and `times` (seconds since the
+        epoch, default: now) are sequences of numbers; arrays 'f' / 'd' are
+        taken as they are. Nothing is validated here, see parse_ingest_request().
+        """
+        if not isinstance(values, array) or values.typecode != 'f':
+            values = array('f', values)
+        if times is None:
+            times = array('d', [time.time()]) * len(values)
+        elif not isinstance(times, array) or times.typecode != 'd':
+            times = array('d', times)
+        if len(times) != len(values):
+            raise TelemetryError("times and values differ in length")
+        self._ensure_started()
+        key = (device_id, metric)
+        with self.lock:
+            buffer = self.series.get(key)
+            if buffer is None:
+                if len(self.series) >= self.max_series:
+                    raise TelemetryError(f"More than {self.max_series} series at once")
+                buffer = self.series[key] = RingBuffer(self.capacity)
+            self.dropped += buffer.push(times, values)
+            self.received += len(values)
+        return len(values)
+
+    def record_many(self, batches):
+        """record() for every (device id, metric, times, values) in `batches`. Returns the sample count."""
+        return sum(self.record(device_id, metric, values, times) for device_id, metric, times, values in batches)
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of samples written."""
+        with self.flush_lock:
+            drained = []
+            with self.lock:
+                for key, buffer in list(self.series.items()):
+                    if buffer.size:
+                        drained.append((key, buffer.drain()))
+                    else:
+                        del self.series[key]  # quiet for a whole interval: give the memory back
+            if not drained:
+                return 0
+            samples = sum(len(times) for _, (times, _, _) in drained)
+            try:
+                write_samples(drained)
+            except Exception as e:
+                # Never let a DB error kill the flusher. The samples are lost, count them.
+                with self.lock:
+                    self.failed += samples
+                print(f"!!! TELEMETRY: failed to write {samples} samples: {e} !!!")
+                connections[router.db_for_write(TelemetryChunk)].close()
+                return 0
+            with self.lock:
+                self.flushed += samples
+            return samples
+
+    def stats(self):
+        with self.lock:
+            return {
+                'series': len(self.series),
+                'buffered': sum(buffer.size for buffer in self.series.values()),
+                'received': self.received,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+    # --- Flusher thread ---
+
+    def _ensure_started(self):
+        # Same as the AttackLog writer: a forked worker starts its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self.lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='telemetry-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+        finally:
+            self.flush()
+            # This thread owns its own DB connection, close it on the way out.
+            connections[router.db_for_write(TelemetryChunk)].close()
+
+    def close(self, timeout=10.0):
+        """Stop the flusher after a last flush."""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+# --- Writing ---
+
+def roll_up(rollups, device_id, metric, times, values):
+    """Add one series' samples (sorted by time) to {(device, metric, resolution, bucket): [count, sum, min, max]}."""
+    n = len(times)
+    i = 0
+    while i < n:
+        bucket = times[i] // 60 * 60
+        j = bisect.bisect_left(times, bucket + 60, i)
+        part = values[i:j]
+        minute = (j - i, math.fsum(part), min(part), max(part))
+        for resolution in RESOLUTIONS:
+            size = BUCKET_SECONDS[resolution]
+            key = (device_id, metric, resolution, bucket // size * size)
+            entry = rollups.get(key)
+            if entry is None:
+                rollups[key] = list(minute)
+            else:
+                entry[0] += minute[0]
+                entry[1] += minute[1]
+                entry[2] = min(entry[2], minute[2])
+                entry[3] = max(entry[3], minute[3])
+        i = j
+
+
+def write_samples(drained):
+    """One transaction for the chunks, rollups and latest values of drained buffers."""
+    connection = connections[router.db_for_write(TelemetryChunk)]
+    quote = connection.ops.quote_name
+    prep_time = TelemetryChunk._meta.get_field('start').get_db_prep_value
+    prep_bytes = TelemetryChunk._meta.get_field('times').get_db_prep_value
+
+    chunk_rows, latest_rows, rollups = [], [], {}
+    for (device_id, metric), (times, values, ordered) in drained:
+        if not ordered:
+            order = sorted(range(len(times)), key=times.__getitem__)
+            times = array('d', [times[i] for i in order])
+            values = array('f', [values[i] for i in order])
+        start = times[0]
+        offsets = array('I', [round((t - start) * 1000) for t in times])
+        packed = array('f', values)
+        if SWAP_BYTES:
+            offsets.byteswap()
+            packed.byteswap()
+        chunk_rows.append((device_id, metric, prep_time(to_datetime(start), connection),
+                           prep_time(to_datetime(times[-1]), connection), len(times),
+                           prep_bytes(offsets.tobytes(), connection), prep_bytes(packed.tobytes(), connection)))
+        latest_rows.append((device_id, metric, values[-1], prep_time(to_datetime(times[-1]), connection)))
+        roll_up(rollups, device_id, metric, times, values)
+
+    chunk_table = quote(TelemetryChunk._meta.db_table)
+    chunk_sql = (
+        f"INSERT INTO {chunk_table} ({quote('device_id')}, {quote('metric')}, {quote('start')}, {quote('end')}, "
+        f"{quote('count')}, {quote('times')}, {quote('values')}) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+    )
+    # Upserts, like the attack rollups (monitoring/rollups.py): one raw
+    # INSERT ... ON CONFLICT per batch, SQLite 3.24+ and PostgreSQL
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    rollup_table = quote(TelemetryRollup._meta.db_table)
+    count, total, minimum, maximum = map(quote, ('count', 'total', 'minimum', 'maximum'))
+    rollup_sql = (
+        f"INSERT INTO {rollup_table} ({quote('device_id')}, {quote('metric')}, {quote('resolution')}, {quote('bucket')}, "
+        f"{count}, {total}, {minimum}, {maximum}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT ({quote('device_id')}, {quote('metric')}, {quote('resolution')}, {quote('bucket')}) DO UPDATE SET "
+        f"{count} = {rollup_table}.{count} + excluded.{count}, {total} = {rollup_table}.{total} + excluded.{total}, "
+        f"{minimum} = {least}({rollup_table}.{minimum}, excluded.{minimum}), "
+        f"{maximum} = {greatest}({rollup_table}.{maximum}, excluded.{maximum})"
+    )
+    latest_table = quote(TelemetryLatest._meta.db_table)
+    timestamp = quote('timestamp')
+    latest_sql = (
+        f"INSERT INTO {latest_table} ({quote('device_id')}, {quote('metric')}, {quote('value')}, {timestamp}) "
+        f"VALUES (%s, %s, %s, %s) ON CONFLICT ({quote('device_id')}, {quote('metric')}) DO UPDATE SET "
+        f"{quote('value')} = excluded.{quote('value')}, {timestamp} = excluded.{timestamp} "
+        # Late samples of an older time do not replace a newer value
+        f"WHERE excluded.{timestamp} >= {latest_table}.{timestamp}"
+    )
+    rollup_rows = [
+        (device_id, metric, resolution, prep_time(to_datetime(bucket), connection), *entry)
+        for (device_id, metric, resolution, bucket), entry in rollups.items()
+    ]
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.executemany(chunk_sql, chunk_rows)
+            cursor.executemany(rollup_sql, rollup_rows)
+            cursor.executemany(latest_sql, latest_rows)
+
+
+# --- Reading ---
+
+def decode_chunk(chunk):
+    """[(seconds since the epoch, value)] of one TelemetryChunk."""
+    offsets = array('I')
+    offsets.frombytes(bytes(chunk.times))
+    values = array('f')
+    values.frombytes(bytes(chunk.values))
+    if SWAP_BYTES:
+        offsets.byteswap()
+        values.byteswap()
+    start = chunk.start.timestamp()
+    return [(start + offset / 1000, value) for offset, value in zip(offsets, values)]
+
+
+def resolution_for(window):
+    # Raw samples up to 15 minutes, minute buckets up to 6 hours (at most 360), hour buckets above
+    if window <= timedelta(minutes=15):
+        return 'raw'
+    return 'minute' if window <= timedelta(hours=6) else 'hour'
+
+
+def series(device_id, metric, since, until=None, resolution=None):
+    """
+    One series between two datetimes: (resolution, points). 'raw' points are
+    (seconds, value), rollup points (bucket seconds, average, min, max, count).
+    The cost depends on the range, not on the total history.
+    """
+    until = until or datetime.now(dt_timezone.utc)
+    resolution = resolution or resolution_for(until - since)
+    if resolution == 'raw':
+        points = []
+        # A chunk covers about one flush interval: the ones that started
+        # a little before `since` may still hold samples in range
+        chunks_in_range = TelemetryChunk.objects.filter(
+            device_id=device_id, metric=metric, start__lte=until, end__gte=since,
+        ).order_by('start').only('start', 'times', 'values')
+        low, high = since.timestamp(), until.timestamp()
+        for chunk in chunks_in_range:
+            points.extend(point for point in decode_chunk(chunk) if low <= point[0] <= high)
+        points.sort()
+        return resolution, points
+    size = BUCKET_SECONDS[resolution]
+    first_bucket = to_datetime(since.timestamp() // size * size)
+    rollups = TelemetryRollup.objects.filter(
+        device_id=device_id, metric=metric, resolution=resolution, bucket__gte=first_bucket, bucket__lte=until,
+    ).order_by('bucket').values_list('bucket', 'count', 'total', 'minimum', 'maximum')
+    return resolution, [(bucket.timestamp(), total / count, minimum, maximum, count)
+                        for bucket, count, total, minimum, maximum in rollups]
+
+
+def latest_values(device_ids=None):
+    """{device id: {metric: (value, seconds)}}, one indexed query, no history read."""
+    rows = TelemetryLatest.objects.values_list('device_id', 'metric', 'value', 'timestamp')
+    if device_ids is not None:
+        rows = rows.filter(device_id__in=device_ids)
+    latest = {}
+    for device_id, metric, value, timestamp in rows.iterator(chunk_size=5000):
+        latest.setdefault(device_id, {})[metric] = (value, timestamp.timestamp())
+    return latest
+
+
+# --- Ingestion endpoint ---
+
+def parse_ingest_request(request):
+    """
+    record_many() arguments from a POST with a JSON body:
+        {"samples": [{"device": 12, "metric": "pressure", "t": [1760000000.0, ...], "v": [3.2, ...]}, ...]}
+    `t` (seconds since the epoch) is optional, without it every value gets
+    the server time. Checked: metric names, numbers (finite, float32 range),
+    how old / how far ahead the times are, the sample count, and that every
+    device exists (a write with an unknown device would fail whole).
+    """
+    if request.content_type != 'application/json':
+        raise TelemetryError("Send the samples as application/json")
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise TelemetryError("Body is not valid JSON")
+    entries = data.get('samples') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise TelemetryError('Body must be {"samples": [...]}')
+
+    limit = setting('TELEMETRY_MAX_SAMPLES_PER_REQUEST', 50000)
+    now = time.time()
+    oldest = now - setting('TELEMETRY_MAX_AGE_SECONDS', 86400)
+    newest = now + 60  # some clock skew
+    batches = []
+    total = 0
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise TelemetryError("Every sample entry must be an object")
+        device_id, metric = entry.get('device'), entry.get('metric')
+        if not isinstance(device_id, int) or isinstance(device_id, bool):
+            raise TelemetryError("device must be a device id")
+        if not isinstance(metric, str) or not METRIC_RE.match(metric):
+            raise TelemetryError("metric must be a lowercase name like 'pressure' (letters, digits, _ and .)")
+        try:
+            values = array('f', entry.get('v') or ())
+            times = array('d', entry['t']) if entry.get('t') is not None else array('d', [now]) * len(values)
+        except (TypeError, OverflowError):
+            raise TelemetryError("v and t must be lists of numbers")
+        if len(times) != len(values):
+            raise TelemetryError(f"Device {device_id} {metric}: t and v differ in length")
+        if not values:
+            continue
+        total += len(values)
+        if total > limit:
+            raise TelemetryError(f"At most {limit} samples per request")
+        # One C-level pass: any NaN or infinity (or a number too big for
+        # float32, stored as infinity) makes the sum non-finite
+        try:
+            finite = math.isfinite(math.fsum(values))
+        except ValueError:
+            finite = False
+        if not finite:
+            raise TelemetryError(f"Device {device_id} {metric}: values must be finite numbers")
+        if min(times) < oldest or max(times) > newest:
+            raise TelemetryError(f"Device {device_id} {metric}: times out of range")
+        batches.append((device_id, metric, times, values))
+
+    wanted = {device_id for device_id, _, _, _ in batches}
+    known = set()
+    for chunk in chunks(list(wanted)):
+        known.update(Device.objects.filter(id__in=chunk).values_list('id', flat=True))
+    if wanted - known:
+        raise TelemetryError(f"Unknown device ids: {sorted(wanted - known)[:20]}")
+    return batches
+
+
+def parse_series_request(request):
+    """series() arguments from a GET: ?device=12&metric=pressure&minutes=60[&resolution=raw|minute|hour]"""
+    try:
+        device_id = int(request.GET['device'])
+        metric = request.GET['metric']
+        minutes = float(request.GET.get('minutes', 60))
+    except (KeyError, ValueError):
+        raise TelemetryError("Give device, metric and minutes (a number)")
+    if not METRIC_RE.match(metric) or not 0 < minutes <= 366 * 24 * 60:
+        raise TelemetryError("Bad metric name or minutes")
+    resolution = request.GET.get('resolution') or None
+    if resolution not in (None, 'raw') + RESOLUTIONS:
+        raise TelemetryError(f"resolution is one of raw, {', '.join(RESOLUTIONS)}")
+    since = datetime.now(dt_timezone.utc) - timedelta(minutes=minutes)
+    return {'device_id': device_id, 'metric': metric, 'since': since, 'resolution': resolution}
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Process-wide buffer, configured from the TELEMETRY_* settings."""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = TelemetryBuffer(
+                    capacity=setting('TELEMETRY_BUFFER_SAMPLES', 4096),
+                    flush_interval=setting('TELEMETRY_FLUSH_INTERVAL', 1.0),
+                    max_series=setting('TELEMETRY_MAX_SERIES', 100000),
+                )
+                # Flush on shutdown (runs before daemon threads are killed)
+                atexit.register(_telemetry.close)
+    return _telemetry
@@ -1,3 +1,204 @@
-from django.test import TestCase
+import base64
+import os
+import pickle
+from array import array
+from unittest import mock
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from . import fleet
+from . import payloads, search
+from .devices import BulkToggleError, bulk_set_status
+from .models import Device, DiagnosticReport, MaintenanceLog, TelemetryChunk, TelemetryLatest, TelemetryRollup
+from .telemetry import RingBuffer, TelemetryBuffer
 
-# Create your tests here.
+
+def samples(*times):
+    return array('d', times), array('f', [t * 10 for t in times])
+
+
+class RingBufferTests(SimpleTestCase):
+    def test_grows_up_to_max_capacity(self):
+        ring = RingBuffer(max_capacity=8, capacity=2)
+        self.assertEqual(ring.push(*samples(1, 2, 3, 4, 5)), 0)
+        self.assertEqual(len(ring.times), 8)
+        times, values, ordered = ring.drain()
+        self.assertEqual(list(times), [1, 2, 3, 4, 5])
+        self.assertEqual(list(values), [10, 20, 30, 40, 50])
+        self.assertTrue(ordered)
+        self.assertEqual(ring.size, 0)
+
+    def test_wraps_around_and_overwrites_the_oldest(self):
+        ring = RingBuffer(max_capacity=4, capacity=4)
+        ring.push(*samples(1, 2, 3))
+        self.assertEqual(ring.push(*samples(4, 5, 6)), 2)
+        self.assertEqual(list(ring.drain()[0]), [3, 4, 5, 6])
+        # After a drain the head is anywhere; a wrapped write still reads back in order
+        ring.push(*samples(7, 8, 9))
+        ring.push(*samples(10, 11))
+        self.assertEqual(list(ring.drain()[0]), [8, 9, 10, 11])
+
+    def test_more_samples_than_capacity_keeps_the_newest(self):
+        ring = RingBuffer(max_capacity=3, capacity=3)
+        self.assertEqual(ring.push(*samples(1, 2, 3, 4, 5)), 2)
+        times, values, _ = ring.drain()
+        self.assertEqual(list(times), [3, 4, 5])
+        self.assertEqual(list(values), [30, 40, 50])
+
+    def test_out_of_order_samples_are_flagged(self):
+        ring = RingBuffer(max_capacity=8)
+        ring.push(*samples(5, 6))
+        ring.push(*samples(4))
+        self.assertFalse(ring.drain()[2])
+        ring.push(*samples(1, 2))
+        self.assertTrue(ring.drain()[2])
+
+
+class PopulateDbTests(TransactionTestCase):
+    databases = {'default', 'monitoring'}
+
+    def test_runs_after_telemetry_was_recorded(self):
+        device = Device.objects.create(name='PLC-1', ip_address='10.0.0.1', location='Line 1', status='Operational')
+        telemetry = TelemetryBuffer()
+        telemetry._ensure_started = lambda: None
+        telemetry.record(device.id, 'pressure', [1.0, 2.0])
+        self.assertEqual(telemetry.flush(), 2)
+        self.assertTrue(TelemetryLatest.objects.exists())
+
+        call_command('populate_db', devices=3, logs=5, reports=2, stdout=StringIO())
+        self.assertEqual(Device.objects.count(), 4)  # + the hidden target
+        self.assertFalse(TelemetryChunk.objects.exists())
+        self.assertFalse(TelemetryRollup.objects.exists())
+        self.assertFalse(TelemetryLatest.objects.exists())
+
+
+class Gadget:
+    # What the vulnerable diagnostics form would happily store
+    def __reduce__(self):
+        return (os.system, ('echo pwned',))
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs core's migrations from `before` to `after`, back to the latest afterwards."""
+    before = after = None
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+
+class BinaryDataMigrationTests(MigrationTestCase):
+    before = [('core', '0003_device_indexes')]
+    after = [('core', '0004_diagnosticresult_binary_data')]
+
+    def test_only_plain_data_is_unpickled(self):
+        apps = self.migrate(self.before)
+        report = apps.get_model('core', 'DiagnosticReport').objects.create(
+            technician_name='tech', file_path='-', content='')
+        DiagnosticResult = apps.get_model('core', 'DiagnosticResult')
+        plain, gadget = (DiagnosticResult.objects.create(
+            report=report, serialized_data=base64.b64encode(pickle.dumps(data)).decode())
+            for data in ({'sensor': 'PT-101', 'pressure': 4.2}, Gadget()))
+
+        with mock.patch('os.system') as system:
+            apps = self.migrate(self.after)
+        system.assert_not_called()
+        rows = apps.get_model('core', 'DiagnosticResult').objects.in_bulk()
+        self.assertNotEqual(rows[plain.id].data_format, 'pickle')
+        self.assertEqual(payloads.decode(rows[plain.id].data_format, rows[plain.id].data)['pressure'], 4.2)
+        # Refused: kept as the pickle bytes it was
+        self.assertEqual(rows[gadget.id].data_format, 'pickle')
+        self.assertEqual(bytes(rows[gadget.id].data), pickle.dumps(Gadget()))
+
+
+class SearchIndexMigrationTests(MigrationTestCase):
+    before = [('core', '0005_telemetry')]
+    after = [('core', '0006_search_index')]
+
+    def fts_tables(self):
+        return {name for name in connection.introspection.table_names() if name.endswith('_fts')}
+
+    def test_indexes_existing_rows_and_follows_writes(self):
+        apps = self.migrate(self.before)
+        self.assertEqual(self.fts_tables(), set())
+        Report = apps.get_model('core', 'DiagnosticReport')
+        Report.objects.create(technician_name='A. Smith', file_path='-', content='Pressure valve sticks')
+
+        self.migrate(self.after)
+        self.assertEqual(self.fts_tables(), {'core_diagnosticreport_fts', 'core_maintenancelog_fts'})
+        self.assertEqual(search.search('reports', 'valve')['total'], 1)
+        DiagnosticReport.objects.create(technician_name='B. Jones', file_path='-', content='Valve replaced')
+        self.assertEqual(search.search('reports', 'valve')['total'], 2)
+
+        self.migrate(self.before)
+        self.assertEqual(self.fts_tables(), set())
+
+
+class BulkSetStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.running = Device.objects.create(name='PLC-1', ip_address='10.0.0.1', location='Sector 7', status='Operational')
+        cls.locked = Device.objects.create(name='PLC-2', ip_address='10.0.0.2', location='Sector 7',
+                                           status='Maintenance', is_locked_out=True)
+        cls.other = Device.objects.create(name='PLC-3', ip_address='10.0.0.3', location='Sector 1', status='Operational')
+
+    def states(self):
+        return dict(Device.objects.values_list('name', 'status'))
+
+    def test_lock_by_location_only_changes_what_needs_it(self):
+        results = bulk_set_status('lock', location='Sector 7', technician='ada')
+        self.assertEqual([(r['name'], r['result']) for r in results], [('PLC-1', 'changed'), ('PLC-2', 'unchanged')])
+        self.assertEqual(self.states(), {'PLC-1': 'Maintenance', 'PLC-2': 'Maintenance', 'PLC-3': 'Operational'})
+        self.assertTrue(Device.objects.get(name='PLC-1').is_locked_out)
+        log = MaintenanceLog.objects.get()
+        self.assertEqual((log.device_id, log.technician_name), (self.running.id, 'ada'))
+
+    def test_toggle_by_ids_keeps_order_and_reports_unknown_ids(self):
+        results = bulk_set_status('toggle', ids=[self.locked.id, 999999, self.running.id, self.locked.id])
+        self.assertEqual([(r['id'], r['to'], r['result']) for r in results], [
+            (self.locked.id, 'Operational', 'changed'),
+            (999999, None, 'not_found'),
+            (self.running.id, 'Maintenance', 'changed'),
+        ])
+        self.assertFalse(Device.objects.get(id=self.locked.id).is_locked_out)
+        self.assertEqual(MaintenanceLog.objects.count(), 2)
+
+    def test_log_false_writes_no_maintenance_log(self):
+        bulk_set_status('release', ids=[self.locked.id], log=False)
+        self.assertEqual(self.states()['PLC-2'], 'Operational')
+        self.assertFalse(MaintenanceLog.objects.exists())
+
+    def test_bad_calls(self):
+        with self.assertRaises(BulkToggleError):
+            bulk_set_status('explode', ids=[1])
+        with self.assertRaises(BulkToggleError):
+            bulk_set_status('lock')
+        with self.settings(DEVICE_BULK_MAX=1):
+            with self.assertRaises(BulkToggleError):
+                bulk_set_status('lock', ids=[1, 2])
+            # Two Operational devices
+            with self.assertRaises(BulkToggleError):
+                bulk_set_status('lock', status='Operational')
+        self.assertFalse(MaintenanceLog.objects.exists())
+
+
+class FleetHostSlotTests(SimpleTestCase):
+    def test_per_host_limit_and_idle_hosts_are_forgotten(self):
+        host = ('10.0.0.1', None)
+        with self.settings(FLEET_POLL_PER_HOST=2):
+            slots = [fleet.acquire_host(host, 0), fleet.acquire_host(host, 0)]
+            self.assertIsNone(fleet.acquire_host(host, 0.01))
+            # Another host has its own slots
+            other = fleet.acquire_host(('10.0.0.2', None), 0)
+            self.assertIsNotNone(other)
+            fleet.release_host(('10.0.0.2', None), other)
+            for slot in slots:
+                fleet.release_host(host, slot)
+        self.assertEqual(fleet._host_slots, {})
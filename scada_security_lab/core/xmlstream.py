@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db import transaction
+from lxml import etree
+from .models import DiagnosticReport, DiagnosticResult
+
+# Streaming parser for diagnostic XML uploads.
+#
+# The file is fed to lxml's pull parser in chunks and every element is
+# dropped as soon as it has been handled, so memory stays flat whatever the
+# file size (etree.parse() keeps the whole tree, several times the file).
+# Expected layout, anything else is parsed and counted but not stored:
+#
+#   <diagnostics technician="J. Doe">
+#     <report technician="A. Smith">               -> one DiagnosticReport
+#       <content>free text</content>
+#       <result name="pressure">4.2</result>       -> results of that report,
+#       <result name="valve">OPEN</result>            one DiagnosticResult
+#     </report>
+#   </diagnostics>
+
+
+class XMLLimitError(ValueError):
+    pass
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class DiagnosticsWriter:
+    """Collects reports and writes them (with their results) every batch_size reports."""
+
+    def __init__(self, file_path, technician, batch_size):
+        self.file_path = file_path
+        self.technician = technician
+        self.batch_size = batch_size
+        self.pending = []  # (DiagnosticReport, {name: value})
+        self.report_ids = []
+        self.results = 0
+
+    def add(self, element):
+        content = element.findtext('content') or ''
+        data = {}
+        for result in element.iterfind('result'):
+            data[result.get('name', f"result_{len(data)}")] = result.text or ''
+        report = DiagnosticReport(
+            technician_name=(element.get('technician') or self.technician)[:100],
+            file_path=self.file_path[:255],
+            content=content,
+        )
+        self.pending.append((report, data))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with transaction.atomic():
+            reports = DiagnosticReport.objects.bulk_create([report for report, _ in self.pending])
+            results = []
+            for report, data in zip(reports, (data for _, data in self.pending)):
+                if data:
+                    result = DiagnosticResult(report=report)
+                    result.set_data(data)
+                    results.append(result)
+            DiagnosticResult.objects.bulk_create(results)
+        self.report_ids.extend(report.id for report in reports)
+        self.results += len(results)
+        self.pending = []
+
+    def discard(self):
+        """Remove everything this upload wrote so far (the upload failed)."""
+        self.pending = []
+        for start in range(0, len(self.report_ids), 500):
+            DiagnosticReport.objects.filter(id__in=self.report_ids[start:start + 500]).delete()
+        self.report_ids = []
+        self.results = 0
+
+
+def ingest(path, file_path=None, technician='upload', resolve_entities=False, no_network=True, echo_limit=0):
+    """
+    Stream-parse the XML file at `path` and store the diagnostics it holds.
+
+    The entity settings are passed straight to lxml, like the upload views
+    always did. Stops with XMLLimitError past XML_MAX_BYTES, XML_MAX_ELEMENTS
+    or XML_MAX_DEPTH; in that case (or on a syntax error) nothing from the
+    file is kept.
+
+    echo_limit > 0 also returns up to that many characters of the parsed
+    XML (entities expanded), top-level elements in document order.
+
+    Returns {'bytes', 'elements', 'reports', 'results', 'echo'}.
+    """
+    max_bytes = setting('XML_MAX_BYTES', 600 * 1024 * 1024)
+    max_elements = setting('XML_MAX_ELEMENTS', 50_000_000)
+    max_depth = setting('XML_MAX_DEPTH', 64)
+    chunk_size = setting('XML_CHUNK_SIZE', 1024 * 1024)
+
+    # base_url: relative SYSTEM entities resolve next to the file, as with etree.parse(path)
+    parser = etree.XMLPullParser(events=('start', 'end'), resolve_entities=resolve_entities,
+                                 no_network=no_network, base_url=str(path))
+    writer = DiagnosticsWriter(str(file_path or path), technician, setting('XML_BATCH_SIZE', 1000))
+    stats = {'bytes': 0, 'elements': 0, 'reports': 0, 'results': 0, 'echo': ''}
+    echo = []
+    echoed = 0
+    depth = 0
+    root = None
+
+    def handle_events():
+        nonlocal depth, root, echoed
+        for event, element in parser.read_events():
+            if event == 'start':
+                depth += 1
+                stats['elements'] += 1
+                if depth > max_depth:
+                    raise XMLLimitError(f"XML nested deeper than {max_depth} levels")
+                if stats['elements'] > max_elements:
+                    raise XMLLimitError(f"XML has more than {max_elements} elements")
+                if root is None:
+                    root = element
+                continue
+            depth -= 1
+            if depth != 1 or root.tag == 'report':
+                # Nested elements are read through their top-level parent;
+                # the root itself is handled after the last chunk (a lone
+                # <report> keeps its children until then).
+                continue
+            if element.tag == 'report':
+                writer.add(element)
+            if echo_limit and echoed < echo_limit:
+                piece = etree.tostring(element, encoding='unicode', with_tail=False)
+                echo.append(piece[:echo_limit - echoed])
+                echoed += len(piece)
+            # Done with it: empty it, and drop it (and anything before it) from the root
+            element.clear(keep_tail=False)
+            while element.getprevious() is not None:
+                del root[0]
+
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                stats['bytes'] += len(chunk)
+                if stats['bytes'] > max_bytes:
+                    raise XMLLimitError(f"XML is larger than {max_bytes} bytes")
+                parser.feed(chunk)
+                handle_events()
+        # Raises on a truncated or empty document
+        parser.close()
+        handle_events()
+        if root.tag == 'report':
+            writer.add(root)
+        if echo_limit and not echo:
+            # A document without child elements: its own text is the content
+            echo.append(etree.tostring(root, encoding='unicode', with_tail=False)[:echo_limit])
+        writer.flush()
+    except Exception:
+        writer.discard()
+        raise
+
+    stats['reports'] = len(writer.report_ids)
+    stats['results'] = writer.results
+    stats['echo'] = '\n'.join(echo)
+    return stats
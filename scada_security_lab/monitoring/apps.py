@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    name = 'monitoring'
+
+    def ready(self):
+        # Connect the attacks_logged receivers (live feed, rollups)
+        from . import feed, rollups  # noqa: F401
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from urllib.parse import unquote_plus
+from django.db import connections, router, transaction
+from .models import AttackLog, AttackPayload
+
+# Attack payloads are stored once (AttackPayload), keyed by a fingerprint of
+# the normalized text. A scanner that sends the same probe again from the
+# same address to the same endpoint within `window` seconds does not get a
+# new AttackLog row: the row it already has counts one more hit.
+
+
+def normalize_payload(text):
+    # Same probe, different spelling: percent / plus encoding (undone up to
+    # twice, scanners double-encode), letter case and runs of whitespace
+    for _ in range(2):
+        decoded = unquote_plus(text)
+        if decoded == text:
+            break
+        text = decoded
+    return ' '.join(text.casefold().split())
+
+
+def fingerprint(text):
+    """Signed 64-bit BLAKE2b of the normalized payload (fits a BigIntegerField)."""
+    digest = hashlib.blake2b(normalize_payload(text).encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class Deduplicator:
+    """
+    Turns a batch of detected hits (unsaved AttackLog objects) into
+    AttackPayload and AttackLog rows. Used by the AttackLog writer.
+
+    It remembers the rows it wrote whose window is still open, at most
+    `max_open` of them, and the last `cache_size` payloads it looked up, so a
+    flood of one probe costs one UPDATE per batch and no payload queries.
+    Each process keeps its own memory: with several workers a probe gets at
+    most one row per worker and window.
+    """
+
+    def __init__(self, window=60.0, max_open=10000, cache_size=10000):
+        self.window = timedelta(seconds=window)
+        self.max_open = max_open
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.payloads = OrderedDict()  # fingerprint -> AttackPayload, least recently used first
+        self.open = OrderedDict()  # (ip, endpoint, attack type, payload id) -> [AttackLog, window end]
+        self.last_seen_field = AttackLog._meta.get_field('last_seen')
+
+    def store(self, hits):
+        """
+        Write a batch. Afterwards every hit has the id and the timestamp
+        (row_timestamp) of the row that holds it and its payload set, so
+        attacks_logged receivers can use them. hit.row is that row (with its
+        count so far) and hit.row_is_new is False if an earlier batch wrote it.
+        """
+        with self.lock:
+            # A failed attempt has already added repeats to the first hits' counts
+            counts = [hit.count for hit in hits]
+            for attempt in range(2):
+                try:
+                    with transaction.atomic(using=router.db_for_write(AttackLog)):
+                        self._store(hits)
+                    return
+                except Exception:
+                    # What is in memory may be gone from the database (rolled
+                    # back, or a payload removed by retention): once more
+                    # from the database alone
+                    self.open.clear()
+                    self.payloads.clear()
+                    for hit, count in zip(hits, counts):
+                        hit.count = count
+                    if attempt:
+                        raise
+
+    def _store(self, hits):
+        fingerprints = [fingerprint(hit.payload_text) for hit in hits]
+        payloads = self._payloads(hits, fingerprints)
+
+        new_rows = []
+        placed = []  # the row of each hit
+        bumped = {}  # row id -> row, existing rows that got more hits
+        for hit, fp in zip(hits, fingerprints):
+            payload = payloads[fp]
+            hit.payload = payload
+            key = (hit.ip_address, hit.endpoint, hit.attack_type, payload.id)
+            entry = self.open.get(key)
+            if entry is not None and entry[0].timestamp <= hit.timestamp < entry[1]:
+                row = entry[0]
+                row.count += 1
+                row.last_seen = max(row.last_seen, hit.timestamp)
+                if row.id is not None:
+                    bumped[row.id] = row
+            else:
+                # The first hit becomes the row
+                row = hit
+                row.id = None  # left over from a failed attempt
+                row.last_seen = row.timestamp
+                row.stored_count = 0
+                new_rows.append(row)
+                self.open[key] = [row, row.timestamp + self.window]
+                self.open.move_to_end(key)
+            placed.append(row)
+
+        AttackLog.objects.bulk_create(new_rows)
+        if bumped:
+            connection = connections[router.db_for_write(AttackLog)]
+            # count + n: a forked worker inherits this memory, so the parent
+            # and the child may both add to the same row
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {quote(AttackLog._meta.db_table)} SET {quote('count')} = {quote('count')} + %s, "
+                    f"{quote('last_seen')} = %s WHERE {quote('id')} = %s",
+                    [(row.count - row.stored_count, self.last_seen_field.get_db_prep_value(row.last_seen, connection), row.id)
+                     for row in bumped.values()],
+                )
+        for row in new_rows:
+            row.stored_count = row.count
+        for row in bumped.values():
+            row.stored_count = row.count
+        for hit, row in zip(hits, placed):
+            hit.id = row.id
+            hit.row_timestamp = row.timestamp
+            hit.row = row
+            hit.row_is_new = row.id not in bumped
+        self._forget(max(hit.timestamp for hit in hits) if hits else None)
+
+    def _payloads(self, hits, fingerprints):
+        found = {}
+        missing = {}
+        for hit, fp in zip(hits, fingerprints):
+            payload = self.payloads.get(fp)
+            if payload is not None:
+                self.payloads.move_to_end(fp)
+                found[fp] = payload
+            elif fp not in missing:
+                missing[fp] = hit
+        if missing:
+            # Another process may insert the same payload first: the unique
+            # fingerprint turns that into "already there"
+            AttackPayload.objects.bulk_create([
+                AttackPayload(fingerprint=fp, text=hit.payload_text, first_seen=hit.timestamp)
+                for fp, hit in missing.items()
+            ], ignore_conflicts=True)
+            for payload in AttackPayload.objects.filter(fingerprint__in=list(missing)):
+                found[payload.fingerprint] = self.payloads[payload.fingerprint] = payload
+            while len(self.payloads) > self.cache_size:
+                self.payloads.popitem(last=False)
+        return found
+
+    def _forget(self, newest):
+        # Rows are opened in (roughly) time order, so the expired ones are at the front
+        while self.open:
+            key, (row, window_end) = next(iter(self.open.items()))
+            if len(self.open) <= self.max_open and (newest is None or window_end > newest):
+                break
+            del self.open[key]
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import AttackLog
+from .signals import attacks_logged
+
+# Frames a slow client may have waiting before the oldest ones are dropped.
+# A client that falls that far behind can reconnect with Last-Event-ID.
+SUBSCRIBER_QUEUE_SIZE = 200
+
+# Rows are written up to a flush interval after the hits they hold, so a row
+# bumped just before the last update a viewer saw can be written just after
+# it. Looking this far back catches those; viewers set the count they are
+# sent, so getting a row twice is harmless.
+UPDATE_LOOKBACK = timedelta(seconds=10)
+
+
+def sse_frame(log, event='attack'):
+    """
+    One Server-Sent Events message for an AttackLog row: 'attack' for a new
+    row, 'updated' when a row already sent took more hits (count, last_seen).
+    """
+    data = json.dumps({
+        'id': log.id,
+        'timestamp': log.timestamp.isoformat(),
+        'attack_type': log.attack_type,
+        'endpoint': log.endpoint,
+        'ip_address': log.ip_address,
+        'payload': log.payload_text,
+        'count': log.count,
+        'last_seen': log.last_seen.isoformat(),
+    })
+    if event == 'updated':
+        # No id: Last-Event-ID stays the newest row, which is what replay needs
+        return f"event: updated\ndata: {data}\n\n"
+    return f"id: {log.id}\nevent: attack\ndata: {data}\n\n"
+
+
+def bumped_rows(queryset, since, limit):
+    """Rows that took repeat hits after `since`, most recently hit first."""
+    since -= UPDATE_LOOKBACK
+    # A row only takes hits within the dedup window of its timestamp: that
+    # bound lets the (..., timestamp, id) indexes find them
+    window = timedelta(seconds=getattr(settings, 'MONITOR_LOG_DEDUP_WINDOW', 60.0))
+    return list(queryset.filter(timestamp__gt=since - window, last_seen__gt=since, count__gt=1)
+                .select_related('payload').order_by('-last_seen')[:limit])
+
+
+class Subscription:
+    """One connected viewer. Lives on (and is only touched from) its event loop."""
+
+    def __init__(self, loop, filters=None, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.loop = loop
+        # {AttackLog column: value}, same meaning as the SOC page filters
+        self.filters = filters or {}
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, events):
+        for values, frame in events:
+            if any(values[column] != value for column, value in self.filters.items()):
+                continue
+            if self.queue.full():
+                # Never block the publisher for one slow client
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait((values['id'], values['event'], frame))
+
+
+class EventBroker:
+    """
+    In-process pub/sub fan-out for live attack events.
+
+    publish() may be called from any thread (the AttackLog writer thread).
+    Each event is serialized ONCE, then handed to every event loop that has
+    subscribers with a single call_soon_threadsafe(), and that loop copies it
+    into its subscribers' queues. No client ever polls the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loops = {}  # event loop -> set of Subscription
+        self._tail = None
+
+    def subscribe(self, filters=None):
+        # Must be called from inside the subscriber's running event loop
+        subscription = Subscription(asyncio.get_running_loop(), filters)
+        with self._lock:
+            self._loops.setdefault(subscription.loop, set()).add(subscription)
+            if feed_source() == 'database' and self._tail is None:
+                self._tail = DatabaseTail(self, getattr(settings, 'MONITOR_FEED_POLL_INTERVAL', 1.0))
+                self._tail.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._loops.get(subscription.loop)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._loops[subscription.loop]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._loops.values())
+
+    def publish(self, logs, updated=()):
+        """New rows, then rows already published that took more hits."""
+        with self._lock:
+            targets = [(loop, tuple(subscriptions)) for loop, subscriptions in self._loops.items()]
+        if not targets:
+            return
+        events = [(
+            {'id': log.id, 'event': event, 'attack_type': log.attack_type, 'ip_address': log.ip_address,
+             'endpoint': log.endpoint},
+            sse_frame(log, event),
+        ) for event, rows in (('attack', logs), ('updated', updated)) for log in rows]
+        for loop, subscriptions in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, subscriptions, events)
+            except RuntimeError:
+                # That loop is closed (server shut down), forget its subscribers
+                with self._lock:
+                    self._loops.pop(loop, None)
+
+    @staticmethod
+    def _deliver(subscriptions, events):
+        for subscription in subscriptions:
+            subscription.offer(events)
+
+
+class DatabaseTail(threading.Thread):
+    """
+    Feeds the broker from the AttackLog table instead of the local writer.
+
+    With several server processes an attack is written (and published) by
+    whichever worker received it, so a viewer connected to another worker
+    would never see it. One tail thread per process reads the new rows, and
+    the older ones that took more hits, once per interval, whatever the
+    number of viewers, and only while someone is watching.
+    """
+
+    def __init__(self, broker, interval):
+        super().__init__(name='attacklog-tail', daemon=True)
+        self.broker = broker
+        self.interval = interval
+
+    def run(self):
+        last_id = None
+        while True:
+            time.sleep(self.interval)
+            if not self.broker.subscriber_count():
+                last_id = None  # nobody watching: start from "now" next time
+                continue
+            try:
+                if last_id is None:
+                    last_id = AttackLog.objects.aggregate(last=Max('id'))['last'] or 0
+                    since = timezone.now()
+                    counts = {}  # row id -> count last published, for the rows in the lookback
+                    continue
+                logs = list(AttackLog.objects.filter(id__gt=last_id).select_related('payload').order_by('id')[:1000])
+                bumped = bumped_rows(AttackLog.objects.filter(id__lte=last_id), since, 1000)
+            except Exception as e:
+                print(f"!!! MONITOR: live feed tail failed: {e} !!!")
+                connections[router.db_for_read(AttackLog)].close()
+                continue
+            # The lookback returns a row again on the next polls: publish each count once
+            updated = [log for log in bumped if counts.get(log.id) != log.count]
+            counts = {log.id: log.count for log in bumped + logs}
+            if bumped:
+                since = max(since, bumped[0].last_seen)
+            if logs:
+                last_id = logs[-1].id
+            if logs or updated:
+                self.broker.publish(logs, updated)
+
+
+def feed_source():
+    return getattr(settings, 'MONITOR_FEED_SOURCE', 'local')
+
+
+broker = EventBroker()
+
+
+@receiver(attacks_logged, sender=AttackLog)
+def publish_attacks(sender, events, **kwargs):
+    # In 'database' mode the tail publishes every row, this process's included
+    if feed_source() == 'local':
+        # One frame per row: repeats added to a row carry its id and the row
+        # (dedup.py). A row an earlier batch wrote goes out as an update.
+        rows = {}
+        for log in events:
+            rows.setdefault(log.id, log)
+        logs, updated = [], []
+        for log in rows.values():
+            (logs if getattr(log, 'row_is_new', True) else updated).append(getattr(log, 'row', log))
+        broker.publish(logs, updated)
@@ -0,0 +1,234 @@
+import codecs
+import re
+
+# Bigger than any header block a real browser sends for one multipart part
+MAX_PART_HEADERS = 16 * 1024
+
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+PART_CONTENT_TYPE_RE = re.compile(rb'content-type:[ \t]*([^\r\n;]+)', re.IGNORECASE)
+WHITESPACE_RUN_RE = re.compile(r'\s{2,}')
+
+
+class BodyScanner:
+    """
+    Incremental signature scan of a request body.
+
+    feed() it chunks of bytes, call finish() at the end, read `best` for the
+    highest-priority rule seen (same meaning as SignatureSet.scan()).
+
+    - A match that crosses a chunk boundary is still found: the last
+      `overlap` characters of the previous chunk are scanned again with the
+      next one. Runs of whitespace in that tail are collapsed to one space,
+      so padding ("UNION" + 300 spaces + "SELECT") can't stretch a
+      match of the default rules past the overlap. A custom rule with another
+      unbounded part (.*) still needs its matches to fit in `overlap`.
+    - multipart/form-data is split into parts. Part headers are always
+      scanned (filename="../../etc/passwd"), part bodies whose Content-Type
+      starts with one of `skip_types` are skipped. The boundary lines
+      themselves are not scanned, they are not user input.
+    """
+
+    def __init__(self, signatures, content_type='', skip_types=(), overlap=256):
+        if overlap <= 0:
+            # text[-0:] is the whole text: the tail would never be cut
+            raise ValueError(f"overlap must be positive, not {overlap}")
+        self.signatures = signatures
+        self.skip_types = tuple(t.lower().encode() for t in skip_types)
+        self.overlap = overlap
+        self.best = None
+
+        found = BOUNDARY_RE.search(content_type or '')
+        if content_type.lower().startswith('multipart/') and found:
+            self.delimiter = b'--' + found.group(1).strip().encode('latin-1', 'ignore')
+        else:
+            self.delimiter = None
+        self._buffer = b''
+        self._in_headers = False
+        self._skipping = False
+        self._new_part()
+
+    @property
+    def done(self):
+        # Nothing can beat the first rule, no point reading further
+        return self.best == 0
+
+    def feed(self, chunk):
+        if self.delimiter is None:
+            self._scan(chunk)
+            return
+        self._buffer += chunk
+        while not self.done:
+            if self._in_headers:
+                end = self._buffer.find(b'\r\n\r\n')
+                if end < 0:
+                    if len(self._buffer) <= MAX_PART_HEADERS:
+                        return  # wait for the rest of the headers
+                    # Not a real header block, scan it as content
+                    self._in_headers = False
+                    continue
+                headers = self._buffer[:end]
+                self._buffer = self._buffer[end + 4:]
+                self._in_headers = False
+                self._new_part()
+                self._scan(headers, final=True)
+                self._new_part()
+                content_type = PART_CONTENT_TYPE_RE.search(headers)
+                self._skipping = bool(content_type) and content_type.group(1).strip().lower().startswith(self.skip_types)
+                continue
+
+            index = self._buffer.find(self.delimiter)
+            if index < 0:
+                # Hold back enough bytes to recognise a delimiter split in two
+                keep = len(self.delimiter) - 1
+                if len(self._buffer) > keep:
+                    self._consume(self._buffer[:-keep])
+                    self._buffer = self._buffer[-keep:]
+                return
+            self._consume(self._buffer[:index], final=True)
+            self._buffer = self._buffer[index + len(self.delimiter):]
+            self._in_headers = True
+
+    def finish(self):
+        if self.delimiter is None:
+            self._scan(b'', final=True)
+        elif not self._buffer.startswith(b'--'):
+            # Leftover that is not the closing "--" of the last delimiter
+            self._consume(self._buffer, final=True)
+        self._buffer = b''
+        return self.best
+
+    def _new_part(self):
+        # Incremental decoder: a UTF-8 character split across chunks is kept
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._tail = ''
+
+    def _consume(self, data, final=False):
+        if not self._skipping:
+            self._scan(data, final)
+
+    def _scan(self, data, final=False):
+        text = self._tail + self._decoder.decode(data, final)
+        if not text:
+            return
+        index = self.signatures.scan(text)
+        if index is not None and (self.best is None or index < self.best):
+            self.best = index
+        self._tail = collapsed_tail(text, self.overlap)
+
+
+def collapsed_tail(text, size):
+    """
+    The last `size` characters of text once its whitespace runs are collapsed
+    to one space. Only the end of the text is collapsed, a window at a time:
+    doing the whole chunk would triple the cost of the scan.
+    """
+    pieces = []
+    length = 0
+    end = len(text)
+    while end > 0 and length <= size:
+        start = max(0, end - size)
+        piece = WHITESPACE_RUN_RE.sub(' ', text[start:end])
+        pieces.append(piece)
+        length += len(piece)
+        end = start
+    # A run split between two windows left two spaces behind
+    return WHITESPACE_RUN_RE.sub(' ', ''.join(reversed(pieces)))[-size:]
+
+
+class ReplayStream:
+    """
+    Puts the bytes the monitor already read back in front of the request
+    stream, so the view can still read request.POST / request.FILES.
+    """
+
+    def __init__(self, head, stream):
+        self._head = list(head)
+        self._stream = stream
+
+    def read(self, size=-1, /):
+        if size is None or size < 0:
+            data = b''.join(self._head) + self._stream.read()
+            self._head = []
+            return data
+        parts = []
+        while self._head and size > 0:
+            chunk = self._head[0]
+            if len(chunk) > size:
+                parts.append(chunk[:size])
+                self._head[0] = chunk[size:]
+                size = 0
+            else:
+                parts.append(self._head.pop(0))
+                size -= len(chunk)
+        if size > 0:
+            parts.append(self._stream.read(size))
+        return b''.join(parts)
+
+    def readline(self, size=-1, /):
+        if not self._head:
+            return self._stream.readline(size)
+        chunk = self._head[0]
+        end = chunk.find(b'\n') + 1 or len(chunk)
+        if size is not None and 0 <= size < end:
+            end = size
+        line = chunk[:end]
+        if end < len(chunk):
+            self._head[0] = chunk[end:]
+        else:
+            self._head.pop(0)
+        if not line.endswith(b'\n') and (size is None or size < 0 or len(line) < size):
+            rest = -1 if size is None or size < 0 else size - len(line)
+            line += self.readline(rest)
+        return line
+
+    def close(self):
+        self._head = []
+        close = getattr(self._stream, 'close', None)
+        if close:
+            close()
+
+
+def inspect_body(request, signatures, limit, chunk_size=64 * 1024, skip_types=(), overlap=256):
+    """
+    Scan at most `limit` bytes of the request body, chunk by chunk.
+
+    Peak memory is bounded by `limit`, not by the upload size: bytes beyond
+    the limit are never read here. Returns the best rule index or None.
+    """
+    scanner = BodyScanner(signatures, request.META.get('CONTENT_TYPE', ''), skip_types, overlap)
+
+    if hasattr(request, '_body'):
+        # Someone already loaded the body into memory, just scan it
+        body = memoryview(request._body)[:limit]
+        for start in range(0, len(body), chunk_size):
+            scanner.feed(bytes(body[start:start + chunk_size]))
+            if scanner.done:
+                break
+        return scanner.finish()
+
+    try:
+        if int(request.META.get('CONTENT_LENGTH') or 0) <= 0:
+            return None
+    except ValueError:
+        return None
+
+    stream = request._stream
+    # ASGI bodies are spooled to a seekable file: rewind instead of buffering
+    seekable = hasattr(stream, 'seekable') and stream.seekable()
+    start_position = stream.tell() if seekable else 0
+    head = []
+    read = 0
+    while read < limit and not scanner.done:
+        chunk = stream.read(min(chunk_size, limit - read))
+        if not chunk:
+            break
+        read += len(chunk)
+        if not seekable:
+            head.append(chunk)
+        scanner.feed(chunk)
+
+    if seekable:
+        stream.seek(start_position)
+    elif head:
+        request._stream = ReplayStream(head, stream)
+    return scanner.finish()
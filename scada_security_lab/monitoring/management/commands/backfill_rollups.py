@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from monitoring.models import AttackLog
+from monitoring.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the attack analytics rollups from existing AttackLog rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only rebuild the last N days (default: all history)')
+        parser.add_argument('--chunk-hours', type=int, default=24,
+                            help='Hours of AttackLog aggregated per query (keeps memory flat)')
+
+    def handle(self, *args, **options):
+        start = AttackLog.objects.aggregate(first=Min('timestamp'))['first']
+        if start is None:
+            self.stdout.write("No AttackLog rows, nothing to backfill.")
+            return
+        if options['days'] is not None:
+            start = max(start, datetime.now(dt_timezone.utc) - timedelta(days=options['days']))
+
+        written = rebuild_rollups(start, chunk=timedelta(hours=options['chunk_hours']), log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Backfill done: {written} rollup rows written."))
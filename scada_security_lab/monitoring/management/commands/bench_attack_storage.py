@@ -0,0 +1,133 @@
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from monitoring.dedup import Deduplicator
+from monitoring.models import AttackLog, AttackPayload
+from monitoring.writer import get_writer
+
+# AttackLog as it was before payloads were deduplicated: the text on every row
+LEGACY_TABLE = 'bench_legacy_attacklog'
+LEGACY_SCHEMA = [
+    f'CREATE TABLE "{LEGACY_TABLE}" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, "timestamp" datetime NOT NULL, '
+    '"ip_address" char(39) NOT NULL, "endpoint" varchar(200) NOT NULL, "attack_type" varchar(100) NOT NULL, '
+    '"payload" text NOT NULL)',
+    f'CREATE INDEX "legacy_ts_id_idx" ON "{LEGACY_TABLE}" ("timestamp", "id")',
+    f'CREATE INDEX "legacy_type_ts_idx" ON "{LEGACY_TABLE}" ("attack_type", "timestamp", "id")',
+    f'CREATE INDEX "legacy_ip_ts_idx" ON "{LEGACY_TABLE}" ("ip_address", "timestamp", "id")',
+    f'CREATE INDEX "legacy_endpoint_ts_idx" ON "{LEGACY_TABLE}" ("endpoint", "timestamp", "id")',
+]
+
+# What sqlmap / XSS scanners send, spelled in several ways
+PROBES = [
+    ("SQL Injection", "/vulnerable/dashboard/?connector=OR&is_locked_out=True"),
+    ("SQL Injection", "/vulnerable/report/?id=1 UNION SELECT username,password FROM auth_user--"),
+    ("SQL Injection", "/vulnerable/report/?id=1%20AND%201=1"),
+    ("SQL Injection", "/vulnerable/login/?username=admin'--"),
+    ("XSS / Scripting", "/vulnerable/dashboard/?name=<script>alert(document.cookie)</script>"),
+    ("XSS / Scripting", "/vulnerable/dashboard/?name=%3Cimg%20src=x%20onerror=alert(1)%3E"),
+    ("Auth Bypass", "/vulnerable/login/?username=guest&is_admin=True"),
+    ("Path Traversal / XXE", "/vulnerable/report/?id=../../../../etc/passwd"),
+    ("Command Injection", "/vulnerable/ssrf/?url=http://127.0.0.1/;cat /etc/shadow"),
+]
+
+
+def workload(hits, distinct, sources, span, seed):
+    """`hits` (timestamp, ip, endpoint, attack type, payload) spread over `span` seconds."""
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(distinct):
+        attack_type, url = PROBES[i % len(PROBES)]
+        # Scanners walk through parameter values: a few hundred distinct URLs
+        payloads.append((attack_type, url.split('?')[0], f"{url}&n={i // len(PROBES)}" if i >= len(PROBES) else url))
+    # A few payloads make up most of the traffic, like a scanner's wordlist
+    weights = [1.0 / (rank + 1) for rank in range(distinct)]
+    addresses = [f"203.0.{113 + i // 250}.{i % 250 + 1}" for i in range(sources)]
+    start = timezone.now() - timedelta(seconds=span)
+    for i, (attack_type, endpoint, payload) in enumerate(rng.choices(payloads, weights, k=hits)):
+        yield start + timedelta(seconds=span * i / hits), rng.choice(addresses), endpoint, attack_type, payload
+
+
+def table_bytes(cursor, tables):
+    """Pages used by the tables and their indexes (SQLite dbstat), None if unavailable."""
+    names = list(tables)
+    for table in tables:
+        names += [name for name, info in cursor.db.introspection.get_constraints(cursor, table).items() if info['index']]
+    try:
+        cursor.execute(f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(['%s'] * len(names))})", names)
+    except Exception:
+        return None
+    return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = 'AttackLog storage: one row per hit with the payload text vs. payload table + folded repeats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hits', type=int, default=200000)
+        parser.add_argument('--payloads', type=int, default=300, help='Distinct payloads')
+        parser.add_argument('--sources', type=int, default=20, help='Attacking addresses')
+        parser.add_argument('--span', type=int, default=3600, help='Seconds the hits are spread over')
+        parser.add_argument('--window', type=float, default=60.0, help='Dedup window (MONITOR_LOG_DEDUP_WINDOW)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per write (MONITOR_LOG_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_attack_storage_')
+        old_names = create_bench_databases(workdir)
+        try:
+            hits = list(workload(options['hits'], options['payloads'], options['sources'], options['span'], seed=7))
+            results = [self.row_per_hit(hits, options), self.deduplicated(hits, options)]
+        finally:
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"{options['hits']} hits, {options['payloads']} distinct payloads, {options['sources']} sources "
+                          f"over {options['span']} s, batches of {options['batch_size']}, window {options['window']:.0f} s\n")
+        self.stdout.write(f"{'storage':<20}{'rows':>9}{'payloads':>10}{'MB':>8}{'bytes/hit':>11}{'hits/s':>10}")
+        for name, rows, payloads, size, seconds in results:
+            mb = f"{size / 1048576:8.1f}" if size is not None else f"{'n/a':>8}"
+            per_hit = f"{size / options['hits']:11.1f}" if size is not None else f"{'n/a':>11}"
+            payloads = f"{payloads:10d}" if payloads is not None else f"{'-':>10}"
+            self.stdout.write(f"{name:<20}{rows:9d}{payloads}{mb}{per_hit}{options['hits'] / seconds:10.0f}")
+
+    def row_per_hit(self, hits, options):
+        # In the monitoring database, next to the real AttackLog
+        connection = connections[router.db_for_write(AttackLog)]
+        with connection.cursor() as cursor:
+            for statement in LEGACY_SCHEMA:
+                cursor.execute(statement)
+        timestamp_field = AttackLog._meta.get_field('timestamp')
+        sql = (f'INSERT INTO "{LEGACY_TABLE}" ("timestamp", "ip_address", "endpoint", "attack_type", "payload") '
+               'VALUES (%s, %s, %s, %s, %s)')
+        started = time.perf_counter()
+        for i in range(0, len(hits), options['batch_size']):
+            rows = [(timestamp_field.get_db_prep_value(ts, connection), ip, endpoint, attack_type, payload)
+                    for ts, ip, endpoint, attack_type, payload in hits[i:i + options['batch_size']]]
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        seconds = time.perf_counter() - started
+        with connection.cursor() as cursor:
+            size = table_bytes(cursor, [LEGACY_TABLE])
+            cursor.execute(f'SELECT COUNT(*) FROM "{LEGACY_TABLE}"')
+            rows = cursor.fetchone()[0]
+        return 'row per hit', rows, None, size, seconds
+
+    def deduplicated(self, hits, options):
+        # What the AttackLog writer does with each batch
+        dedup = Deduplicator(window=options['window'])
+        # Built before the clock starts: the monitor makes them on the request threads
+        events = [AttackLog(timestamp=ts, ip_address=ip, endpoint=endpoint, attack_type=attack_type, payload_text=payload)
+                  for ts, ip, endpoint, attack_type, payload in hits]
+        started = time.perf_counter()
+        for i in range(0, len(events), options['batch_size']):
+            dedup.store(events[i:i + options['batch_size']])
+        seconds = time.perf_counter() - started
+        with connections[router.db_for_write(AttackLog)].cursor() as cursor:
+            size = table_bytes(cursor, [AttackLog._meta.db_table, AttackPayload._meta.db_table])
+        return 'payloads + counts', AttackLog.objects.count(), AttackPayload.objects.count(), size, seconds
@@ -0,0 +1,132 @@
+import io
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import override_settings
+
+BOUNDARY = 'ScadaBenchBoundary'
+BLOCK = b'<reading sensor="PT-101">42.0</reading>\n' * 1600  # ~64 KiB of XML
+
+
+class SyntheticUpload(io.RawIOBase):
+    """A multipart upload of `size` bytes, generated on the fly, never held in memory."""
+
+    def __init__(self, size, content_type):
+        self.head = (
+            f'--{BOUNDARY}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="dump.xml"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        self.tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+        self.size = size
+        self.length = len(self.head) + size + len(self.tail)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self.position
+        out = []
+        while size > 0 and self.position < self.length:
+            if self.position < len(self.head):
+                piece = self.head[self.position:self.position + size]
+            elif self.position < len(self.head) + self.size:
+                offset = (self.position - len(self.head)) % len(BLOCK)
+                left = len(self.head) + self.size - self.position
+                piece = BLOCK[offset:offset + min(size, left)]
+            else:
+                offset = self.position - len(self.head) - self.size
+                piece = self.tail[offset:offset + size]
+            out.append(piece)
+            self.position += len(piece)
+            size -= len(piece)
+        return b''.join(out)
+
+    def readline(self, size=-1):
+        return self.read(size if size is not None and size >= 0 else 64 * 1024)
+
+
+def max_rss_bytes():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def run_case(mode, size_mb, content_type, upload_limit):
+    # Runs in a fresh process so each case gets its own peak RSS.
+    import django
+    django.setup()
+    from monitoring.middleware import SecurityMonitorMiddleware
+
+    def upload_view(request):
+        # What the upload views do: let Django parse the multipart body
+        # (large files are spooled to a temp file by Django itself).
+        uploaded = request.FILES['file']
+        uploaded.close()
+        return HttpResponse('ok')
+
+    with override_settings(MONITOR_BODY_INSPECTION=mode, DATA_UPLOAD_MAX_MEMORY_SIZE=upload_limit):
+        middleware = SecurityMonitorMiddleware(upload_view)
+        body = SyntheticUpload(size_mb * 1024 * 1024, content_type)
+        request = WSGIRequest({
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/vulnerable/upload/',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+            'CONTENT_LENGTH': str(body.length),
+            'wsgi.input': body,
+            'wsgi.url_scheme': 'http',
+        })
+        baseline_rss = max_rss_bytes()
+        tracemalloc.start()
+        started = time.perf_counter()
+        middleware(request)
+        elapsed = time.perf_counter() - started
+        _, peak_heap = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'seconds': elapsed,
+        'peak_heap': peak_heap,
+        'rss_growth': max(0, max_rss_bytes() - baseline_rss),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Peak memory of monitor body inspection for large uploads: buffered vs. streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100', help='Upload sizes in MB, comma separated')
+        parser.add_argument('--content-type', default='text/xml',
+                            help="Content-Type of the uploaded file part (try 'application/octet-stream')")
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',')]
+        context = multiprocessing.get_context('spawn')
+
+        # With Django's default DATA_UPLOAD_MAX_MEMORY_SIZE (2.5 MB) the old
+        # 'buffered' mode gets RequestDataTooBig for big bodies and inspects
+        # nothing at all. The 'no limit' row shows what buffering really costs.
+        cases = (
+            ('buffered', 'buffered', settings.DATA_UPLOAD_MAX_MEMORY_SIZE),
+            ('buffered (no limit)', 'buffered', None),
+            ('stream', 'stream', settings.DATA_UPLOAD_MAX_MEMORY_SIZE),
+        )
+        self.stdout.write(f"{'mode':<22}{'upload':>8}{'time':>9}{'peak heap':>12}{'RSS growth':>12}")
+        for label, mode, upload_limit in cases:
+            for size_mb in sizes:
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_case, (mode, size_mb, options['content_type'], upload_limit))
+                self.stdout.write(
+                    f"{label:<22}{size_mb:>6}MB{result['seconds']:>8.2f}s"
+                    f"{result['peak_heap'] / 2**20:>10.1f}MB{result['rss_growth'] / 2**20:>10.1f}MB"
+                )
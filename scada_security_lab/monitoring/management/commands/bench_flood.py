@@ -0,0 +1,157 @@
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from monitoring.models import AttackLog
+from monitoring.throttle import SUMMARY_ATTACK_TYPE, get_tracker, write_summaries
+from monitoring.writer import get_writer
+
+# What a scanner sends: every request hits a signature and runs a full view
+SCANNER_PATHS = [
+    '/vulnerable/dashboard/?connector=OR&is_locked_out=True',
+    '/vulnerable/login/?username=admin&is_admin=True',
+    '/vulnerable/report/?id=../../etc/passwd',
+    '/vulnerable/dashboard/?name=<script>alert(1)</script>',
+]
+
+SIDES = (
+    # name, attacker threads, throttle on
+    ('no flood', 0, True),
+    ('flood, throttle off', None, False),
+    ('flood, throttle on', None, True),
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'A legitimate client during an attack flood, with and without the monitor throttle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=1000)
+        parser.add_argument('--seconds', type=float, default=10.0, help='Length of each side')
+        parser.add_argument('--attackers', type=int, default=4, help='Attacker threads')
+        parser.add_argument('--rate', type=float, default=400.0,
+                            help='Attack requests per second, all attackers together (as far as the server keeps up)')
+        parser.add_argument('--sources', type=int, default=1,
+                            help='Addresses each attacker rotates through (more = harder to throttle)')
+        parser.add_argument('--path', default='/patched/dashboard/', help='What the legitimate client loads')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_flood_')
+        old_names = create_bench_databases(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('populate_db', devices=options['devices'], logs=0, reports=0, seed=1337)
+            connection.close()
+            results = []
+            # DEBUG off like in production (DEBUG also logs every query);
+            # the views and the monitor print on every request
+            with override_settings(DEBUG=False), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                for name, attackers, throttle in SIDES:
+                    attackers = options['attackers'] if attackers is None else attackers
+                    results.append((name, self.run_side(attackers, throttle, options)))
+        finally:
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"{options['path']} for 1 legitimate client; {options['attackers']} attacker threads x "
+                          f"{options['sources']} address(es) at up to {options['rate']:.0f} req/s; "
+                          f"{options['seconds']:.0f} s per side, {options['devices']} devices\n")
+        self.stdout.write(f"{'side':<22}{'legit req/s':>12}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'attacks sent':>14}{'answered 429':>14}{'log rows':>10}{'summaries':>11}")
+        base = results[0][1]['rate']
+        for name, result in results:
+            self.stdout.write(
+                f"{name:<22}{result['rate']:12.1f}{result['p50'] * 1000:9.1f}{result['p95'] * 1000:9.1f}"
+                f"{result['attacks']:14d}{result['throttled']:14d}{result['rows']:10d}{result['summaries']:11d}"
+            )
+        for name, result in results[1:]:
+            self.stdout.write(f"{name}: legitimate throughput {result['rate'] / base * 100:.0f}% of no flood")
+
+    def run_side(self, attackers, throttle, options):
+        writer = get_writer()
+        writer.flush()
+        rows_before = AttackLog.objects.count()
+        summaries_before = AttackLog.objects.filter(attack_type=SUMMARY_ATTACK_TYPE).count()
+        get_tracker().clear()
+
+        # A test Client builds its middleware chain on its first request, with
+        # the settings of that moment. Some probes end in a 500 (like on a real
+        # server); a Client would re-raise those, in whichever client's thread
+        # the exception signal reaches.
+        with override_settings(MONITOR_THROTTLE_ENABLED=throttle):
+            legit = Client(REMOTE_ADDR='10.20.0.15', raise_request_exception=False)
+            legit.post('/patched/login/', {'username': 'bench'})
+            clients = [Client(raise_request_exception=False) for _ in range(attackers)]
+            for client in clients:
+                client.get('/vulnerable/login/', {'username': 'bench'}, REMOTE_ADDR='192.0.2.1')
+        get_tracker().clear()
+
+        stop = threading.Event()
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def attack(number, client):
+            # Paced like a scanner on the other side of the network: a 429
+            # that comes back fast does not make it send more
+            interval = attackers / options['rate']
+            sent = Counter()
+            addresses = [f"198.51.{100 + number}.{i % 250 + 1}" for i in range(options['sources'])]
+            i = 0
+            next_at = time.perf_counter()
+            try:
+                while not stop.is_set():
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_at = max(next_at + interval, time.perf_counter() - 1.0)
+                    response = client.get(SCANNER_PATHS[i % len(SCANNER_PATHS)], REMOTE_ADDR=addresses[i % len(addresses)])
+                    sent[response.status_code] += 1
+                    i += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    statuses.update(sent)
+
+        threads = [threading.Thread(target=attack, args=(number, client)) for number, client in enumerate(clients)]
+        for thread in threads:
+            thread.start()
+        timings = []
+        started = time.perf_counter()
+        while time.perf_counter() - started < options['seconds']:
+            request_started = time.perf_counter()
+            assert legit.get(options['path']).status_code == 200
+            timings.append(time.perf_counter() - request_started)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        # Summaries of sources still blocked, then everything queued
+        write_summaries(get_tracker().due_summaries(time.monotonic(), force=True))
+        writer.flush()
+        return {
+            'rate': len(timings) / elapsed,
+            'p50': statistics.median(timings),
+            'p95': percentile(timings, 0.95),
+            'attacks': sum(statuses.values()),
+            'throttled': statuses[429],
+            'rows': AttackLog.objects.count() - rows_before,
+            'summaries': AttackLog.objects.filter(attack_type=SUMMARY_ATTACK_TYPE).count() - summaries_before,
+        }
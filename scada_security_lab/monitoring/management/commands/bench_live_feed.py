@@ -0,0 +1,121 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from monitoring.feed import broker
+from monitoring.models import AttackLog
+from monitoring.signals import attacks_logged
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Load test for the live SOC feed: many idle SSE subscribers, a steady event rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=300)
+        parser.add_argument('--rate', type=float, default=20.0, help='Attack events per second')
+        parser.add_argument('--seconds', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['subscribers'], options['rate'], options['seconds']))
+
+    async def run(self, subscribers, rate, seconds):
+        # Drive the real ASGI application in-process: same view, middleware
+        # and broker as production, minus the sockets.
+        from scada_system.asgi import application
+
+        latencies = []
+        received = [0]
+        stop = asyncio.Event()
+
+        async def subscriber(number):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http',
+                'path': '/monitoring/stream/', 'raw_path': b'/monitoring/stream/',
+                'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream')],
+                'client': ('127.0.0.1', 40000 + number), 'server': ('testserver', 80),
+            }
+            sent_body = False
+
+            async def receive():
+                nonlocal sent_body
+                if not sent_body:
+                    sent_body = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await stop.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] != 'http.response.body':
+                    return
+                now = time.time()
+                for line in message.get('body', b'').decode().splitlines():
+                    if line.startswith('data: '):
+                        event = json.loads(line[6:])
+                        latencies.append(now - datetime.fromisoformat(event['timestamp']).timestamp())
+                        received[0] += 1
+
+            await application(scope, receive, send)
+
+        self.stdout.write(f"Connecting {subscribers} subscribers...")
+        tasks = [asyncio.create_task(subscriber(number)) for number in range(subscribers)]
+        started = time.perf_counter()
+        while broker.subscriber_count() < subscribers:
+            if time.perf_counter() - started > 60:
+                self.stderr.write(self.style.ERROR(f"Only {broker.subscriber_count()} subscribers connected"))
+                break
+            await asyncio.sleep(0.05)
+        self.stdout.write(f"Connected in {time.perf_counter() - started:.2f}s")
+
+        # Publisher thread: what the AttackLog writer does after a batch
+        publish_times = []
+        published = [0]
+
+        def publisher():
+            interval = 1.0 / rate
+            next_at = time.perf_counter()
+            deadline = next_at + seconds
+            log_id = 10 ** 9
+            while time.perf_counter() < deadline:
+                log_id += 1
+                log = AttackLog(id=log_id, timestamp=timezone.now(), ip_address='10.6.6.6',
+                                endpoint='/vulnerable/login/', attack_type='Auth Bypass',
+                                payload_text='/vulnerable/login/?is_admin=True')
+                before = time.perf_counter()
+                attacks_logged.send(sender=AttackLog, events=[log])
+                publish_times.append(time.perf_counter() - before)
+                published[0] += 1
+                next_at += interval
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        await asyncio.to_thread(thread.join)
+        await asyncio.sleep(1.0)  # let the last events arrive
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        expected = published[0] * subscribers
+        self.stdout.write(f"Events published : {published[0]} ({rate:g}/s for {seconds:g}s)")
+        self.stdout.write(f"Deliveries       : {received[0]} / {expected}")
+        self.stdout.write(f"Publish call     : {statistics.mean(publish_times) * 1e6:.0f} us avg (publisher thread)")
+        self.stdout.write(
+            "Latency          : "
+            f"p50 {percentile(latencies, 0.50) * 1000:.1f} ms, "
+            f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+            f"max {max(latencies, default=0) * 1000:.1f} ms"
+        )
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from monitoring.metrics import registry, render_text
+from monitoring.writer import get_writer
+
+
+class Command(BaseCommand):
+    help = 'Cost of MetricsMiddleware: the same page with and without it, requests interleaved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per side')
+        parser.add_argument('--path', default='/patched/dashboard/')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_metrics_')
+        old_names = create_bench_databases(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('populate_db', devices=options['devices'], logs=0, reports=0, seed=1337)
+            # DEBUG off like in production (DEBUG also logs every query)
+            with override_settings(DEBUG=False), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                results = self.run(options)
+        finally:
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        off, on = results['off'], results['on']
+        self.stdout.write(f"{options['path']}, {options['devices']} devices, {options['requests']} requests per side\n")
+        self.stdout.write(f"{'middleware':<12}{'median ms':>11}{'mean ms':>10}{'p95 ms':>9}")
+        for name, timings in (('off', off), ('on', on)):
+            ordered = sorted(timings)
+            self.stdout.write(f"{name:<12}{statistics.median(timings) * 1000:11.3f}{statistics.mean(timings) * 1000:10.3f}"
+                              f"{ordered[int(len(ordered) * 0.95)] * 1000:9.3f}")
+        overhead = statistics.median(on) / statistics.median(off) - 1
+        self.stdout.write(f"\nOverhead (median): {overhead * 100:+.2f}%  "
+                          f"({(statistics.median(on) - statistics.median(off)) * 1e6:+.0f} us per request)")
+        self.stdout.write(f"Scrape with these series: {results['scrape_ms']:.2f} ms, {results['scrape_bytes']} bytes")
+
+    def run(self, options):
+        without = [name for name in settings.MIDDLEWARE if name != 'monitoring.metrics.MetricsMiddleware']
+        clients = {}
+        # A test Client builds its middleware chain on its first request,
+        # with the settings of that moment. The template and query timers
+        # stay installed for both; outside a measured request they are one
+        # lookup each.
+        with override_settings(MIDDLEWARE=without):
+            clients['off'] = Client()
+            clients['off'].post('/patched/login/', {'username': 'bench'})
+        with override_settings(MIDDLEWARE=['monitoring.metrics.MetricsMiddleware'] + without):
+            clients['on'] = Client()
+            clients['on'].post('/patched/login/', {'username': 'bench'})
+        registry.clear()
+
+        timings = {'off': [], 'on': []}
+        for client in clients.values():
+            for _ in range(50):  # warm up (caches, connection)
+                client.get(options['path'])
+        for i in range(options['requests'] * 2):
+            # Alternate, so drift (other load, CPU clock) hits both sides the same
+            name = ('off', 'on')[i % 2]
+            started = time.perf_counter()
+            clients[name].get(options['path'])
+            timings[name].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        text = render_text()
+        return {**timings, 'scrape_ms': (time.perf_counter() - started) * 1000, 'scrape_bytes': len(text)}
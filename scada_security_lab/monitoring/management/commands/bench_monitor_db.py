@@ -0,0 +1,152 @@
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from core.models import Device
+from monitoring.dedup import fingerprint
+from monitoring.models import AttackLog, AttackPayload
+from monitoring.writer import get_writer
+
+SIDES = (
+    # name, MONITOR_DATABASE, flood writers
+    ('no flood', 'monitoring', 0),
+    ('flood, one database', 'default', None),
+    ('flood, monitoring db', 'monitoring', None),
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def flood(number, rate, batch_size, stop):
+    """
+    One server worker's AttackLog writer during a flood: a batch of new rows
+    per transaction, `rate` rows per second. Plain INSERTs (the SQL
+    bulk_create sends), so the load is the database's and not this
+    process's Python.
+    """
+    connection = connections[router.db_for_write(AttackLog)]
+    quote = connection.ops.quote_name
+    payload_id = AttackPayload.objects.values_list('id', flat=True).first()
+    timestamp_field = AttackLog._meta.get_field('timestamp')
+    columns = ['timestamp', 'last_seen', 'ip_address', 'endpoint', 'attack_type', 'payload_id', 'count']
+    sql = (f"INSERT INTO {quote(AttackLog._meta.db_table)} ({', '.join(map(quote, columns))}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+    interval = batch_size / rate
+    next_at = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        next_at = max(next_at + interval, time.perf_counter() - 1.0)
+        now = timestamp_field.get_db_prep_value(timezone.now(), connection)
+        rows = [(now, now, f"198.51.{100 + number}.{(sent + i) % 250 + 1}", f"/vulnerable/report/{sent + i}/",
+                 'SQL Injection', payload_id, 1) for i in range(batch_size)]
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        sent += batch_size
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Dashboard and device-toggle latency while AttackLog writers flood: one database vs. a monitoring database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=1000)
+        parser.add_argument('--seconds', type=float, default=10.0, help='Length of each side')
+        parser.add_argument('--writers', type=int, default=4, help='Flooding writer processes (server workers)')
+        parser.add_argument('--rate', type=int, default=5000, help='AttackLog rows per second, each writer')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per transaction (MONITOR_LOG_BATCH_SIZE)')
+        parser.add_argument('--toggle-every', type=int, default=5, help='Every Nth request toggles a device (a write)')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_monitor_db_')
+        old_names = create_bench_databases(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('populate_db', devices=options['devices'], logs=0, reports=0, seed=1337)
+            # The "one database" side: the monitoring tables next to the
+            # device tables, like before the router
+            with connections['default'].schema_editor() as editor:
+                for model in apps.get_app_config('monitoring').get_models():
+                    editor.create_model(model)
+            text = '/vulnerable/report/?id=1 UNION SELECT username,password FROM auth_user--'
+            for alias in ('default', 'monitoring'):
+                AttackPayload.objects.using(alias).create(fingerprint=fingerprint(text), text=text)
+            self.device = Device.objects.exclude(name="NUCLEAR-CORE-CONTROLLER").order_by('id').first()
+
+            results = []
+            # DEBUG off like in production; the views and the monitor print on every request
+            with override_settings(DEBUG=False), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                for name, alias, writers in SIDES:
+                    writers = options['writers'] if writers is None else writers
+                    with override_settings(MONITOR_DATABASE=alias):
+                        results.append((name, self.run_side(writers, options)))
+        finally:
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"{options['writers']} writers x {options['rate']} AttackLog rows/s in batches of "
+                          f"{options['batch_size']}; {options['seconds']:.0f} s per side, {options['devices']} devices; "
+                          f"1 in {options['toggle_every']} requests toggles a device\n")
+        self.stdout.write(f"{'side':<22}{'rows/s':>9}{'dashboard p50':>15}{'p95':>8}{'max':>8}"
+                          f"{'toggle p50':>12}{'p95':>8}{'max':>8}")
+        for name, result in results:
+            dashboard, toggle = result['dashboard'], result['toggle']
+            self.stdout.write(
+                f"{name:<22}{result['rows'] / options['seconds']:9.0f}"
+                f"{statistics.median(dashboard) * 1000:15.1f}{percentile(dashboard, 0.95) * 1000:8.1f}{max(dashboard) * 1000:8.1f}"
+                f"{statistics.median(toggle) * 1000:12.1f}{percentile(toggle, 0.95) * 1000:8.1f}{max(toggle) * 1000:8.1f}"
+            )
+        self.stdout.write("(milliseconds)")
+
+    def run_side(self, writers, options):
+        client = Client()
+        client.post('/patched/login/', {'username': 'bench'})
+        client.get('/patched/dashboard/')  # warm up (cache, connection)
+        alias = router.db_for_write(AttackLog)
+        rows_before = AttackLog.objects.using(alias).count()
+
+        # Forked: the children must not share the parent's connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        processes = [context.Process(target=flood, args=(number, options['rate'], options['batch_size'], stop))
+                     for number in range(writers)]
+        for process in processes:
+            process.start()
+        body = json.dumps({'action': 'toggle', 'ids': [self.device.id]})
+        timings = {'dashboard': [], 'toggle': []}
+        started = time.perf_counter()
+        i = 0
+        while time.perf_counter() - started < options['seconds']:
+            i += 1
+            request_started = time.perf_counter()
+            if i % options['toggle_every']:
+                assert client.get('/patched/dashboard/').status_code == 200
+                timings['dashboard'].append(time.perf_counter() - request_started)
+            else:
+                assert client.post('/patched/toggle/bulk/', body, content_type='application/json').status_code == 200
+                timings['toggle'].append(time.perf_counter() - request_started)
+        stop.set()
+        for process in processes:
+            process.join()
+        timings['rows'] = AttackLog.objects.using(alias).count() - rows_before
+        return timings
@@ -0,0 +1,95 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from monitoring import profiling
+from monitoring.dedup import fingerprint
+from monitoring.models import AttackLog, AttackPayload
+from monitoring.writer import get_writer
+
+SIDES = (
+    # name, settings, extra request headers
+    ('profiler off', {'PROFILER_ENABLED': False}, {}),
+    ('on, not selected', {'PROFILER_ENABLED': True, 'PROFILER_URL_PATTERNS': [r'^/vulnerable/upload/']}, {}),
+    ('on, sampled', {'PROFILER_ENABLED': True, 'PROFILER_URL_PATTERNS': []}, {'HTTP_X_PROFILE': '1'}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Cost of the sampling profiler: switched off, on but not selecting the request, and sampling it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per side')
+        parser.add_argument('--path', default='/monitoring/')
+        parser.add_argument('--attacks', type=int, default=20000, help='AttackLog rows to seed')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_profiler_')
+        old_names = create_bench_databases(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('populate_db', devices=200, logs=0, reports=0, seed=1337)
+            # Something for the SOC page to page through
+            rng = random.Random(7)
+            now = timezone.now()
+            text = '/vulnerable/dashboard/?connector=OR'
+            payload = AttackPayload.objects.create(fingerprint=fingerprint(text), text=text)
+            AttackLog.objects.bulk_create([
+                AttackLog(ip_address=f"10.66.{rng.randrange(256)}.{rng.randrange(256)}", endpoint='/vulnerable/dashboard/',
+                          attack_type='SQL Injection', payload=payload,
+                          timestamp=now - timedelta(seconds=rng.randrange(86400)))
+                for _ in range(options['attacks'])
+            ], batch_size=5000)
+            with override_settings(DEBUG=False), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                timings = self.run(options)
+        finally:
+            get_writer().flush()
+            destroy_bench_databases(old_names)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        base = statistics.median(timings['profiler off'])
+        self.stdout.write(f"{options['path']}, {options['requests']} requests per side, interleaved\n")
+        self.stdout.write(f"{'side':<20}{'median ms':>11}{'p95 ms':>9}{'vs off':>9}")
+        for name, values in timings.items():
+            ordered = sorted(values)
+            median = statistics.median(values)
+            self.stdout.write(f"{name:<20}{median * 1000:11.3f}{ordered[int(len(ordered) * 0.95)] * 1000:9.3f}"
+                              f"{(median / base - 1) * 100:+8.2f}%")
+        profiles = profiling.store.all()
+        if profiles:
+            self.stdout.write(f"\nKept {len(profiles)} profiles, slowest {profiles[0].duration * 1000:.1f} ms "
+                              f"with {profiles[0].samples} samples in {len(profiles[0].stacks)} stacks")
+
+    def run(self, options):
+        clients = {}
+        for name, values, headers in SIDES:
+            # The middleware chain (and ProfilerMiddleware's settings) is built on the first request
+            with override_settings(**values):
+                clients[name] = (Client(), headers)
+                clients[name][0].get(options['path'], **headers)
+        profiling.store.clear()
+
+        timings = {name: [] for name in clients}
+        for client, headers in clients.values():
+            for _ in range(20):
+                client.get(options['path'], **headers)
+        names = list(clients)
+        for i in range(options['requests']):
+            # Rotate who goes first: the first request of a round is slower, whoever sends it
+            for name in names[i % len(names):] + names[:i % len(names)]:
+                client, headers = clients[name]
+                started = time.perf_counter()
+                client.get(options['path'], **headers)
+                timings[name].append(time.perf_counter() - started)
+        return timings
@@ -0,0 +1,140 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
+from core.benchdb import create_bench_databases, destroy_bench_databases
+from monitoring.models import AttackLog, AttackPayload
+from monitoring.rescan import rescan_attacks, rescan_file
+from monitoring.signatures import default_signatures
+
+# What a scanner sends, plus the normal traffic around it. {n} keeps every URL distinct.
+ATTACKS = [
+    "/vulnerable/report/?id={n} UNION SELECT username,password FROM auth_user--",
+    "/vulnerable/dashboard/?connector=OR&is_locked_out=True&page={n}",
+    "/vulnerable/dashboard/?name=<script>alert({n})</script>",
+    "/vulnerable/report/?id=../../../../etc/passwd&n={n}",
+    "/vulnerable/diagnostics/?host=10.0.0.{n}; ls -la /",
+    "/vulnerable/login/?username=guest{n}&is_admin=True",
+    "/vulnerable/upload/?x={n}&&id",
+]
+BENIGN = [
+    "/patched/dashboard/?page={n}&sort=name",
+    "/vulnerable/report/?id={n}",
+    "/monitoring/api/logs/?before=2026-10-18T10:00:00.{n:06d}Z",
+    "/static/css/site.css?v={n}",
+    "/patched/diagnostics/?device=PLC-{n}&window=1h",
+]
+
+
+def urls(count, attack_share, seed):
+    rng = random.Random(seed)
+    for n in range(count):
+        templates = ATTACKS if rng.random() < attack_share else BENIGN
+        yield templates[rng.randrange(len(templates))].format(n=n)
+
+
+class Command(BaseCommand):
+    help = 'Offline rescan throughput: a capture file of N requests, then stored payloads reclassified in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payloads', type=int, default=10_000_000, help='Requests in the capture file')
+        parser.add_argument('--db-payloads', type=int, default=1_000_000, help='Stored payloads (one AttackLog row each)')
+        parser.add_argument('--attack-share', type=float, default=0.3)
+        parser.add_argument('--workers', default=None, help='Worker counts to compare, comma separated (default: 1 and one per CPU)')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--naive-sample', type=int, default=20000, help='Rows for the one-save()-per-row comparison')
+
+    def handle(self, *args, **options):
+        cpus = os.cpu_count() or 1
+        workers = sorted({int(w) for w in options['workers'].split(',')} if options['workers'] else {1, cpus})
+        self.stdout.write(f"{cpus} CPU(s), chunks of {options['chunk_size']}, "
+                          f"{options['attack_share']:.0%} of the traffic are attacks\n")
+        workdir = tempfile.mkdtemp(prefix='bench_rescan_')
+        try:
+            if options['payloads']:
+                self.capture(workdir, workers, options)
+            if options['db_payloads']:
+                old_names = create_bench_databases(workdir)
+                try:
+                    self.database(workdir, workers, options)
+                finally:
+                    destroy_bench_databases(old_names)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def capture(self, workdir, workers, options):
+        path = os.path.join(workdir, 'capture.ndjson')
+        started = time.perf_counter()
+        with open(path, 'w') as f:
+            for n, url in enumerate(urls(options['payloads'], options['attack_share'], 1)):
+                f.write(json.dumps({'path': url, 'attack_type': None}) + '\n')
+        self.stdout.write(f"Capture: {options['payloads']:,} NDJSON requests, {os.path.getsize(path) / 1e6:.0f} MB "
+                          f"(written in {time.perf_counter() - started:.0f} s)")
+        for count in workers:
+            report = rescan_file(path, workers=count, chunk_size=options['chunk_size'], checkpoint=None)
+            self.stdout.write(f"  {count} worker(s): {report['seconds']:7.1f} s  {report['lines'] / report['seconds']:10,.0f} requests/s  "
+                              f"{report['changed']:,} classified as attacks")
+        self.stdout.write("")
+
+    def database(self, workdir, workers, options):
+        count = options['db_payloads']
+        alias = router.db_for_write(AttackLog)
+        connection = connections[alias]
+        quote = connection.ops.quote_name
+        now = AttackLog._meta.get_field('timestamp').get_db_prep_value(timezone.now(), connection)
+        payload_sql = (f"INSERT INTO {quote(AttackPayload._meta.db_table)} ({quote('id')}, {quote('fingerprint')}, "
+                       f"{quote('text')}, {quote('first_seen')}) VALUES (%s, %s, %s, %s)")
+        log_sql = (f"INSERT INTO {quote(AttackLog._meta.db_table)} ({quote('timestamp')}, {quote('last_seen')}, "
+                   f"{quote('ip_address')}, {quote('endpoint')}, {quote('attack_type')}, {quote('payload_id')}, {quote('count')}) "
+                   f"VALUES (%s, %s, %s, %s, %s, %s, %s)")
+        started = time.perf_counter()
+        batch_payloads, batch_logs = [], []
+        # Every row was logged under a rule set that is gone: 'Old rule'. The
+        # fingerprint only has to be unique here, the id does.
+        for n, url in enumerate(urls(count, 1.0, 2), 1):
+            batch_payloads.append((n, n, url, now))
+            batch_logs.append((now, now, f"203.0.113.{n % 250 + 1}", url.split('?')[0], 'Old rule', n, 1))
+            if len(batch_payloads) == 20000 or n == count:
+                with transaction.atomic(using=alias), connection.cursor() as cursor:
+                    cursor.executemany(payload_sql, batch_payloads)
+                    cursor.executemany(log_sql, batch_logs)
+                batch_payloads, batch_logs = [], []
+        self.stdout.write(f"Database: {count:,} stored payloads, one AttackLog row each "
+                          f"(inserted in {time.perf_counter() - started:.0f} s)")
+
+        # What a loop over the ORM would do: one scan and one save() per row
+        sample = AttackLog.objects.select_related('payload').order_by('id')[:options['naive_sample']]
+        started = time.perf_counter()
+        rows = 0
+        with transaction.atomic(using=alias):
+            for log in sample:
+                name = default_signatures.match(log.payload.text)
+                if name and name != log.attack_type:
+                    log.attack_type = name
+                    log.save(update_fields=['attack_type'])
+                rows += 1
+        naive = rows / (time.perf_counter() - started)
+        AttackLog.objects.filter(id__lte=options['naive_sample']).update(attack_type='Old rule')
+        self.stdout.write(f"  one save() per row:    {naive:10,.0f} rows/s ({rows:,} rows)")
+
+        checkpoint = os.path.join(workdir, 'checkpoint.json')
+        for number, count_workers in enumerate(workers):
+            if number:
+                AttackLog.objects.update(attack_type='Old rule')
+            # Interrupted half way, then resumed: the second run starts where the first stopped
+            half = (count // options['chunk_size']) // 2
+            first = rescan_attacks(workers=count_workers, chunk_size=options['chunk_size'], checkpoint=checkpoint,
+                                   restart=True, max_chunks=half)
+            second = rescan_attacks(workers=count_workers, chunk_size=options['chunk_size'], checkpoint=checkpoint)
+            seconds = first['seconds'] + second['seconds']
+            self.stdout.write(
+                f"  rescan, {count_workers} worker(s): {second['payloads'] / seconds:10,.0f} payloads/s  "
+                f"{seconds:.1f} s ({first['payloads']:,} before the interruption), "
+                f"{second['rows_changed']:,} rows reclassified, {second['rollup_rows']:,} rollup rows rebuilt"
+            )
+            assert second['payloads'] == count, second
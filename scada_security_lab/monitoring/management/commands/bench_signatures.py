@@ -0,0 +1,59 @@
+import re
+import timeit
+from django.core.management.base import BaseCommand
+from monitoring.signatures import DEFAULT_SIGNATURES, default_signatures
+
+# Typical traffic seen by the middleware: mostly benign navigation, some probes.
+SAMPLES = [
+    "/patched/dashboard/ RAW_BODY: ",
+    "/vulnerable/dashboard/?page=2&sort=name RAW_BODY: ",
+    "/patched/login/ RAW_BODY: csrfmiddlewaretoken=abc123&username=operator",
+    "/vulnerable/report/?id=7 RAW_BODY: ",
+    "/vulnerable/login/?username=hacker&is_admin=True RAW_BODY: ",
+    "/vulnerable/dashboard/?connector=OR&is_locked_out=True RAW_BODY: ",
+    "/vulnerable/ssrf/ RAW_BODY: url=http://127.0.0.1:8000/admin/",
+    "/vulnerable/upload/ RAW_BODY: <!DOCTYPE x [<!ENTITY xxe SYSTEM 'file:///etc/passwd'>]>",
+    "/patched/diagnostics/ RAW_BODY: payload=" + "A" * 4000,
+]
+
+
+def legacy_match(search_space):
+    # The old per-request loop, kept here only as the baseline.
+    signatures = {name: f"(?i){pattern}" for name, pattern, _ in DEFAULT_SIGNATURES}
+    for attack_name, pattern in signatures.items():
+        if re.search(pattern, search_space):
+            return attack_name
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark: compiled single-pass signature engine vs. the old per-pattern loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        # Sanity check first: both engines must classify every sample the same way.
+        for sample in SAMPLES:
+            if legacy_match(sample) != default_signatures.match(sample):
+                self.stderr.write(self.style.ERROR(f"Classification mismatch for: {sample[:60]}"))
+                return
+
+        def run_legacy():
+            for sample in SAMPLES:
+                legacy_match(sample)
+
+        def run_compiled():
+            for sample in SAMPLES:
+                default_signatures.match(sample)
+
+        calls = iterations * len(SAMPLES)
+        legacy = min(timeit.repeat(run_legacy, number=iterations, repeat=3))
+        compiled = min(timeit.repeat(run_compiled, number=iterations, repeat=3))
+
+        self.stdout.write(f"Requests scanned per run: {calls}")
+        self.stdout.write(f"Legacy loop     : {legacy / calls * 1e6:8.2f} us/request")
+        self.stdout.write(f"Compiled ruleset: {compiled / calls * 1e6:8.2f} us/request")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {legacy / compiled:.2f}x"))
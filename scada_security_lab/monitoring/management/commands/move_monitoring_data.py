@@ -0,0 +1,75 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from monitoring.routers import monitoring_database
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Moves AttackLog / AttackPayload / AttackRollup rows written before the monitoring database '
+            'existed from the default database into MONITOR_DATABASE, then drops the old tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', action='store_true', help='Copy only, leave the old tables in place')
+
+    def handle(self, *args, **options):
+        target = monitoring_database()
+        if target == DEFAULT_DB_ALIAS:
+            raise CommandError("MONITOR_DATABASE is the default database, nothing to move.")
+        source = connections[DEFAULT_DB_ALIAS]
+        destination = connections[target]
+        # Payloads before the logs that point to them
+        models = list(apps.get_app_config('monitoring').get_models())
+        present = set(source.introspection.table_names())
+        old = [model for model in models if model._meta.db_table in present]
+        if not old:
+            self.stdout.write("No monitoring tables in the default database, nothing to move.")
+            return
+        if any(model._meta.db_table not in destination.introspection.table_names() for model in models):
+            raise CommandError(f"Run `python manage.py migrate --database {target}` first.")
+
+        with transaction.atomic(using=target):
+            for model in old:
+                self.stdout.write(f"  {model._meta.label}: {self.copy(model, source, destination)} rows")
+            # Keep the ids (AttackLog points to AttackPayload by id), so the
+            # sequences have to start after them (PostgreSQL; SQLite knows)
+            with destination.cursor() as cursor:
+                for sql in destination.ops.sequence_reset_sql(no_style(), old):
+                    cursor.execute(sql)
+
+        if options['keep']:
+            self.stdout.write(self.style.SUCCESS(f"Copied to '{target}', old tables kept."))
+            return
+        with source.schema_editor() as editor:
+            for model in reversed(old):
+                editor.delete_model(model)
+        # So that MONITOR_DATABASE = 'default' + migrate creates them again
+        MigrationRecorder(source).migration_qs.filter(app='monitoring').delete()
+        self.stdout.write(self.style.SUCCESS(f"Moved to '{target}', old tables dropped."))
+
+    def copy(self, model, source, destination):
+        # Column values as stored, no conversion both ways: one SELECT and
+        # one executemany per batch
+        columns = [field.column for field in model._meta.concrete_fields]
+        pk = model._meta.pk.column
+        read = source.ops.quote_name
+        write = destination.ops.quote_name
+        select_sql = (f"SELECT {', '.join(map(read, columns))} FROM {read(model._meta.db_table)} "
+                      f"WHERE {read(pk)} > %s ORDER BY {read(pk)} LIMIT {BATCH_SIZE}")
+        insert_sql = (f"INSERT INTO {write(model._meta.db_table)} ({', '.join(map(write, columns))}) "
+                      f"VALUES ({', '.join(['%s'] * len(columns))})")
+        position = columns.index(pk)
+        copied, last = 0, -1
+        while True:
+            with source.cursor() as cursor:
+                cursor.execute(select_sql, [last])
+                rows = cursor.fetchall()
+            if not rows:
+                return copied
+            with destination.cursor() as cursor:
+                cursor.executemany(insert_sql, rows)
+            copied += len(rows)
+            last = rows[-1][position]
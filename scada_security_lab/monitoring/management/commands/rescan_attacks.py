@@ -0,0 +1,70 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from monitoring.rescan import RescanError, rescan_attacks, rescan_file
+
+
+class Command(BaseCommand):
+    help = ('Runs the current signatures over the stored attack payloads (reclassifies AttackLog) '
+            'or over a capture file (NDJSON / access log, report only)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Scan this NDJSON or access-log file instead of the database')
+        parser.add_argument('--format', choices=('ndjson', 'access'), help='Format of --file (default: guessed)')
+        parser.add_argument('--output', help='With --file: write every request whose type changed here, as NDJSON')
+        parser.add_argument('--workers', type=int, default=None, help='Processes (default: one per CPU)')
+        parser.add_argument('--chunk-size', type=int, default=settings.MONITOR_RESCAN_CHUNK_SIZE)
+        parser.add_argument('--checkpoint', default=str(settings.MONITOR_RESCAN_CHECKPOINT),
+                            help='Progress file an interrupted run resumes from')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint, start from the beginning')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--unmatched', metavar='TYPE',
+                            help='Set attack_type of rows no rule matches any more (default: leave them)')
+        parser.add_argument('--allow-downgrades', action='store_true',
+                            help='Also move rows to a lower-priority rule (or --unmatched) than their current one. '
+                                 'Off by default: the body that matched the higher rule is not stored')
+        parser.add_argument('--progress-every', type=float, default=5.0, help='Seconds between progress lines')
+        parser.add_argument('--json', action='store_true', help='Print the run report as JSON')
+
+    def handle(self, *args, **options):
+        common = dict(workers=options['workers'], chunk_size=options['chunk_size'], checkpoint=options['checkpoint'],
+                      restart=options['restart'], log=self.stdout.write, progress_every=options['progress_every'])
+        try:
+            if options['file']:
+                report = rescan_file(options['file'], fmt=options['format'], output=options['output'], **common)
+            else:
+                if options['output']:
+                    raise CommandError("--output goes with --file")
+                report = rescan_attacks(dry_run=options['dry_run'], unmatched=options['unmatched'],
+                                        downgrade=options['allow_downgrades'], **common)
+        except RescanError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            self.stdout.write(f"\nInterrupted. Run the same command again to resume ({options['checkpoint']}).")
+            return
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+        elif options['file']:
+            self.print_file_report(report)
+        else:
+            self.print_report(report)
+
+    def print_report(self, report):
+        verb = 'would change' if report['dry_run'] else 'changed'
+        for old, new, rows, hits in report['transitions']:
+            self.stdout.write(f"  {old} -> {new}: {rows} rows ({hits} hits)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rescan done in {report['seconds']}s with {report['workers']} worker(s): {report['payloads']} payloads, "
+            f"{report['rows_changed']} AttackLog rows {verb}, {report['rows_kept']} kept (no downgrades), "
+            f"{report['unmatched_payloads']} payloads match no rule, "
+            f"{report['rollup_rows']} rollup rows rebuilt."
+        ))
+
+    def print_file_report(self, report):
+        for old, new, count in report['transitions']:
+            self.stdout.write(f"  {old or '-'} -> {new or '-'}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rescan done in {report['seconds']}s with {report['workers']} worker(s): {report['lines']} requests "
+            f"({report['format']}), {report['changed']} changed, {report['bad_lines']} lines skipped."
+        ))
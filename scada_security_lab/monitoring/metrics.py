@@ -0,0 +1,290 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+# Per-view performance metrics, exposed at /monitoring/metrics in the
+# Prometheus text format.
+#
+# Every thread counts into its own dict (a "shard"), so recording a request
+# takes no lock and threads never wait on each other. The scrape adds the
+# shards up. A scrape can see a request half recorded (count bumped, sum not
+# yet); Prometheus copes with that. When a thread exits its shard is folded
+# into the totals of the finished threads, so a server that keeps replacing
+# worker threads does not keep one shard per thread it ever ran.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'scada_requests_total': ('counter', 'Requests handled, by view, method and status code', None),
+    'scada_request_duration_seconds': ('histogram', 'Time from the first middleware to the response', LATENCY_BUCKETS),
+    'scada_response_size_bytes': ('histogram', 'Response body size (streaming responses not counted)', SIZE_BUCKETS),
+    'scada_db_queries_total': ('counter', 'Database queries run while handling requests', None),
+    'scada_db_query_seconds_total': ('counter', 'Time spent in database queries', None),
+    'scada_monitor_scan_seconds_total': ('counter', 'Time SecurityMonitorMiddleware spent matching signatures', None),
+    'scada_template_render_seconds_total': ('counter', 'Time spent rendering templates', None),
+}
+
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+class RequestSeries:
+    """Running totals of one (view, method, status) in one thread."""
+    __slots__ = ('count', 'duration', 'size', 'queries', 'query_seconds', 'monitor_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.count = 0
+        # Histograms: one count per bucket, then +Inf, then the sum
+        self.duration = [0] * (len(LATENCY_BUCKETS) + 2)
+        self.size = [0] * (len(SIZE_BUCKETS) + 2)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.monitor_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def __add__(self, other):
+        series = RequestSeries()
+        series.count = self.count + other.count
+        series.duration = [a + b for a, b in zip(self.duration, other.duration)]
+        series.size = [a + b for a, b in zip(self.size, other.size)]
+        series.queries = self.queries + other.queries
+        series.query_seconds = self.query_seconds + other.query_seconds
+        series.monitor_seconds = self.monitor_seconds + other.monitor_seconds
+        series.template_seconds = self.template_seconds + other.template_seconds
+        return series
+
+
+class ShardOwner:
+    """Kept in the thread's locals only: it goes away when the thread does."""
+
+
+class Registry:
+    def __init__(self):
+        # Only taken when a thread makes or retires its shard, and to list them
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        # {(view, method, status): RequestSeries} of the threads that exited
+        self._retired = {}
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            owner = self._local.owner = ShardOwner()
+            # Nothing to fold at interpreter exit
+            weakref.finalize(owner, self._retire, shard).atexit = False
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _retire(self, shard):
+        # Runs in the exiting thread, it no longer writes to the shard. The
+        # sums are new objects, so a scrape holding the old ones is unaffected.
+        with self._lock:
+            self._shards = [other for other in self._shards if other is not shard]
+            for key, series in shard.items():
+                retired = self._retired.get(key)
+                self._retired[key] = series if retired is None else retired + series
+
+    def record_request(self, view, method, status, elapsed, size, metrics):
+        """Add one request. Runs on every request: one dict lookup, then in-place updates."""
+        shard = self.shard()
+        series = shard.get((view, method, status))
+        if series is None:
+            series = shard[(view, method, status)] = RequestSeries()
+        series.count += 1
+        series.duration[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        series.duration[-1] += elapsed
+        if size is not None:
+            series.size[bisect_left(SIZE_BUCKETS, size)] += 1
+            series.size[-1] += size
+        series.queries += metrics.queries
+        series.query_seconds += metrics.query_seconds
+        series.monitor_seconds += metrics.monitor_seconds
+        series.template_seconds += metrics.template_seconds
+
+    def collect(self):
+        """{(metric name, labels): number or histogram slots}, all threads added up."""
+        with self._lock:
+            shards = list(self._shards)
+            shards.append(dict(self._retired))
+        totals = {}
+
+        def add(name, labels, value):
+            current = totals.get((name, labels))
+            if isinstance(value, list):
+                totals[(name, labels)] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                totals[(name, labels)] = value if current is None else current + value
+
+        for shard in shards:
+            # dict() copies in one step under the GIL, the owner may keep writing
+            for (view, method, status), series in dict(shard).items():
+                view_label = (('view', view),)
+                add('scada_requests_total', (('view', view), ('method', method), ('status', str(status))), series.count)
+                add('scada_request_duration_seconds', (('view', view), ('method', method)), list(series.duration))
+                add('scada_response_size_bytes', view_label, list(series.size))
+                add('scada_db_queries_total', view_label, series.queries)
+                add('scada_db_query_seconds_total', view_label, series.query_seconds)
+                add('scada_monitor_scan_seconds_total', view_label, series.monitor_seconds)
+                add('scada_template_render_seconds_total', view_label, series.template_seconds)
+        return totals
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+            self._retired.clear()
+
+
+registry = Registry()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def number(value):
+    # repr() keeps every digit, '%g' would round sums to 6 places
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_text(totals=None):
+    """Prometheus text exposition format, version 0.0.4."""
+    totals = registry.collect() if totals is None else totals
+    by_name = {}
+    for (name, labels), value in totals.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name.get(name, ())):
+            if kind != 'histogram':
+                lines.append(f"{name}{format_labels(labels)} {number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, (('le', number(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {number(value[-1])}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """What one request spent where. The monitor and the template hook add to it."""
+    __slots__ = ('queries', 'query_seconds', 'monitor_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.monitor_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+# The request being handled in this thread / task, for the query timer
+current_request = ContextVar('current_request_metrics', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    # Sits in every connection's execute_wrappers for good: adding and
+    # removing a wrapper per request (connection.execute_wrapper()) costs
+    # more than the rest of the middleware.
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.query_seconds += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate(Template):
+    """Adds its render time to the request's metrics, if the request has some."""
+
+    def render(self, context=None, request=None):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with top-level renders timed (see TEMPLATES
+    in settings.py). Only templates rendered with their request are counted,
+    which render(request, ...) does. Included templates are part of the
+    render that includes them.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class MetricsMiddleware:
+    """
+    Put it FIRST in MIDDLEWARE so the latency covers every other middleware.
+    METRICS_ENABLED = False takes it out of the chain completely.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        # New connections get the query timer when they connect, the ones
+        # already open in this thread now
+        connection_created.connect(install_query_timer, dispatch_uid='monitoring_query_timer')
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        metrics = request.metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        registry.record_request(
+            view=match.view_name if match else 'unmatched',
+            method=request.method if request.method in METHODS else 'other',
+            status=response.status_code,
+            elapsed=elapsed,
+            size=None if response.streaming else len(response.content),
+            metrics=metrics,
+        )
+        return response
@@ -1,48 +1,107 @@
+import time
+from django.conf import settings
+from django.http import HttpResponse
+from .inspection import inspect_body
 from .models import AttackLog
-import re
+from .signatures import default_signatures
+from .throttle import get_tracker, write_summaries
+from .writer import get_writer
 
 class SecurityMonitorMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        # Signatures are compiled ONCE here (server startup), not per request.
+        self.signatures = default_signatures
+        # Attack rows are written in batches by a background thread
+        self.writer = get_writer()
+
+        # Body inspection: 'stream' scans chunk by chunk up to a byte limit,
+        # 'buffered' loads the whole body into memory (old behaviour).
+        self.body_mode = getattr(settings, 'MONITOR_BODY_INSPECTION', 'stream')
+        self.body_limit = getattr(settings, 'MONITOR_BODY_INSPECT_LIMIT', 1024 * 1024)
+        self.body_chunk_size = getattr(settings, 'MONITOR_BODY_CHUNK_SIZE', 64 * 1024)
+        self.body_skip_types = getattr(settings, 'MONITOR_BODY_SKIP_CONTENT_TYPES', ())
+        self.body_overlap = getattr(settings, 'MONITOR_BODY_SCAN_OVERLAP', 256)
+
+        # Sources attacking faster than MONITOR_THROTTLE_MAX_ATTACKS per
+        # MONITOR_THROTTLE_WINDOW_SECONDS get a 429 instead of the view
+        # (throttle.py). The tracker is shared by the whole process.
+        self.throttle = get_tracker() if getattr(settings, 'MONITOR_THROTTLE_ENABLED', True) else None
 
     def __call__(self, request):
+        started = time.perf_counter()
         # 1. Capture the full URL (Query parameters included)
         full_path = request.get_full_path()
-        
-        # 2. Capture POST body (for form submissions)
-        try:
-            body_content = request.body.decode('utf-8', errors='ignore')
-        except:
-            body_content = ""
-
-        # --- DÜZELTME BURADA YAPILDI ---
-        # Eski hatalı kod: search_space = f"{full_path} | {body_content}"
-        # Yeni kod: Araya ' | ' yerine ' RAW_BODY: ' gibi zararsız bir metin koyduk.
-        # Böylece regex kuralı kendi kendisini tetiklemez.
-        search_space = f"{full_path} RAW_BODY: {body_content}"
-
-        # 3. Define Attack Signatures (Regex patterns)
-        signatures = {
-            'Auth Bypass': r"(?i)(superuser=|is_admin=|admin=true)", 
-            'SQL Injection': r"(?i)(UNION\s+SELECT|OR\s+1=1|connector=OR|--)",
-            'XSS / Scripting': r"(?i)(<script>|alert\(|javascript:)",
-            'Path Traversal / XXE': r"(?i)(\.\./|/etc/passwd|<!ENTITY)",
-            # Command Injection pattern looks for | character, so we removed it from search_space construction
-            'Command Injection': r"(?i)(; ls|&&|\|)",
-        }
-
-        # 4. Check for matches
-        for attack_name, pattern in signatures.items():
-            if re.search(pattern, search_space):
-                # LOG THE ATTACK
-                AttackLog.objects.create(
-                    ip_address=request.META.get('REMOTE_ADDR', '127.0.0.1'),
-                    endpoint=request.path,
-                    attack_type=attack_name,
-                    payload=full_path  # Save the URL so you can see what happened
-                )
-                print(f"!!! SECURITY ALERT: {attack_name} detected !!!")
-                break 
+        # Only REMOTE_ADDR: X-Forwarded-For is whatever the attacker wants it to be
+        ip = request.META.get('REMOTE_ADDR', '127.0.0.1')
+
+        # 0. A blocked source gets its 429 here: a URL scan to name what it
+        # sent for the summary row, no body read, no log row, no view
+        if self.throttle is not None:
+            now = time.monotonic()
+            write_summaries(self.throttle.due_summaries(now))
+            if self.throttle.is_blocked(ip, now):
+                best = self.signatures.scan(full_path)
+                self.throttle.suppress(ip, request.path, self.signatures.names[best] if best is not None else None, now)
+                return self.too_many_requests(ip, now)
+
+        best = self.signatures.scan(full_path)
+
+        # 2. Scan the POST body (for form submissions), unless the URL already
+        # hit the top rule. URL and body are scanned separately, so no
+        # separator text can trigger a rule by itself.
+        if best != 0:
+            body_best = self.scan_body(request)
+            if body_best is not None and (best is None or body_best < best):
+                best = body_best
+        # Signature matching time, for /monitoring/metrics (see metrics.py)
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.monitor_seconds += time.perf_counter() - started
+
+        # 3. First rule in the list wins
+        if best is not None:
+            attack_name = self.signatures.names[best]
+            # LOG THE ATTACK (just a queue put, the DB write happens later)
+            self.writer.submit(AttackLog(
+                ip_address=ip,
+                endpoint=request.path,
+                attack_type=attack_name,
+                payload_text=full_path  # Save the URL so you can see what happened
+            ))
+            print(f"!!! SECURITY ALERT: {attack_name} detected !!!")
+
+            # 4. The attack that takes the source over the limit is the last
+            # one to reach a view
+            if self.throttle is not None:
+                now = time.monotonic()
+                blocked, summaries = self.throttle.record_attack(ip, now)
+                write_summaries(summaries)
+                if blocked:
+                    print(f"!!! SECURITY ALERT: {ip} throttled !!!")
+                    return self.too_many_requests(ip, now)
 
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+    def too_many_requests(self, ip, now):
+        response = HttpResponse('Too Many Requests', status=429, content_type='text/plain')
+        response['Retry-After'] = str(self.throttle.retry_after(ip, now))
+        return response
+
+    def scan_body(self, request):
+        if self.body_mode == 'buffered':
+            try:
+                body_content = request.body.decode('utf-8', errors='ignore')
+            except:
+                body_content = ""
+            return self.signatures.scan(body_content)
+        try:
+            return inspect_body(
+                request, self.signatures, self.body_limit,
+                chunk_size=self.body_chunk_size, skip_types=self.body_skip_types,
+                overlap=self.body_overlap,
+            )
+        except Exception as e:
+            print(f"!!! MONITOR: body inspection failed: {e} !!!")
+            return None
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_alter_attacklog_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attacklog',
+            index=models.Index(fields=['timestamp', 'id'], name='attacklog_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attacklog',
+            index=models.Index(fields=['attack_type', 'timestamp', 'id'], name='attacklog_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attacklog',
+            index=models.Index(fields=['ip_address', 'timestamp', 'id'], name='attacklog_ip_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attacklog',
+            index=models.Index(fields=['endpoint', 'timestamp', 'id'], name='attacklog_endpoint_ts_idx'),
+        ),
+    ]
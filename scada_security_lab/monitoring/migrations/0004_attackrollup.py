@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_attacklog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttackRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Per minute'), ('hour', 'Per hour')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('attack_type', 'Attack type'), ('ip_address', 'Attacker IP'), ('endpoint', 'Endpoint')], max_length=20)),
+                ('value', models.CharField(max_length=200)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'dimension', 'bucket', 'value'), name='attackrollup_bucket_unique')],
+            },
+        ),
+    ]
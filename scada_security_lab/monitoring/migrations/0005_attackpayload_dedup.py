@@ -0,0 +1,190 @@
+# Generated by Django 6.0 on 2026-10-18 19:05
+
+import hashlib
+from collections import OrderedDict
+from datetime import timedelta
+from urllib.parse import unquote_plus
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+BATCH_SIZE = 5000
+
+
+# Frozen copies of monitoring.dedup.normalize_payload() and fingerprint() as
+# they were when this migration was written. A later change to those must not
+# change what this migration computes.
+def normalize_payload(text):
+    for _ in range(2):
+        decoded = unquote_plus(text)
+        if decoded == text:
+            break
+        text = decoded
+    return ' '.join(text.casefold().split())
+
+
+def fingerprint(text):
+    digest = hashlib.blake2b(normalize_payload(text).encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def batches(logs, fields):
+    # In (timestamp, id) order, the SOC index; one batch in memory at a time
+    rows = logs.order_by('timestamp', 'id').values_list('id', 'timestamp', *fields)
+    batch = list(rows[:BATCH_SIZE])
+    while batch:
+        yield batch
+        last_id, last_timestamp = batch[-1][0], batch[-1][1]
+        batch = list(rows.filter(Q(timestamp__gt=last_timestamp) | Q(timestamp=last_timestamp, id__gt=last_id))[:BATCH_SIZE])
+
+
+def execute_many(schema_editor, sql, params):
+    if params:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def to_payload_table(apps, schema_editor):
+    """
+    Moves every payload text into AttackPayload, and folds repeats (same IP,
+    endpoint, attack type and payload within MONITOR_LOG_DEDUP_WINDOW of the
+    row that opened the window) into that row's count, like the writer does
+    from now on.
+    """
+    AttackLog = apps.get_model('monitoring', 'AttackLog')
+    AttackPayload = apps.get_model('monitoring', 'AttackPayload')
+    db_alias = schema_editor.connection.alias
+    quote = schema_editor.quote_name
+    table = quote(AttackLog._meta.db_table)
+    update_sql = (f"UPDATE {table} SET {quote('payload_id')} = %s, {quote('count')} = %s, "
+                  f"{quote('last_seen')} = %s WHERE {quote('id')} = %s")
+    delete_sql = f"DELETE FROM {table} WHERE {quote('id')} = %s"
+    last_seen_field = AttackLog._meta.get_field('last_seen')
+    window = timedelta(seconds=getattr(settings, 'MONITOR_LOG_DEDUP_WINDOW', 60.0))
+
+    payload_ids = {}  # fingerprint -> AttackPayload id
+    open_rows = OrderedDict()  # key -> [id, window end, count, last seen], oldest window first
+
+    def close(rows):
+        return [(payload_id, count, last_seen_field.get_db_prep_value(last_seen, schema_editor.connection), row_id)
+                for (_, _, _, payload_id), (row_id, _, count, last_seen) in rows]
+
+    for batch in batches(AttackLog.objects.using(db_alias), ['ip_address', 'endpoint', 'attack_type', 'payload_old']):
+        fingerprints = [fingerprint(row[5]) for row in batch]
+        missing = {}
+        for row, fp in zip(batch, fingerprints):
+            if fp not in payload_ids and fp not in missing:
+                missing[fp] = AttackPayload(fingerprint=fp, text=row[5], first_seen=row[1])
+        AttackPayload.objects.using(db_alias).bulk_create(missing.values(), ignore_conflicts=True)
+        payload_ids.update(AttackPayload.objects.using(db_alias).filter(fingerprint__in=list(missing)).values_list('fingerprint', 'id'))
+
+        merged = []
+        for (row_id, timestamp, ip_address, endpoint, attack_type, _), fp in zip(batch, fingerprints):
+            # Rows come in time order: every window that ended is final
+            closed = []
+            while open_rows:
+                key, entry = next(iter(open_rows.items()))
+                if entry[1] > timestamp:
+                    break
+                closed.append((key, open_rows.pop(key)))
+            execute_many(schema_editor, update_sql, close(closed))
+
+            key = (ip_address, endpoint, attack_type, payload_ids[fp])
+            entry = open_rows.get(key)
+            if entry is not None:
+                entry[2] += 1
+                entry[3] = timestamp
+                merged.append((row_id,))
+            else:
+                open_rows[key] = [row_id, timestamp + window, 1, timestamp]
+        execute_many(schema_editor, delete_sql, merged)
+    execute_many(schema_editor, update_sql, close(list(open_rows.items())))
+
+
+def to_payload_column(apps, schema_editor):
+    """
+    Puts the payload text back on every row, and gives each folded repeat
+    its own row again (timestamps spread between the first and last hit).
+    """
+    AttackLog = apps.get_model('monitoring', 'AttackLog')
+    AttackPayload = apps.get_model('monitoring', 'AttackPayload')
+    db_alias = schema_editor.connection.alias
+    quote = schema_editor.quote_name
+    table = quote(AttackLog._meta.db_table)
+    execute_many(schema_editor, (
+        f"UPDATE {table} SET {quote('payload_old')} = %s WHERE {quote('payload_id')} = %s"
+    ), list(AttackPayload.objects.using(db_alias).values_list('text', 'id').iterator()))
+
+    repeats = []
+    last_id = 0
+    while True:
+        folded = list(AttackLog.objects.using(db_alias).filter(id__gt=last_id, count__gt=1).order_by('id')[:BATCH_SIZE])
+        if not folded:
+            break
+        last_id = folded[-1].id
+        for log in folded:
+            step = (log.last_seen - log.timestamp) / (log.count - 1)
+            repeats.extend(
+                AttackLog(timestamp=log.timestamp + step * i, last_seen=log.timestamp + step * i, count=1,
+                          ip_address=log.ip_address, endpoint=log.endpoint, attack_type=log.attack_type,
+                          payload_id=log.payload_id, payload_old=log.payload_old)
+                for i in range(1, log.count)
+            )
+        AttackLog.objects.using(db_alias).bulk_create(repeats, batch_size=BATCH_SIZE)
+        repeats = []
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_attackrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttackPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.BigIntegerField(unique=True)),
+                ('text', models.TextField()),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='attacklog',
+            old_name='payload',
+            new_name='payload_old',
+        ),
+        migrations.AlterField(
+            model_name='attacklog',
+            name='payload_old',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='attacklog',
+            name='payload',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='logs', to='monitoring.attackpayload'),
+        ),
+        migrations.AddField(
+            model_name='attacklog',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='attacklog',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(to_payload_table, to_payload_column),
+        migrations.AlterField(
+            model_name='attacklog',
+            name='payload',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='logs', to='monitoring.attackpayload'),
+        ),
+        migrations.RemoveField(
+            model_name='attacklog',
+            name='payload_old',
+        ),
+    ]
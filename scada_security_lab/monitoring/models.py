@@ -1,11 +1,78 @@
 from django.db import models
+from django.utils import timezone
+
+class AttackPayload(models.Model):
+    """
+    One distinct attack payload. The same sqlmap probe sent 10000 times is
+    stored once; AttackLog rows point to it (see dedup.py).
+    """
+    # 64-bit hash of the normalized text (decoded, lower case, spaces collapsed)
+    fingerprint = models.BigIntegerField(unique=True)
+    text = models.TextField() # The payload as it was first seen
+    first_seen = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.text
 
 class AttackLog(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the attack is DETECTED. Rows are written later in batches
+    # (see writer.py), so auto_now_add would record the flush time instead.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField()
     endpoint = models.CharField(max_length=200) # Which page they attacked
     attack_type = models.CharField(max_length=100) # e.g., "SQL Injection"
-    payload = models.TextField() # What they typed (e.g., "UNION SELECT...")
+    payload = models.ForeignKey(AttackPayload, on_delete=models.PROTECT, related_name='logs') # What they typed
+    # The same payload from the same IP on the same endpoint within
+    # MONITOR_LOG_DEDUP_WINDOW seconds of `timestamp` is one row
+    count = models.PositiveIntegerField(default=1)
+    last_seen = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        # The SOC page pages through (timestamp, id) newest first, optionally
+        # filtered by one column. Each filter gets its own composite index.
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='attacklog_ts_id_idx'),
+            models.Index(fields=['attack_type', 'timestamp', 'id'], name='attacklog_type_ts_idx'),
+            models.Index(fields=['ip_address', 'timestamp', 'id'], name='attacklog_ip_ts_idx'),
+            models.Index(fields=['endpoint', 'timestamp', 'id'], name='attacklog_endpoint_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.attack_type} from {self.ip_address}"
+
+    # The monitor creates unsaved rows with payload_text='<the URL>'; the
+    # writer finds (or creates) the AttackPayload when it stores them.
+    @property
+    def payload_text(self):
+        if self.payload_id is None:
+            return getattr(self, '_payload_text', '')
+        return self.payload.text
+
+    @payload_text.setter
+    def payload_text(self, text):
+        self._payload_text = text
+
+class AttackRollup(models.Model):
+    """
+    Pre-aggregated attack counts: one row per (time bucket, dimension, value).
+    e.g. ('minute', 2025-12-23 14:05, 'ip_address', '10.0.0.66') -> 42
+    Updated as events are written (see rollups.py), so analytics never have
+    to GROUP BY the raw AttackLog table.
+    """
+    RESOLUTIONS = [('minute', 'Per minute'), ('hour', 'Per hour')]
+    DIMENSIONS = [('attack_type', 'Attack type'), ('ip_address', 'Attacker IP'), ('endpoint', 'Endpoint')]
+
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    bucket = models.DateTimeField() # Start of the minute/hour (UTC)
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    value = models.CharField(max_length=200)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index every window query uses (resolution, dimension, bucket range)
+            models.UniqueConstraint(fields=['resolution', 'dimension', 'bucket', 'value'], name='attackrollup_bucket_unique'),
+        ]
 
     def __str__(self):
-        return f"{self.attack_type} from {self.ip_address}"
\ No newline at end of file
+        return f"{self.bucket} {self.dimension}={self.value}: {self.count}"
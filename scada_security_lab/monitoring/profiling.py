@@ -0,0 +1,220 @@
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Opt-in sampling profiler.
+#
+# A profiled request registers its thread with one shared sampler thread,
+# which looks at the thread's Python stack every PROFILER_INTERVAL seconds
+# (sys._current_frames()) and counts each stack it sees. The result is the
+# "collapsed stack" format flamegraph.pl and speedscope read:
+#
+#   django/core/handlers/base.py:_get_response;vulnerable/views.py:vulnerable_upload;... 42
+#
+# Only the PROFILER_KEEP slowest profiles of the last PROFILER_WINDOW_SECONDS
+# are kept. With PROFILER_ENABLED = False the middleware is not even in the
+# chain, and the sampler thread is never started.
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Shorter frame names: paths relative to the project or to site-packages
+PATH_PREFIXES = sorted({os.path.dirname(path) + os.sep for path in sys.path if path.endswith('site-packages')}
+                       | {str(settings.BASE_DIR) + os.sep}, key=len, reverse=True)
+
+
+def frame_name(code):
+    filename = code.co_filename
+    for prefix in PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            if filename.startswith('site-packages' + os.sep):
+                filename = filename[len('site-packages' + os.sep):]
+            break
+    # ';' separates frames and ' ' the count in the collapsed format
+    return f"{filename}:{code.co_name}".replace(';', ':').replace(' ', '_')
+
+
+class Profile:
+    def __init__(self, profile_id, request):
+        self.id = profile_id
+        self.path = request.path
+        self.method = request.method
+        self.view = ''
+        self.status = None
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks = Counter()
+        self._names = {}
+
+    def add(self, frame, max_stacks):
+        self.samples += 1
+        names = []
+        depth = 0
+        while frame is not None and depth < 256:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = frame_name(code)
+            names.append(name)
+            frame = frame.f_back
+            depth += 1
+        names.reverse()
+        stack = ';'.join(names)
+        if stack not in self.stacks and len(self.stacks) >= max_stacks:
+            # A runaway request keeps a bounded profile
+            stack = '[more stacks]'
+        self.stacks[stack] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'path': self.path,
+            'method': self.method,
+            'view': self.view,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 1),
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+        }
+
+
+class Sampler(threading.Thread):
+    """One thread for the whole process. Sleeps on an Event while nothing is profiled."""
+
+    def __init__(self, interval, max_stacks):
+        super().__init__(name='request-profiler', daemon=True)
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.active = {}  # thread id -> Profile
+        self.wake = threading.Event()
+
+    def start_profile(self, thread_id, profile):
+        with self.lock:
+            self.active[thread_id] = profile
+            self.wake.set()
+
+    def stop_profile(self, thread_id):
+        with self.lock:
+            self.active.pop(thread_id, None)
+
+    def run(self):
+        own_id = threading.get_ident()
+        while True:
+            self.wake.wait()
+            with self.lock:
+                if not self.active:
+                    self.wake.clear()
+                    continue
+                active = list(self.active.items())
+            frames = sys._current_frames()
+            for thread_id, profile in active:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own_id:
+                    profile.add(frame, self.max_stacks)
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """The slowest `keep` profiles of the last `window` seconds."""
+
+    def __init__(self, keep, window):
+        self.keep = keep
+        self.window = window
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.ids = itertools.count(1)
+
+    def add(self, profile):
+        with self.lock:
+            horizon = time.time() - self.window
+            profiles = [p for p in self.profiles if p.started_at >= horizon] + [profile]
+            profiles.sort(key=lambda p: p.duration, reverse=True)
+            self.profiles = profiles[:self.keep]
+
+    def all(self):
+        horizon = time.time() - self.window
+        with self.lock:
+            return [p for p in self.profiles if p.started_at >= horizon]
+
+    def get(self, profile_id):
+        return next((p for p in self.all() if p.id == profile_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.profiles = []
+
+
+store = ProfileStore(setting('PROFILER_KEEP', 20), setting('PROFILER_WINDOW_SECONDS', 3600))
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    with _sampler_lock:
+        # A forked worker inherits the object but not the thread
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = Sampler(setting('PROFILER_INTERVAL', 0.005), setting('PROFILER_MAX_STACKS', 5000))
+            _sampler.start()
+        return _sampler
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a request when its path matches one of PROFILER_URL_PATTERNS
+    (regexes, re.search on request.path) or when it carries the
+    PROFILER_HEADER header with the value PROFILER_HEADER_VALUE.
+    """
+
+    def __init__(self, get_response):
+        if not setting('PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        patterns = setting('PROFILER_URL_PATTERNS', [])
+        self.path_regex = re.compile('|'.join(f"(?:{pattern})" for pattern in patterns)) if patterns else None
+        header = setting('PROFILER_HEADER', 'X-Profile')
+        self.header_key = 'HTTP_' + header.upper().replace('-', '_') if header else None
+        self.header_value = setting('PROFILER_HEADER_VALUE', '1')
+
+    def wanted(self, request):
+        if self.path_regex is not None and self.path_regex.search(request.path):
+            return True
+        return self.header_key is not None and request.META.get(self.header_key) == self.header_value
+
+    def __call__(self, request):
+        if not self.wanted(request):
+            return self.get_response(request)
+
+        profile = Profile(next(store.ids), request)
+        sampler = get_sampler()
+        thread_id = threading.get_ident()
+        started = time.perf_counter()
+        sampler.start_profile(thread_id, profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop_profile(thread_id)
+            profile.duration = time.perf_counter() - started
+        match = request.resolver_match
+        profile.view = match.view_name if match else ''
+        profile.status = response.status_code
+        store.add(profile)
+        response['X-Profile-Id'] = str(profile.id)
+        return response
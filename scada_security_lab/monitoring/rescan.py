@@ -0,0 +1,407 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter, deque
+from datetime import datetime
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Max, Min, Sum
+from .models import AttackLog, AttackPayload
+from .rollups import rebuild_rollups
+from .signatures import default_signatures
+from .throttle import SUMMARY_ATTACK_TYPE
+
+# Offline rescan: run the current signatures over what was already seen.
+#
+#   rescan_attacks(): every stored AttackPayload (streamed in id order with
+#       .iterator()), and the AttackLog rows whose attack_type changed get the
+#       new one: one UPDATE per new type and chunk. The attack_type rollups of
+#       the changed time range are rebuilt at the end.
+#   rescan_file(): captured requests, an NDJSON file or a web server access
+#       log. Nothing is written to the database; the report (and --output)
+#       says what the current rules make of every request.
+#
+# Chunks are classified in a process pool. The workers get the SignatureSet
+# when they start (forked: the compiled rules are shared, not rebuilt), and
+# at most 2 chunks per worker are in flight, so a 10M-row source takes as
+# much memory as a few chunks. Results come back in order, so the
+# checkpoint (last payload id / file offset, written after every chunk) is
+# always a point before which everything is done.
+#
+# Payloads are classified on their text as first seen (see dedup.py). The
+# monitor stores the URL only, so what a rescan sees of an attack found in a
+# POST body is its URL. That URL may match no rule ('unmatched') or only a
+# lower-priority one than the body did (SQL Injection in the body, a '|' in
+# the query string). Neither can be told apart from a rule change, so by
+# default a row never moves to a lower-priority rule or to --unmatched while
+# its type is still a current rule: only upgrades and rows of rules that no
+# longer exist change. downgrade=True allows the rest.
+
+NO_MATCH = 255  # rule index in the worker results for "no rule matched"
+
+# "GET /path?query HTTP/1.1" in a common / combined log format line
+ACCESS_LOG_REQUEST = re.compile(rb'"[A-Z]+ (\S+) HTTP/[0-9.]+"')
+# Where an NDJSON line keeps the URL (the first key present wins)
+URL_KEYS = ('path', 'full_path', 'url', 'payload_text', 'payload')
+
+
+class RescanError(ValueError):
+    pass
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def rules_fingerprint(signatures):
+    """Changes whenever a rule, its order or its name changes; a checkpoint is only resumed with the same rules."""
+    digest = hashlib.blake2b(digest_size=8)
+    for name, pattern in zip(signatures.names, signatures.patterns):
+        digest.update(f"{name}\0{pattern}\0".encode())
+    return digest.hexdigest()
+
+
+# --- Workers ---
+
+_signatures = None
+
+
+def _use_signatures(signatures):
+    global _signatures
+    _signatures = signatures
+
+
+def classify_texts(texts):
+    """Best rule index per text, one byte each (NO_MATCH = none)."""
+    scan = _signatures.scan
+    return bytes(NO_MATCH if found is None else found for found in map(scan, texts))
+
+
+def classify_lines(lines, fmt):
+    """
+    Captured requests: {(recorded type, found type): count}, the changed
+    ones as (url, recorded, found), and the number of lines that were not
+    requests. URL and body are scanned like the middleware does.
+    """
+    signatures = _signatures
+    transitions = Counter()
+    changes = []
+    bad = 0
+    for line in lines:
+        body = recorded = None
+        if fmt == 'access':
+            found = ACCESS_LOG_REQUEST.search(line)
+            if found is None:
+                bad += 1
+                continue
+            url = found.group(1).decode('utf-8', 'replace')
+        else:
+            try:
+                entry = json.loads(line)
+                url = next(entry[key] for key in URL_KEYS if isinstance(entry.get(key), str))
+            except (ValueError, TypeError, AttributeError, StopIteration):
+                bad += 1
+                continue
+            body = entry.get('body') if isinstance(entry.get('body'), str) else None
+            recorded = entry.get('attack_type') or None
+        best = signatures.scan(url)
+        if best != 0 and body:
+            body_best = signatures.scan(body)
+            if body_best is not None and (best is None or body_best < best):
+                best = body_best
+        name = None if best is None else signatures.names[best]
+        transitions[(recorded, name)] += 1
+        if name != recorded:
+            changes.append((url, recorded, name))
+    return transitions, changes, bad
+
+
+def classify_stream(chunks, task, workers, signatures):
+    """
+    Yields (key, task(*args) result) for every (key, args) of `chunks`, in
+    order. workers > 1: in a process pool, at most 2 chunks per worker in flight.
+    """
+    if workers <= 1:
+        _use_signatures(signatures)
+        for key, args in chunks:
+            yield key, task(*args)
+        return
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    with context.Pool(workers, initializer=_use_signatures, initargs=(signatures,)) as pool:
+        pending = deque()
+        for key, args in chunks:
+            pending.append((key, pool.apply_async(task, args)))
+            if len(pending) >= workers * 2:
+                key, result = pending.popleft()
+                yield key, result.get()
+        while pending:
+            key, result = pending.popleft()
+            yield key, result.get()
+
+
+# --- Checkpoints ---
+
+class Checkpoint:
+    """Where a rescan stopped: a small JSON file, replaced atomically after every chunk."""
+
+    def __init__(self, path, source, rules):
+        self.path = str(path) if path else None
+        self.source = source
+        self.rules = rules
+        self.state = {}
+
+    def load(self):
+        """The saved state if it belongs to this source and these rules, else {} (start over)."""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get('source') != self.source or state.get('rules') != self.rules:
+            return {}
+        self.state = state
+        return state
+
+    def save(self, **state):
+        if not self.path:
+            return
+        self.state = dict(state, source=self.source, rules=self.rules)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.path)
+
+    def delete(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    """Calls log() at most every `every` seconds with done / total, rate and ETA."""
+
+    def __init__(self, log, total, unit, every=5.0, done=0):
+        self.log = log
+        self.total = total
+        self.unit = unit
+        self.every = every
+        self.started = time.perf_counter()
+        self.start_done = done
+        self.next_at = self.started + every
+
+    def update(self, done, extra='', force=False):
+        now = time.perf_counter()
+        if not force and now < self.next_at:
+            return
+        self.next_at = now + self.every
+        rate = (done - self.start_done) / max(now - self.started, 1e-9)
+        line = f"  {done:,}/{self.total:,} {self.unit} ({done / max(self.total, 1):.0%}), {rate:,.0f}/s"
+        if rate and self.total > done:
+            line += f", ETA {(self.total - done) / rate:.0f} s"
+        self.log(line + (f", {extra}" if extra else ''))
+
+
+# --- Stored attacks ---
+
+def payload_chunks(after, chunk_size, alias):
+    """[(id, text)] lists of `chunk_size` AttackPayload rows with id > after, streamed."""
+    rows = (AttackPayload.objects.using(alias).filter(id__gt=after).order_by('id')
+            .values_list('id', 'text').iterator(chunk_size=chunk_size))
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk, ([text for _, text in chunk],)
+            chunk = []
+    if chunk:
+        yield chunk, ([text for _, text in chunk],)
+
+
+def rescan_attacks(signatures=default_signatures, workers=None, chunk_size=None, checkpoint=None,
+                   restart=False, dry_run=False, unmatched=None, downgrade=False, log=None, progress_every=5.0,
+                   max_chunks=None):
+    """
+    Reclassify stored attacks with `signatures`. Resumes from `checkpoint`
+    (a path) unless restart=True; the checkpoint is removed when the run
+    completes. unmatched='<type>' relabels rows no rule matches any more
+    (default: left as they are). Rows whose type is a higher-priority current
+    rule than the new result are kept (counted in rows_kept) unless
+    downgrade=True. max_chunks stops early, like an interruption.
+    Returns the run report.
+    """
+    log = log or (lambda message: None)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or setting('MONITOR_RESCAN_CHUNK_SIZE', 5000)
+    alias = router.db_for_write(AttackLog)
+    saved = Checkpoint(None if dry_run else checkpoint, f"db:{alias}", rules_fingerprint(signatures))
+    state = {} if restart else saved.load()
+    if state:
+        log(f"Resuming after payload {state['last_id']} ({state['payloads']:,} done)")
+    last_id = state.get('last_id', 0)
+    payloads = state.get('payloads', 0)
+    unmatched_payloads = state.get('unmatched', 0)
+    kept = state.get('kept', 0)
+    transitions = Counter({tuple(key): value for *key, value in state.get('transitions', [])})
+    first, last = state.get('first'), state.get('last')
+
+    started = time.perf_counter()
+    total = payloads + AttackPayload.objects.using(alias).filter(id__gt=last_id).count()
+    progress = Progress(log, total, 'payloads', progress_every, payloads)
+    names = signatures.names
+    finished = True
+    for number, (chunk, found) in enumerate(classify_stream(payload_chunks(last_id, chunk_size, alias),
+                                                            classify_texts, workers, signatures)):
+        if max_chunks is not None and number >= max_chunks:
+            finished = False
+            break
+        by_type = {}
+        for (payload_id, _), index in zip(chunk, found):
+            if index == NO_MATCH:
+                unmatched_payloads += 1
+                if unmatched is None:
+                    continue
+                name = unmatched
+            else:
+                name = names[index]
+            by_type.setdefault(name, []).append(payload_id)
+
+        with transaction.atomic(using=alias):
+            for name, ids in by_type.items():
+                stale = (AttackLog.objects.using(alias).filter(payload_id__in=ids)
+                         .exclude(attack_type=name).exclude(attack_type=SUMMARY_ATTACK_TYPE))
+                # The rules that outrank the new result (all of them for unmatched)
+                higher = names[:names.index(name)] if name in names else names
+                if not downgrade and higher:
+                    kept += stale.filter(attack_type__in=higher).count()
+                    stale = stale.exclude(attack_type__in=higher)
+                for row in stale.values('attack_type').annotate(rows=Count('id'), hits=Sum('count'),
+                                                                 first=Min('timestamp'), last=Max('timestamp')).order_by():
+                    transitions[(row['attack_type'], name, 'rows')] += row['rows']
+                    transitions[(row['attack_type'], name, 'hits')] += row['hits']
+                    first = min(first or row['first'].isoformat(), row['first'].isoformat())
+                    last = max(last or row['last'].isoformat(), row['last'].isoformat())
+                if not dry_run:
+                    stale.update(attack_type=name)
+        payloads += len(chunk)
+        last_id = chunk[-1][0]
+        saved.save(last_id=last_id, payloads=payloads, unmatched=unmatched_payloads, kept=kept, first=first, last=last,
+                   transitions=[[*key, value] for key, value in transitions.items()])
+        progress.update(payloads, f"{sum(v for k, v in transitions.items() if k[2] == 'rows'):,} rows reclassified")
+
+    rollup_rows = 0
+    if finished:
+        progress.update(payloads, force=True)
+        if first and not dry_run:
+            # Only the attack_type counts moved; the other dimensions are unchanged
+            rollup_rows = rebuild_rollups(datetime.fromisoformat(first), datetime.fromisoformat(last),
+                                          dimensions=('attack_type',))
+        saved.delete()
+    return {
+        'finished': finished,
+        'dry_run': dry_run,
+        'payloads': payloads,
+        'unmatched_payloads': unmatched_payloads,
+        'rows_changed': sum(value for key, value in transitions.items() if key[2] == 'rows'),
+        'rows_kept': kept,
+        'transitions': sorted(((old, new, transitions[(old, new, 'rows')], transitions[(old, new, 'hits')])
+                               for old, new, kind in transitions if kind == 'rows'), key=lambda t: -t[2]),
+        'rollup_rows': rollup_rows,
+        'seconds': round(time.perf_counter() - started, 3),
+        'workers': workers,
+    }
+
+
+# --- Captured requests ---
+
+def detect_format(path):
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                return 'ndjson' if line.lstrip().startswith(b'{') else 'access'
+    return 'ndjson'
+
+
+def line_chunks(f, chunk_size, fmt):
+    """([lines], offset after them) for `chunk_size` lines at a time from f's position."""
+    while True:
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+                if len(lines) == chunk_size:
+                    break
+        if not lines:
+            return
+        yield f.tell(), (lines, fmt)
+
+
+def rescan_file(path, signatures=default_signatures, fmt=None, workers=None, chunk_size=None, checkpoint=None,
+                restart=False, output=None, log=None, progress_every=5.0, max_chunks=None):
+    """
+    Run `signatures` over a capture (NDJSON or access log).
+    `output` (a path) gets one NDJSON line per request whose type differs
+    from the recorded one (or, without a recorded type, that matched).
+    Resumes from `checkpoint` like rescan_attacks().
+    """
+    if not os.path.isfile(path):
+        raise RescanError(f"No such file: {path}")
+    log = log or (lambda message: None)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or setting('MONITOR_RESCAN_CHUNK_SIZE', 5000)
+    fmt = fmt or detect_format(path)
+    stat = os.stat(path)
+    saved = Checkpoint(checkpoint, f"file:{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}",
+                       rules_fingerprint(signatures))
+    state = {} if restart else saved.load()
+    if state:
+        log(f"Resuming at byte {state['offset']:,} ({state['lines']:,} requests done)")
+    offset = state.get('offset', 0)
+    lines = state.get('lines', 0)
+    bad = state.get('bad', 0)
+    changed = state.get('changed', 0)
+    transitions = Counter({tuple(key): value for *key, value in state.get('transitions', [])})
+
+    started = time.perf_counter()
+    # Progress in bytes: the number of lines is not known up front
+    progress = Progress(log, stat.st_size, 'bytes', progress_every, offset)
+    finished = True
+    out = open(output, 'a' if state else 'w') if output else None
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for number, (end, (found, changes, chunk_bad)) in enumerate(
+                    classify_stream(line_chunks(f, chunk_size, fmt), classify_lines, workers, signatures)):
+                if max_chunks is not None and number >= max_chunks:
+                    finished = False
+                    break
+                transitions.update(found)
+                bad += chunk_bad
+                lines += sum(found.values()) + chunk_bad
+                changed += len(changes)
+                if out is not None:
+                    out.writelines(json.dumps({'url': url, 'recorded': recorded, 'found': name}) + '\n'
+                                   for url, recorded, name in changes)
+                    out.flush()
+                offset = end
+                saved.save(offset=offset, lines=lines, bad=bad, changed=changed,
+                           transitions=[[*key, value] for key, value in transitions.items()])
+                progress.update(offset, f"{lines:,} requests, {changed:,} changed")
+    finally:
+        if out is not None:
+            out.close()
+    if finished:
+        saved.delete()
+    return {
+        'finished': finished,
+        'format': fmt,
+        'lines': lines,
+        'bad_lines': bad,
+        'changed': changed,
+        'transitions': sorted(((old, new, count) for (old, new), count in transitions.items()), key=lambda t: -t[2]),
+        'seconds': round(time.perf_counter() - started, 3),
+        'workers': workers,
+    }
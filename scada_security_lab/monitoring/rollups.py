@@ -0,0 +1,148 @@
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from django.db import connections, router, transaction
+from django.db.models import Max, Sum
+from django.db.models.functions import Trunc
+from django.dispatch import receiver
+from .models import AttackLog, AttackRollup
+from .signals import attacks_logged
+
+RESOLUTIONS = ('minute', 'hour')
+DIMENSIONS = ('attack_type', 'ip_address', 'endpoint')
+BUCKET_SIZE = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1)}
+
+
+def bucket_start(timestamp, resolution):
+    """Floor a timestamp to the start of its minute/hour, in UTC."""
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def count_events(logs):
+    """
+    {(resolution, bucket, dimension, value): count} for a batch of AttackLog
+    rows. A repeat folded into a row (dedup.py) is counted in the bucket of
+    the row's first hit, not its own: only that timestamp is stored, so it is
+    where rebuild_rollups() counts it too, and a rebuild gives the same buckets.
+    """
+    counts = Counter()
+    for log in logs:
+        timestamp = getattr(log, 'row_timestamp', log.timestamp)
+        for resolution in RESOLUTIONS:
+            bucket = bucket_start(timestamp, resolution)
+            for dimension in DIMENSIONS:
+                counts[(resolution, bucket, dimension, getattr(log, dimension))] += 1
+    return counts
+
+
+def save_counts(counts, replace=False):
+    """
+    Upsert rollup rows. By default counts are ADDED to what is already
+    stored (incremental updates); replace=True overwrites them (backfill).
+
+    The ORM cannot express "count = count + excluded.count" in an upsert, so
+    this is one raw INSERT ... ON CONFLICT statement (SQLite 3.24+ and
+    PostgreSQL), executed once per batch.
+    """
+    if not counts:
+        return
+    connection = connections[router.db_for_write(AttackRollup)]
+    quote = connection.ops.quote_name
+    table = quote(AttackRollup._meta.db_table)
+    count = quote('count')
+    new_value = f"excluded.{count}" if replace else f"{table}.{count} + excluded.{count}"
+    sql = (
+        f"INSERT INTO {table} ({quote('resolution')}, {quote('bucket')}, {quote('dimension')}, {quote('value')}, {count}) "
+        f"VALUES (%s, %s, %s, %s, %s) "
+        f"ON CONFLICT ({quote('resolution')}, {quote('dimension')}, {quote('bucket')}, {quote('value')}) "
+        f"DO UPDATE SET {count} = {new_value}"
+    )
+    bucket_field = AttackRollup._meta.get_field('bucket')
+    params = [
+        (resolution, bucket_field.get_db_prep_value(bucket, connection), dimension, value[:200], total)
+        for (resolution, bucket, dimension, value), total in counts.items()
+    ]
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def rebuild_rollups(start, end=None, dimensions=DIMENSIONS, chunk=timedelta(hours=24), log=None):
+    """
+    Recount the rollups of `dimensions` from AttackLog, from `start` to `end`
+    (whole hours, so every minute and hour bucket is rebuilt completely).
+    The old rows of those buckets go first; end=None means up to the newest
+    event and everything after it. Returns the number of rollup rows written.
+    """
+    log = log or (lambda message: None)
+    start = bucket_start(start, 'hour')
+    stale = AttackRollup.objects.filter(bucket__gte=start, dimension__in=dimensions)
+    if end is None:
+        end = AttackLog.objects.aggregate(last=Max('timestamp'))['last'] or start
+    else:
+        stale = stale.filter(bucket__lt=bucket_start(end, 'hour') + BUCKET_SIZE['hour'])
+    deleted, _ = stale.delete()
+    log(f"Cleared {deleted} rollup rows from {start:%Y-%m-%d %H:%M} UTC")
+
+    written = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = chunk_start + chunk
+        rows = AttackLog.objects.filter(timestamp__gte=chunk_start, timestamp__lt=chunk_end)
+        counts = Counter()
+        # The database does the GROUP BY, one query per resolution/dimension.
+        # A row holds `count` hits (repeats are folded, see dedup.py), all
+        # counted in the bucket of its first one, like count_events() does.
+        for resolution in RESOLUTIONS:
+            for dimension in dimensions:
+                grouped = (
+                    rows.annotate(bucket=Trunc('timestamp', resolution, tzinfo=dt_timezone.utc))
+                    .values('bucket', dimension).annotate(total=Sum('count')).order_by()
+                )
+                for row in grouped.iterator():
+                    counts[(resolution, row['bucket'], dimension, row[dimension])] += row['total']
+        # replace=True: idempotent, safe to run twice
+        save_counts(counts, replace=True)
+        written += len(counts)
+        log(f"  {chunk_start:%Y-%m-%d %H:%M} .. {chunk_end:%Y-%m-%d %H:%M}: {len(counts)} rollup rows")
+        chunk_start = chunk_end
+    return written
+
+
+@receiver(attacks_logged, sender=AttackLog)
+def roll_up(sender, events, **kwargs):
+    # Runs on the AttackLog writer thread, once per written batch
+    save_counts(count_events(events))
+
+
+# --- Queries (cost depends on the window, not on total history) ---
+
+def resolution_for(window):
+    # Minute buckets up to 6 hours (at most 360 buckets), hour buckets above
+    return 'minute' if window <= timedelta(hours=6) else 'hour'
+
+
+def window_rollups(since, resolution, dimension):
+    return AttackRollup.objects.filter(
+        resolution=resolution, dimension=dimension, bucket__gte=bucket_start(since, resolution),
+    )
+
+
+def top_values(dimension, since, resolution, limit=10):
+    """e.g. top attacker IPs since a point in time: [{'value': ..., 'total': ...}]"""
+    return list(
+        window_rollups(since, resolution, dimension)
+        .values('value').annotate(total=Sum('count')).order_by('-total', 'value')[:limit]
+    )
+
+
+def timeline(since, resolution):
+    """Total attacks per bucket: [{'bucket': ..., 'total': ...}], oldest first."""
+    # Every event is counted exactly once per dimension, so summing any one
+    # dimension gives the total.
+    return list(
+        window_rollups(since, resolution, 'attack_type')
+        .values('bucket').annotate(total=Sum('count')).order_by('bucket')
+    )
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# The monitoring app (AttackLog, AttackPayload, AttackRollup) lives in its own
+# database, MONITOR_DATABASE. During an attack flood the AttackLog writer
+# commits every second; with one SQLite file those commits and the dashboard
+# requests queue on the same write lock and WAL. With two files they never
+# meet. Nothing in monitoring points to a core or auth table, so no query
+# has to join across the two.
+
+
+def monitoring_database():
+    """The alias the monitoring app uses ('default' when MONITOR_DATABASE is not configured)."""
+    alias = getattr(settings, 'MONITOR_DATABASE', 'monitoring')
+    return alias if alias in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+class MonitoringRouter:
+    app_label = 'monitoring'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return monitoring_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        mine = (obj1._meta.app_label == self.app_label, obj2._meta.app_label == self.app_label)
+        if any(mine):
+            return all(mine)
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = monitoring_database()
+        if alias == DEFAULT_DB_ALIAS:
+            return None  # one database for everything
+        if app_label == self.app_label:
+            return db == alias
+        if db == alias:
+            return False  # no auth / core / session tables in the monitoring file
+        return None
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent after a batch of AttackLog rows has been written to the database.
+# bulk_create() does not send post_save, so anything that must react to new
+# attack events (live feeds, counters, ...) should listen here instead.
+# Arguments: sender=AttackLog, events=[AttackLog, ...], one per detected
+# attack. A repeat that was added to an existing row (dedup.py) carries that
+# row's id, so several events can share an id; event.row is the row itself.
+attacks_logged = Signal()
@@ -0,0 +1,93 @@
+import re
+
+# Attack Signatures: (name, regex pattern, literal tokens)
+# ORDER MATTERS: if a request matches several rules, the first rule in this
+# list wins. This is the same classification the old dict loop produced.
+#
+# The literal tokens are a cheap prefilter: lowercase strings, at least one of
+# them MUST appear in any text the regex can match. Keep them in sync when
+# you edit a pattern.
+DEFAULT_SIGNATURES = (
+    ('Auth Bypass', r"(superuser=|is_admin=|admin=true)",
+     ('superuser=', 'is_admin=', 'admin=true')),
+    ('SQL Injection', r"(UNION\s+SELECT|OR\s+1=1|connector=OR|--)",
+     ('union', '1=1', 'connector=or', '--')),
+    ('XSS / Scripting', r"(<script>|alert\(|javascript:)",
+     ('<script>', 'alert(', 'javascript:')),
+    ('Path Traversal / XXE', r"(\.\./|/etc/passwd|<!ENTITY)",
+     ('../', '/etc/passwd', '<!entity')),
+    # Command Injection pattern looks for | character, so the middleware never
+    # puts a pipe into the text it scans.
+    ('Command Injection', r"(; ls|&&|\|)",
+     ('; ls', '&&', '|')),
+)
+
+
+class SignatureSet:
+    """
+    Compiled ruleset, built once at startup and shared by every request.
+
+    1. Prefilter: lowercase the text once and look for the literal tokens with
+       plain substring search (C speed). Benign traffic stops here.
+    2. Only the rules whose tokens were seen go into ONE combined regex. Each
+       rule is a named group inside a zero-width lookahead:
+           (?=(?P<r0>...)|(?P<r3>...))
+       The lookahead does not consume text, so a single pass sees every
+       position where any candidate rule starts, and we keep the best one.
+    """
+
+    def __init__(self, signatures=DEFAULT_SIGNATURES):
+        self.names = tuple(name for name, _, _ in signatures)
+        self.patterns = tuple(pattern for _, pattern, _ in signatures)
+        self.literals = tuple(tuple(tokens) for _, _, tokens in signatures)
+        self._combined = {}
+        self.all_rules = tuple(range(len(self.names)))
+        self.regex = self._regex_for(self.all_rules)
+
+    def _regex_for(self, rules):
+        # At most 2^N subsets, compiled lazily and cached forever.
+        regex = self._combined.get(rules)
+        if regex is None:
+            groups = '|'.join(f"(?P<r{index}>{self.patterns[index]})" for index in rules)
+            regex = re.compile(f"(?={groups})", re.IGNORECASE)
+            self._combined[rules] = regex
+        return regex
+
+    def candidates(self, text):
+        """Rules that could match text, in priority order."""
+        if not text.isascii():
+            # re.IGNORECASE folds some non-ASCII letters onto ASCII ones
+            # (e.g. 'ſ' matches 's'), which str.lower() does not. Skip the
+            # prefilter rather than miss an attack.
+            return self.all_rules
+        lowered = text.lower()
+        return tuple(
+            index for index, tokens in enumerate(self.literals)
+            if any(token in lowered for token in tokens)
+        )
+
+    def scan(self, text):
+        """Return the index of the highest-priority rule found in text, or None."""
+        rules = self.candidates(text)
+        if not rules:
+            return None
+        best = None
+        for found in self._regex_for(rules).finditer(text):
+            index = int(found.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if best == rules[0]:
+                    # Nothing left can beat the best candidate, stop early.
+                    break
+        return best
+
+    def match(self, text):
+        """Return the attack name for text (first rule wins), or None."""
+        index = self.scan(text)
+        if index is None:
+            return None
+        return self.names[index]
+
+
+# Shared, compiled ruleset (the middleware and offline tools use this one)
+default_signatures = SignatureSet()
@@ -0,0 +1,399 @@
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.db import DatabaseError
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from core.models import Device
+from .inspection import BodyScanner
+from .metrics import Registry, RequestMetrics
+from . import feed
+from .dedup import Deduplicator
+from .models import AttackLog, AttackPayload, AttackRollup
+from .rescan import rescan_attacks
+from .rollups import rebuild_rollups, roll_up
+from .routers import MonitoringRouter
+from .signatures import SignatureSet, default_signatures
+from .views import decode_cursor, encode_cursor, newer_rows, older_page
+from .writer import AttackLogWriter
+
+
+class SignatureTests(SimpleTestCase):
+    def test_first_rule_in_the_list_wins(self):
+        # SQL Injection ('--') and Command Injection ('|') both match
+        self.assertEqual(default_signatures.match("/x?a=1|2&b=--"), 'SQL Injection')
+        # Auth Bypass is first, wherever it is in the text
+        self.assertEqual(default_signatures.match("/x?q=<script>&is_admin=1"), 'Auth Bypass')
+        self.assertEqual(default_signatures.match("/x?host=1.2.3.4; ls"), 'Command Injection')
+
+    def test_case_insensitive(self):
+        self.assertEqual(default_signatures.match("/x?q=1 union   select 2"), 'SQL Injection')
+
+    def test_benign_text_matches_nothing(self):
+        self.assertIsNone(default_signatures.match("/patched/dashboard/?page=2&sort=name"))
+        self.assertIsNone(default_signatures.scan(""))
+
+    def test_non_ascii_text_skips_the_prefilter(self):
+        # 'ſ' (long s) folds onto 's' under re.IGNORECASE but not under str.lower()
+        text = "/x?q=1 UNION ſELECT 2"
+        self.assertEqual(default_signatures.candidates(text), default_signatures.all_rules)
+        self.assertEqual(default_signatures.match(text), 'SQL Injection')
+        self.assertEqual(default_signatures.match("/x?name=Müller<script>"), 'XSS / Scripting')
+
+    def test_prefilter_only_keeps_rules_whose_tokens_appear(self):
+        signatures = SignatureSet()
+        self.assertEqual(signatures.candidates("/x?a=../etc"), (3,))
+        self.assertEqual(signatures.candidates("/plain"), ())
+
+
+class BodyScannerTests(SimpleTestCase):
+    def scan(self, body, chunk_size=64 * 1024, content_type='application/x-www-form-urlencoded', **options):
+        scanner = BodyScanner(default_signatures, content_type, **options)
+        for start in range(0, len(body), chunk_size):
+            scanner.feed(body[start:start + chunk_size])
+        return scanner.finish()
+
+    def test_match_split_across_chunks(self):
+        body = b'a' * 100 + b'<script>alert(1)</script>'
+        self.assertEqual(self.scan(body, chunk_size=103), 2)
+
+    def test_utf8_character_split_across_chunks(self):
+        body = 'Müller; ls'.encode()
+        self.assertEqual(self.scan(body, chunk_size=2), 4)
+
+    def test_whitespace_padding_does_not_hide_a_match(self):
+        # The match is far longer than the overlap and crosses two boundaries
+        body = b'x' * 1000 + b'UNION' + b' \t\r\n' * 5000 + b'SELECT 1'
+        self.assertEqual(self.scan(body, chunk_size=4096, overlap=64), 1)
+        self.assertIsNone(self.scan(b'x' * 1000 + b' ' * 20000 + b'SELECT 1', chunk_size=4096, overlap=64))
+
+    def test_overlap_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            BodyScanner(default_signatures, overlap=0)
+
+    def test_multipart_skips_binary_parts_but_not_their_headers(self):
+        body = (b'--B\r\nContent-Disposition: form-data; name="f"; filename="a.bin"\r\n'
+                b'Content-Type: application/octet-stream\r\n\r\n<script>\r\n--B--\r\n')
+        self.assertIsNone(self.scan(body, content_type='multipart/form-data; boundary=B',
+                                    skip_types=('application/octet-stream',)))
+        traversal = body.replace(b'a.bin', b'../../etc/passwd')
+        self.assertEqual(self.scan(traversal, chunk_size=7, content_type='multipart/form-data; boundary=B',
+                                   skip_types=('application/octet-stream',)), 3)
+
+
+class WriterOverflowTests(SimpleTestCase):
+    def writer(self, **options):
+        # No flusher thread: the queue stays full until the test empties it
+        writer = AttackLogWriter(max_queue=2, **options)
+        writer._ensure_started = lambda: None
+        return writer
+
+    def test_drop_refuses_events_once_full(self):
+        writer = self.writer(overflow='drop')
+        self.assertEqual([writer.submit(i) for i in range(4)], [True, True, False, False])
+        self.assertEqual(list(writer.queue.queue), [0, 1])
+        self.assertEqual(writer.stats()['dropped'], 2)
+
+    def test_sample_replaces_the_oldest_without_waiting(self):
+        writer = self.writer(overflow='sample', sample_rate=2, block_timeout=5.0)
+        started = time.monotonic()
+        accepted = [writer.submit(i) for i in range(6)]
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(accepted, [True, True, False, True, False, True])
+        self.assertEqual(list(writer.queue.queue), [3, 5])
+        # 2 refused, 2 evicted
+        self.assertEqual(writer.stats()['dropped'], 4)
+
+    def test_block_waits_for_room(self):
+        writer = self.writer(overflow='block', block_timeout=5.0)
+        writer.submit(0)
+        writer.submit(1)
+        threading.Timer(0.1, writer.queue.get).start()
+        self.assertTrue(writer.submit(2))
+        self.assertEqual(list(writer.queue.queue), [1, 2])
+
+    def test_block_gives_up_after_block_timeout(self):
+        writer = self.writer(overflow='block', block_timeout=0.05)
+        writer.submit(0)
+        writer.submit(1)
+        self.assertFalse(writer.submit(2))
+        self.assertEqual(writer.stats()['dropped'], 1)
+
+    def test_get_writer_reads_the_block_timeout_setting(self):
+        from . import writer as module
+        with self.settings(MONITOR_LOG_BLOCK_TIMEOUT=0.25), mock.patch.object(module, '_writer', None), \
+                mock.patch.object(module.atexit, 'register'):
+            self.assertEqual(module.get_writer().block_timeout, 0.25)
+
+
+class MonitoringRouterTests(SimpleTestCase):
+    router = MonitoringRouter()
+
+    def test_monitoring_tables_only_in_the_monitoring_database(self):
+        allow = self.router.allow_migrate
+        self.assertIs(allow('monitoring', 'monitoring', 'attacklog'), True)
+        self.assertIs(allow('default', 'monitoring', 'attacklog'), False)
+        self.assertIs(allow('monitoring', 'core'), False)
+        self.assertIs(allow('monitoring', 'auth', 'user'), False)
+        # Anything else on default: left to the other routers / Django
+        self.assertIsNone(allow('default', 'core', 'device'))
+
+    def test_one_database_for_everything(self):
+        for alias in ('default', 'not-configured'):
+            with self.settings(MONITOR_DATABASE=alias):
+                self.assertIsNone(self.router.allow_migrate('default', 'monitoring', 'attacklog'))
+                self.assertIsNone(self.router.allow_migrate('default', 'core', 'device'))
+                self.assertEqual(self.router.db_for_write(AttackLog), 'default')
+
+    def test_reads_and_writes_follow_the_app(self):
+        self.assertEqual(self.router.db_for_read(AttackLog), 'monitoring')
+        self.assertEqual(self.router.db_for_write(AttackPayload), 'monitoring')
+        self.assertIsNone(self.router.db_for_read(Device))
+        self.assertIs(self.router.allow_relation(AttackLog(), AttackPayload()), True)
+        self.assertIs(self.router.allow_relation(AttackLog(), Device()), False)
+        self.assertIsNone(self.router.allow_relation(Device(), Device()))
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def record(self, registry, view='v'):
+        registry.record_request(view, 'GET', 200, 0.02, 100, RequestMetrics())
+
+    def test_shards_of_finished_threads_are_folded(self):
+        registry = Registry()
+        self.record(registry)
+        threads = [threading.Thread(target=self.record, args=(registry,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        # Only this thread's shard is still alive
+        self.assertEqual(len(registry._shards), 1)
+        totals = registry.collect()
+        self.assertEqual(totals[('scada_requests_total', (('view', 'v'), ('method', 'GET'), ('status', '200')))], 6)
+        self.assertEqual(totals[('scada_response_size_bytes', (('view', 'v'),))][-1], 600)
+        registry.clear()
+        self.assertEqual(registry.collect(), {})
+
+    def test_templates_rendered_with_a_request_are_timed(self):
+        template = engines['django'].from_string('{% for i in items %}{{ i }}{% endfor %}')
+        request = RequestFactory().get('/')
+        request.metrics = RequestMetrics()
+        self.assertEqual(template.render({'items': range(3)}, request), '012')
+        self.assertGreater(request.metrics.template_seconds, 0)
+        # No metrics on the request (METRICS_ENABLED = False): rendered as usual
+        self.assertEqual(template.render({'items': range(2)}, RequestFactory().get('/')), '01')
+
+
+class KeysetPaginationTests(TestCase):
+    databases = {'default', 'monitoring'}
+
+    @classmethod
+    def setUpTestData(cls):
+        payload = AttackPayload.objects.create(fingerprint=1, text='/x?q=<script>')
+        now = timezone.now()
+        # Pairs of rows share a timestamp: the id breaks the tie
+        cls.logs = [
+            AttackLog.objects.create(timestamp=now - timedelta(seconds=n // 2), ip_address='10.0.0.1',
+                                     endpoint='/x', attack_type='XSS / Scripting', payload=payload)
+            for n in range(7)
+        ]
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = older_page(AttackLog.objects.all(), cursor, 3)
+            seen.extend(rows)
+            if cursor is None:
+                break
+        expected = sorted(self.logs, key=lambda log: (log.timestamp, log.id), reverse=True)
+        self.assertEqual([log.id for log in seen], [log.id for log in expected])
+
+    def test_last_full_page_has_no_next_cursor(self):
+        rows, cursor = older_page(AttackLog.objects.all(), None, 7)
+        self.assertEqual(len(rows), 7)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip_and_garbage(self):
+        log = self.logs[3]
+        self.assertEqual(decode_cursor(encode_cursor(log)), (log.timestamp, log.id))
+        for garbage in ('', 'not-base64!', 'bm9waXBl'):
+            self.assertIsNone(decode_cursor(garbage))
+        # A garbage cursor is the first page
+        self.assertEqual(older_page(AttackLog.objects.all(), 'bm9waXBl', 2)[0],
+                         older_page(AttackLog.objects.all(), None, 2)[0])
+
+    def test_polling_returns_rows_inserted_after_the_cursor(self):
+        newest = max(self.logs, key=lambda log: log.id)
+        self.assertEqual(newer_rows(AttackLog.objects.all(), encode_cursor(newest), 10), [])
+        # A late batch: older timestamp, but inserted later
+        late = AttackLog.objects.create(timestamp=timezone.now() - timedelta(hours=1), ip_address='10.0.0.2',
+                                        endpoint='/x', attack_type='XSS / Scripting', payload=newest.payload)
+        self.assertEqual(newer_rows(AttackLog.objects.all(), encode_cursor(newest), 10), [late])
+        self.assertEqual(len(newer_rows(AttackLog.objects.all(), '', 10)), 8)
+
+
+class RollupTests(TestCase):
+    databases = {'default', 'monitoring'}
+
+    def rollups(self):
+        return sorted(AttackRollup.objects.values_list('resolution', 'bucket', 'dimension', 'value', 'count'))
+
+    def test_rebuild_gives_the_same_buckets_as_the_live_updates(self):
+        start = timezone.now().replace(minute=10, second=50, microsecond=0) - timedelta(hours=2)
+        # Three hits of one probe within the dedup window, across a minute
+        # boundary, and one of another probe
+        hits = [
+            AttackLog(timestamp=start + timedelta(seconds=offset), ip_address='10.0.0.1', endpoint='/x',
+                      attack_type=attack_type, payload_text=text)
+            for offset, attack_type, text in ((0, 'XSS / Scripting', '/x?q=<script>'),
+                                              (15, 'XSS / Scripting', '/x?q=<script>'),
+                                              (30, 'XSS / Scripting', '/x?q=<script>'),
+                                              (20, 'Path Traversal / XXE', '/x?id=../a'))
+        ]
+        Deduplicator().store(hits)
+        roll_up(sender=AttackLog, events=hits)
+        live = self.rollups()
+        # All three repeats in the minute of the first one, like the stored row
+        self.assertIn(('minute', start.replace(second=0), 'attack_type', 'XSS / Scripting', 3), live)
+        self.assertIn(('minute', start.replace(second=0) + timedelta(minutes=1), 'attack_type', 'Path Traversal / XXE', 1), live)
+
+        rebuild_rollups(start - timedelta(hours=1))
+        self.assertEqual(self.rollups(), live)
+
+
+class DeduplicatorTests(TestCase):
+    databases = {'default', 'monitoring'}
+
+    def hits(self, *offsets, text='/x?q=<script>'):
+        start = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+        return [AttackLog(timestamp=start + timedelta(seconds=offset), ip_address='10.0.0.1', endpoint='/x',
+                          attack_type='XSS / Scripting', payload_text=text) for offset in offsets]
+
+    def test_repeats_in_the_window_add_to_one_row(self):
+        dedup = Deduplicator(window=60)
+        first = self.hits(0, 10, 20)
+        dedup.store(first)
+        row = AttackLog.objects.get()
+        self.assertEqual((row.count, row.last_seen), (3, first[-1].timestamp))
+        self.assertEqual({hit.id for hit in first}, {row.id})
+        self.assertTrue(all(hit.row_is_new for hit in first))
+
+        # Later batch: one more on the row, one past its window
+        later = self.hits(30, 61)
+        dedup.store(later)
+        row.refresh_from_db()
+        self.assertEqual((row.count, row.last_seen), (4, later[0].timestamp))
+        self.assertEqual((later[0].id, later[0].row_is_new, later[0].row.count), (row.id, False, 4))
+        self.assertTrue(later[1].row_is_new)
+        self.assertEqual(AttackLog.objects.count(), 2)
+
+    def test_same_probe_spelled_differently_shares_a_payload(self):
+        Deduplicator().store(self.hits(0) + self.hits(5, text='/X?Q=%3Cscript%3E'))
+        self.assertEqual(AttackPayload.objects.count(), 1)
+        self.assertEqual(AttackLog.objects.get().count, 2)
+
+    def test_a_failed_attempt_is_not_counted_twice(self):
+        bulk_create = AttackLog.objects.bulk_create
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise DatabaseError('database is locked')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(AttackLog.objects, 'bulk_create', flaky):
+            Deduplicator().store(self.hits(0, 10, 20))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(AttackLog.objects.get().count, 3)
+
+
+class LiveUpdateTests(TestCase):
+    databases = {'default', 'monitoring'}
+
+    def store(self, dedup, *offsets):
+        start = timezone.now().replace(microsecond=0) - timedelta(seconds=30)
+        hits = [AttackLog(timestamp=start + timedelta(seconds=offset), ip_address='10.0.0.1', endpoint='/x',
+                          attack_type='XSS / Scripting', payload_text='/x?q=<script>') for offset in offsets]
+        dedup.store(hits)
+        return hits
+
+    def test_more_hits_on_a_stored_row_are_published_as_updates(self):
+        dedup = Deduplicator()
+        published = []
+
+        def publish(logs, updated=()):
+            # The broker serializes at once: the row objects keep changing
+            published.append(([log.count for log in logs], [log.count for log in updated]))
+            if updated:
+                published.append(feed.sse_frame(updated[0], 'updated'))
+
+        with mock.patch.object(feed.broker, 'publish', publish):
+            feed.publish_attacks(AttackLog, events=self.store(dedup, 0, 1))
+            feed.publish_attacks(AttackLog, events=self.store(dedup, 2, 3))
+        self.assertEqual(published[:2], [([2], []), ([], [4])])
+        self.assertTrue(published[2].startswith('event: updated\n'))
+        self.assertNotIn('id:', published[2].split('data:')[0])
+
+    def test_polling_returns_rows_that_took_more_hits(self):
+        dedup = Deduplicator()
+        self.store(dedup, 0)
+        row = AttackLog.objects.get()
+        since = timezone.now().isoformat()
+        url = reverse('monitoring_log_api')
+        params = {'after': encode_cursor(row), 'updated_after': since}
+        data = self.client.get(url, params).json()
+        self.assertEqual((data['results'], data['updated']), ([], []))
+
+        self.store(dedup, 29)
+        data = self.client.get(url, params).json()
+        self.assertEqual([(log['id'], log['count']) for log in data['updated']], [(row.id, 2)])
+        self.assertEqual(data['results'], [])
+        self.assertGreaterEqual(data['updated_after'], since)
+        # Garbage timestamp: no updates, the rows still come
+        self.assertIsNone(self.client.get(url, dict(params, updated_after='soon')).json()['updated_after'])
+
+
+class RescanTests(TestCase):
+    databases = {'default', 'monitoring'}
+
+    def setUp(self):
+        rows = (
+            ('SQL Injection', '/x?a=1|2'),  # now only Command Injection: lower priority
+            ('Command Injection', '/x?q=1 UNION SELECT 1'),  # SQL Injection: higher
+            ('Old rule', '/x?a=1|3'),  # a rule that no longer exists
+            ('XSS / Scripting', '/plain'),  # matches nothing now (found in the body)
+            ('Old rule', '/plain2'),
+        )
+        self.logs = []
+        for fp, (attack_type, text) in enumerate(rows):
+            payload = AttackPayload.objects.create(fingerprint=fp, text=text)
+            self.logs.append(AttackLog.objects.create(ip_address='10.0.0.1', endpoint='/x',
+                                                      attack_type=attack_type, payload=payload))
+
+    def types(self):
+        return [log.attack_type for log in AttackLog.objects.order_by('id')]
+
+    def test_rows_never_move_to_a_lower_rule_or_to_unmatched(self):
+        report = rescan_attacks(workers=1, unmatched='Unknown')
+        self.assertEqual((report['rows_changed'], report['rows_kept']), (3, 2))
+        self.assertEqual(self.types(),
+                         ['SQL Injection', 'SQL Injection', 'Command Injection', 'XSS / Scripting', 'Unknown'])
+
+    def test_downgrade_allows_the_rest(self):
+        report = rescan_attacks(workers=1, unmatched='Unknown', downgrade=True)
+        self.assertEqual((report['rows_changed'], report['rows_kept']), (5, 0))
+        self.assertEqual(self.types(),
+                         ['Command Injection', 'SQL Injection', 'Command Injection', 'Unknown', 'Unknown'])
+
+    def test_unmatched_rows_stay_without_a_label(self):
+        report = rescan_attacks(workers=1, downgrade=True)
+        self.assertEqual(report['unmatched_payloads'], 2)
+        self.assertEqual(self.types()[3:], ['XSS / Scripting', 'Old rule'])
+
+    def test_dry_run_changes_nothing(self):
+        report = rescan_attacks(workers=1, unmatched='Unknown', dry_run=True)
+        self.assertEqual(report['rows_changed'], 3)
+        self.assertEqual(self.types(), [log.attack_type for log in self.logs])
@@ -0,0 +1,206 @@
+import atexit
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+from .models import AttackLog
+from .writer import get_writer
+
+# Per-source attack rate tracking for SecurityMonitorMiddleware.
+#
+# Every source (REMOTE_ADDR) gets a sliding-window counter of detected
+# attacks: the count of the current window plus the previous window's count
+# weighted by how much of it still overlaps, so two numbers per source
+# instead of one timestamp per attack. At most `max_sources` sources are
+# tracked; the least recently seen one is evicted first.
+#
+# A source above `limit` attacks per `window` seconds is blocked: its
+# requests get a 429 before any signature or view runs. Each new block of
+# the same source (without a clean window in between) lasts twice as long,
+# up to `max_block`. What a blocked source sends is not logged one row per
+# probe: it is counted, and written as ONE summary AttackLog row per source
+# and window.
+#
+# One tracker per process (get_tracker()), shared by every handler and
+# thread, like the AttackLog writer.
+
+SUMMARY_ATTACK_TYPE = 'Rate Limited'
+
+
+class Source:
+    __slots__ = ('window_start', 'current', 'previous', 'strikes', 'blocked_until',
+                 'suppressed', 'suppressed_since', 'endpoints')
+
+    def __init__(self, now):
+        self.window_start = now
+        self.current = 0
+        self.previous = 0
+        self.strikes = 0
+        self.blocked_until = 0.0
+        self.suppressed = Counter()  # attack type (or 'no signature') -> requests
+        self.suppressed_since = None
+        self.endpoints = Counter()
+
+
+class AttackerTracker:
+    def __init__(self, limit=30, window=10.0, block=60.0, max_block=3600.0, max_sources=10000):
+        self.limit = limit
+        self.window = window
+        self.block = block
+        self.max_block = max_block
+        self.max_sources = max_sources
+        self.lock = threading.Lock()
+        self.sources = OrderedDict()  # ip -> Source, least recently seen first
+        # Read without the lock on every request: ip -> monotonic time the block ends
+        self.blocked = {}
+        self.next_sweep = 0.0
+
+    def _source(self, ip, now, summaries):
+        source = self.sources.get(ip)
+        if source is None:
+            source = self.sources[ip] = Source(now)
+            while len(self.sources) > self.max_sources:
+                old_ip, old = self.sources.popitem(last=False)
+                self.blocked.pop(old_ip, None)
+                if old.suppressed:
+                    summaries.append(self._summary(old_ip, old, now))
+        else:
+            self.sources.move_to_end(ip)
+        # Slide the window
+        elapsed = now - source.window_start
+        if elapsed >= self.window:
+            windows = int(elapsed // self.window)
+            source.previous = source.current if windows == 1 else 0
+            if source.previous == 0 and source.blocked_until <= now:
+                source.strikes = 0  # a clean window: forgiven
+            source.current = 0
+            source.window_start += windows * self.window
+        return source
+
+    def rate(self, source, now):
+        overlap = 1.0 - (now - source.window_start) / self.window
+        return source.current + source.previous * max(0.0, overlap)
+
+    def is_blocked(self, ip, now):
+        until = self.blocked.get(ip)
+        return until is not None and until > now
+
+    def record_attack(self, ip, now):
+        """
+        Count one detected attack. Returns (blocked, summaries): blocked is
+        True when this attack put the source over the limit, summaries are
+        AttackLog field dicts that are due (evicted sources).
+        """
+        summaries = []
+        with self.lock:
+            source = self._source(ip, now, summaries)
+            source.current += 1
+            if source.blocked_until > now:
+                # Another thread blocked it while this request was being scanned
+                return True, summaries
+            blocked = False
+            if self.rate(source, now) > self.limit:
+                source.strikes += 1
+                duration = min(self.block * 2 ** (source.strikes - 1), self.max_block)
+                source.blocked_until = now + duration
+                self.blocked[ip] = source.blocked_until
+                blocked = True
+        return blocked, summaries
+
+    def suppress(self, ip, endpoint, attack_type, now):
+        """A request from a blocked source that got a 429 instead of the view."""
+        with self.lock:
+            if ip not in self.sources:
+                return
+            source = self._source(ip, now, [])
+            if attack_type:
+                # Still counts: a source that keeps probing through its block
+                # has no clean window, so its next block is longer
+                source.current += 1
+            if source.suppressed_since is None:
+                source.suppressed_since = now
+            source.suppressed[attack_type or 'no signature'] += 1
+            source.endpoints[endpoint] += 1
+
+    def retry_after(self, ip, now):
+        return max(1, int(self.blocked.get(ip, now) - now + 0.999))
+
+    def due_summaries(self, now, force=False):
+        """
+        Summary rows for sources whose summary window is over (or all of
+        them with force=True). Cheap to call often: it only does the work
+        once per second.
+        """
+        if not force and now < self.next_sweep:
+            return []
+        summaries = []
+        with self.lock:
+            self.next_sweep = now + 1.0
+            for ip, source in self.sources.items():
+                if source.suppressed and (force or now - source.suppressed_since >= self.window
+                                          or source.blocked_until <= now):
+                    summaries.append(self._summary(ip, source, now))
+            for ip in [ip for ip, until in self.blocked.items() if until <= now]:
+                del self.blocked[ip]
+        return summaries
+
+    def _summary(self, ip, source, now):
+        total = sum(source.suppressed.values())
+        kinds = ', '.join(f"{name} x{count}" for name, count in source.suppressed.most_common())
+        summary = {
+            'ip_address': ip,
+            'endpoint': source.endpoints.most_common(1)[0][0][:200],
+            'attack_type': SUMMARY_ATTACK_TYPE,
+            'payload_text': f"{total} requests answered 429 in {now - source.suppressed_since:.0f} s "
+                            f"(blocked, {source.strikes} strike{'s' if source.strikes != 1 else ''}): {kinds}. "
+                            f"Endpoints: {len(source.endpoints)}",
+        }
+        source.suppressed = Counter()
+        source.endpoints = Counter()
+        source.suppressed_since = None
+        return summary
+
+    def clear(self):
+        with self.lock:
+            self.sources.clear()
+            self.blocked.clear()
+            self.next_sweep = 0.0
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                'sources': len(self.sources),
+                'blocked': sum(1 for until in self.blocked.values() if until > now),
+                'suppressed': sum(sum(source.suppressed.values()) for source in self.sources.values()),
+            }
+
+
+def write_summaries(summaries):
+    writer = get_writer()
+    for summary in summaries:
+        writer.submit(AttackLog(**summary))
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Process-wide tracker, configured from the MONITOR_THROTTLE_* settings."""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                get_writer()
+                _tracker = AttackerTracker(
+                    limit=getattr(settings, 'MONITOR_THROTTLE_MAX_ATTACKS', 30),
+                    window=getattr(settings, 'MONITOR_THROTTLE_WINDOW_SECONDS', 10.0),
+                    block=getattr(settings, 'MONITOR_THROTTLE_BLOCK_SECONDS', 60.0),
+                    max_block=getattr(settings, 'MONITOR_THROTTLE_MAX_BLOCK_SECONDS', 3600.0),
+                    max_sources=getattr(settings, 'MONITOR_THROTTLE_MAX_SOURCES', 10000),
+                )
+                # Summaries still open at shutdown go out before the writer
+                # closes (atexit runs the later registration first)
+                atexit.register(lambda: write_summaries(_tracker.due_summaries(time.monotonic(), force=True)))
+    return _tracker
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.log_viewer, name='monitoring'),
+    path('api/logs/', views.log_api, name='monitoring_log_api'),
+    path('stream/', views.log_stream, name='monitoring_stream'),
+    path('stats/', views.attack_stats, name='monitoring_stats'),
+    path('api/stats/', views.stats_api, name='monitoring_stats_api'),
+    # No trailing slash: the path Prometheus scrapes by default
+    path('metrics', views.metrics, name='monitoring_metrics'),
+    path('profiles/', views.profile_list, name='monitoring_profiles'),
+    path('profiles/<int:profile_id>/collapsed/', views.profile_collapsed, name='monitoring_profile_collapsed'),
+]
\ No newline at end of file
@@ -1,8 +1,362 @@
+import asyncio
+import base64
+import hashlib
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .feed import broker, bumped_rows, sse_frame
 from .models import AttackLog
+from . import metrics as request_metrics, profiling, rollups
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Query string parameter -> AttackLog column (exact match, each one is indexed)
+FILTERS = {
+    'attack_type': 'attack_type',
+    'ip': 'ip_address',
+    'endpoint': 'endpoint',
+}
+
+
+# --- Cursor helpers ---
+# A cursor is the (timestamp, id) of a row, base64 encoded so it can travel
+# in a URL. Paging with "WHERE (timestamp, id) < cursor" costs the same on
+# page 1 and page 1000, unlike OFFSET.
+
+def encode_cursor(log):
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) or None for a missing/garbage cursor."""
+    if not cursor:
+        return None
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def active_filters(request):
+    """{AttackLog column: value} for the filters set in the query string."""
+    active = {}
+    for param, column in FILTERS.items():
+        value = request.GET.get(param, '').strip()
+        if value:
+            active[column] = value
+    return active
+
+
+def filtered_logs(request):
+    """AttackLog queryset with the filters from the query string applied."""
+    active = active_filters(request)
+    return AttackLog.objects.filter(**active).select_related('payload'), active
+
+
+def cached_count(queryset, active_filters):
+    # COUNT(*) is still a scan, so it is cached for a few seconds per filter
+    # combination instead of running on every page view.
+    key = 'monitoring:count:' + hashlib.md5(repr(sorted(active_filters.items())).encode()).hexdigest()
+    timeout = getattr(settings, 'MONITOR_COUNT_CACHE_SECONDS', 10)
+    return cache.get_or_set(key, queryset.count, timeout)
+
+
+def cached_attack_types():
+    # Distinct values for the filter dropdown (uses the attack_type index)
+    return cache.get_or_set(
+        'monitoring:attack_types',
+        lambda: list(AttackLog.objects.order_by('attack_type').values_list('attack_type', flat=True).distinct()),
+        getattr(settings, 'MONITOR_COUNT_CACHE_SECONDS', 10),
+    )
+
+
+def page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return PAGE_SIZE
+
+
+def older_page(queryset, cursor, limit):
+    """One page, newest first, strictly older than the cursor."""
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, log_id = position
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=log_id))
+    # Fetch one extra row to know if there is a next page without a COUNT
+    rows = list(queryset.order_by('-timestamp', '-id')[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def newer_rows(queryset, cursor, limit):
+    """Rows written after the cursor row, oldest first (for polling)."""
+    # No cursor means the page was empty when it was rendered, so every
+    # matching row is new.
+    position = decode_cursor(cursor)
+    last_id = position[1] if position else 0
+    # Events are written in batches after detection, so a late batch can
+    # carry a timestamp older than rows already shown. "New since my last
+    # poll" therefore means inserted later: higher id.
+    return list(queryset.filter(id__gt=last_id).order_by('id')[:limit])
+
+
+def updated_rows(queryset, cursor, since, limit):
+    """
+    Rows up to the cursor row that took more hits after `since` (an ISO
+    timestamp), and the `since` to send next time. ([], None) for a
+    missing or garbage timestamp.
+    """
+    try:
+        since = parse_datetime(since or '')
+    except ValueError:
+        since = None
+    if since is None:
+        return [], None
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    position = decode_cursor(cursor)
+    rows = bumped_rows(queryset.filter(id__lte=position[1] if position else 0), since, limit)
+    return rows, max([since] + [log.last_seen for log in rows])
+
+
+def serialize_log(log):
+    return {
+        'id': log.id,
+        'cursor': encode_cursor(log),
+        'timestamp': log.timestamp.isoformat(),
+        'attack_type': log.attack_type,
+        'endpoint': log.endpoint,
+        'ip_address': log.ip_address,
+        'payload': log.payload_text,
+        'count': log.count,
+        'last_seen': log.last_seen.isoformat(),
+    }
+
+
+# --- Views ---
 
 def log_viewer(request):
-    # Fetch all logs, newest first
-    logs = AttackLog.objects.all().order_by('-timestamp')
-    
-    return render(request, 'monitoring/logs.html', {'logs': logs})
\ No newline at end of file
+    queryset, active_filters = filtered_logs(request)
+    limit = page_size(request)
+    # Newest first, one page at a time
+    logs, next_cursor = older_page(queryset, request.GET.get('before'), limit)
+
+    # Query string for links, without the cursor
+    params = request.GET.copy()
+    params.pop('before', None)
+
+    return render(request, 'monitoring/logs.html', {
+        'logs': logs,
+        'total': cached_count(queryset, active_filters),
+        'filters': {param: request.GET.get(param, '') for param in FILTERS},
+        'attack_types': cached_attack_types(),
+        'next_cursor': next_cursor,
+        # Polling continues from the last INSERTED row (see newer_rows)
+        'newest_cursor': encode_cursor(max(logs, key=lambda log: log.id)) if logs else '',
+        'newest_id': max(log.id for log in logs) if logs else 0,
+        # Polling asks for the rows that took more hits since then
+        'rendered_at': timezone.now().isoformat(),
+        'is_first_page': not request.GET.get('before'),
+        'base_query': params.urlencode(),
+    })
+
+
+def log_api(request):
+    """
+    JSON version of the SOC table.
+      ?before=<cursor>  -> older page (newest first), like the HTML page
+      ?after=<cursor>   -> rows written since that row (oldest first), for polling
+        &updated_after=<ISO timestamp>  -> also 'updated': rows up to the
+                           cursor that took more hits since then, and the
+                           'updated_after' to send next time
+    Plus the same attack_type / ip / endpoint filters and ?limit=.
+    """
+    queryset, active_filters = filtered_logs(request)
+    limit = page_size(request)
+    data = {}
+
+    if 'after' in request.GET:
+        rows = newer_rows(queryset, request.GET['after'], limit)
+        next_cursor = None
+        if 'updated_after' in request.GET:
+            updated, since = updated_rows(queryset, request.GET['after'], request.GET['updated_after'], limit)
+            data['updated'] = [serialize_log(log) for log in updated]
+            data['updated_after'] = since.isoformat() if since else None
+    else:
+        rows, next_cursor = older_page(queryset, request.GET.get('before'), limit)
+
+    return JsonResponse({
+        'results': [serialize_log(log) for log in rows],
+        'next_cursor': next_cursor,
+        'count': cached_count(queryset, active_filters),
+        **data,
+    })
+
+
+# Seconds between keep-alive comments on an idle live feed
+HEARTBEAT_SECONDS = 15
+# Rows replayed to a client that reconnects with Last-Event-ID
+REPLAY_LIMIT = 500
+
+
+async def log_stream(request):
+    """
+    Live SOC feed (Server-Sent Events). New AttackLog rows ('attack') and
+    more hits on rows already sent ('updated') are pushed by the in-process
+    broker, see feed.py. Takes the same filters as the SOC page. A reconnect
+    replays the rows missed, not the updates: those come with the next hit.
+
+    Needs the ASGI server (scada_system/asgi.py): under WSGI every open feed
+    would pin a worker thread forever, so we answer 501 and the page falls
+    back to polling the JSON API.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live feed needs the ASGI server, poll /monitoring/api/logs/ instead.", status=501)
+
+    filters = active_filters(request)
+    # Browsers send Last-Event-ID when they reconnect; the page passes
+    # ?last_id= on the first connect (newest row it already shows)
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_id', '')
+    last_sent = int(last_event_id) if last_event_id.isdigit() else None
+
+    async def stream():
+        # Subscribe BEFORE reading the backlog so nothing falls in between
+        subscription = broker.subscribe(filters)
+        try:
+            yield "retry: 3000\n\n"
+            sent = last_sent or 0
+            if last_sent is not None:
+                # Reconnect: send what the client missed (one indexed query)
+                backlog = (AttackLog.objects.filter(id__gt=last_sent, **filters)
+                           .select_related('payload').order_by('id')[:REPLAY_LIMIT])
+                async for log in backlog:
+                    sent = log.id
+                    yield sse_frame(log)
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                # Send everything that is already waiting in one write
+                items = [item]
+                while not subscription.queue.empty():
+                    items.append(subscription.queue.get_nowait())
+                frames = []
+                for log_id, event, frame in items:
+                    if event == 'updated':
+                        frames.append(frame)
+                    elif log_id > sent:  # skip rows already replayed
+                        sent = log_id
+                        frames.append(frame)
+                if frames:
+                    yield ''.join(frames)
+        finally:
+            # Client went away (Django cancels the stream on disconnect)
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx-style proxies not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- Attack analytics (reads ONLY the rollup table) ---
+
+WINDOWS = {
+    '15m': timedelta(minutes=15),
+    '1h': timedelta(hours=1),
+    '6h': timedelta(hours=6),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+}
+
+
+def window_stats(request):
+    window_name = request.GET.get('window', '1h')
+    if window_name not in WINDOWS:
+        window_name = '1h'
+    window = WINDOWS[window_name]
+    resolution = rollups.resolution_for(window)
+    since = timezone.now() - window
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 100))
+    except ValueError:
+        limit = 10
+    return {
+        'window': window_name,
+        'resolution': resolution,
+        'since': since,
+        'top': {
+            dimension: rollups.top_values(dimension, since, resolution, limit)
+            for dimension in rollups.DIMENSIONS
+        },
+        'timeline': rollups.timeline(since, resolution),
+    }
+
+
+def attack_stats(request):
+    stats = window_stats(request)
+    peak = max((point['total'] for point in stats['timeline']), default=0)
+    for point in stats['timeline']:
+        point['percent'] = round(point['total'] * 100 / peak) if peak else 0
+    stats['windows'] = list(WINDOWS)
+    stats['total'] = sum(point['total'] for point in stats['timeline'])
+    return render(request, 'monitoring/stats.html', stats)
+
+
+def stats_api(request):
+    """
+    Top attack types / attacker IPs / endpoints and a per-bucket timeline.
+      ?window=15m|1h|6h|24h|7d  (default 1h)   ?limit=10
+    """
+    stats = window_stats(request)
+    return JsonResponse({
+        'window': stats['window'],
+        'resolution': stats['resolution'],
+        'since': stats['since'].isoformat(),
+        'top': stats['top'],
+        'timeline': [
+            {'bucket': point['bucket'].isoformat(), 'total': point['total']}
+            for point in stats['timeline']
+        ],
+    })
+
+
+# --- Performance metrics (see metrics.py) ---
+
+def metrics(request):
+    """Per-view latency, DB, monitor, template and size metrics, Prometheus text format."""
+    return HttpResponse(request_metrics.render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- Request profiles (see profiling.py). Stack traces show code paths: staff only ---
+
+@staff_member_required
+def profile_list(request):
+    """The slowest profiled requests of the window, slowest first."""
+    return JsonResponse({
+        'enabled': getattr(settings, 'PROFILER_ENABLED', False),
+        'profiles': [profile.summary() for profile in profiling.store.all()],
+    })
+
+
+@staff_member_required
+def profile_collapsed(request, profile_id):
+    """One profile as collapsed stacks: flamegraph.pl, speedscope, inferno."""
+    profile = profiling.store.get(profile_id)
+    if profile is None:
+        raise Http404("No such profile (or it fell out of the window)")
+    return HttpResponse(profile.collapsed(), content_type='text/plain; charset=utf-8')
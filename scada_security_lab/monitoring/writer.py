@@ -0,0 +1,224 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import connections, router
+from .dedup import Deduplicator
+from .models import AttackLog
+from .signals import attacks_logged
+
+# What to do with a new event when the queue is full:
+#   'drop'   -> throw it away (request never waits)
+#   'sample' -> keep 1 out of every `sample_rate` overflow events in place of
+#               the oldest queued one, drop the rest (request never waits)
+#   'block'  -> make the request thread wait for room (up to block_timeout)
+OVERFLOW_POLICIES = ('drop', 'sample', 'block')
+
+
+class AttackLogWriter:
+    """
+    Bounded in-process queue + one background thread that writes AttackLog
+    rows with bulk_create(). Repeated probes are folded into existing rows
+    (see dedup.py).
+
+    The request thread only does a queue put. The flusher writes a batch when
+    it has `batch_size` events or when `flush_interval` seconds have passed,
+    whichever comes first. Pending events are flushed on shutdown.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=1.0,
+                 overflow='drop', sample_rate=10, block_timeout=5.0, synchronous=False,
+                 dedup_window=60.0, dedup_max_open=10000):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', use one of {OVERFLOW_POLICIES}")
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.sample_rate = max(1, sample_rate)
+        self.block_timeout = block_timeout
+        # synchronous=True writes inline on the request thread (old behaviour)
+        self.synchronous = synchronous
+        self.dedup = Deduplicator(window=dedup_window, max_open=dedup_max_open)
+
+        # Counters
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self._overflow_seen = 0
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    # --- Request thread side ---
+
+    def submit(self, event):
+        """
+        Hand an unsaved AttackLog (payload_text set, not payload) to the
+        writer. Returns False if it was dropped.
+        """
+        if self.synchronous:
+            self._write([event])
+            return True
+
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            if not self._accept_overflow():
+                self._count(dropped=1)
+                return False
+            if self.overflow == 'sample':
+                if not self._replace_oldest(event):
+                    return False
+            else:
+                try:
+                    self.queue.put(event, timeout=self.block_timeout)
+                except queue.Full:
+                    self._count(dropped=1)
+                    return False
+        self._count(queued=1)
+        return True
+
+    def _accept_overflow(self):
+        if self.overflow == 'block':
+            return True
+        if self.overflow == 'sample':
+            with self._lock:
+                self._overflow_seen += 1
+                return self._overflow_seen % self.sample_rate == 0
+        return False
+
+    def _replace_oldest(self, event):
+        # Only 'block' may make the request wait; a sampled event evicts the
+        # oldest queued one instead, and either way one event is dropped.
+        try:
+            self.queue.get_nowait()
+            self.queue.task_done()
+        except queue.Empty:
+            pass
+        self._count(dropped=1)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Another request thread took the freed slot
+            self._count(dropped=1)
+            return False
+        return True
+
+    def _ensure_started(self):
+        # Checking the pid makes this safe with pre-forking servers: a forked
+        # worker does not inherit the parent's thread, so it starts its own.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='attacklog-writer', daemon=True)
+            self._thread.start()
+
+    # --- Flusher thread side ---
+
+    def _run(self):
+        try:
+            while not (self._stop.is_set() and self.queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    self._write(batch)
+                    for _ in batch:
+                        self.queue.task_done()
+        finally:
+            # This thread owns its own DB connection, close it on the way out.
+            connections[router.db_for_write(AttackLog)].close()
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop.is_set() and self.queue.empty()):
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.dedup.store(batch)
+        except Exception as e:
+            # Never let a DB error kill the flusher. The batch is lost, count it.
+            self._count(dropped=len(batch))
+            print(f"!!! MONITOR: failed to write {len(batch)} attack events: {e} !!!")
+            connections[router.db_for_write(AttackLog)].close()
+            return
+        self._count(flushed=len(batch))
+        # send_robust: a broken receiver must not take the flusher down
+        for receiver, result in attacks_logged.send_robust(sender=AttackLog, events=batch):
+            if isinstance(result, Exception):
+                print(f"!!! MONITOR: attacks_logged receiver {receiver.__name__} failed: {result} !!!")
+
+    # --- Control ---
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far has been written. Returns True on success."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline or self._thread is None or not self._thread.is_alive():
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10.0):
+        """Stop the flusher after it has written whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _count(self, queued=0, flushed=0, dropped=0):
+        with self._lock:
+            self.queued += queued
+            self.flushed += flushed
+            self.dropped += dropped
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'pending': self.queue.qsize(),
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Process-wide writer, configured from the MONITOR_LOG_* settings."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AttackLogWriter(
+                    max_queue=getattr(settings, 'MONITOR_LOG_QUEUE_SIZE', 10000),
+                    batch_size=getattr(settings, 'MONITOR_LOG_BATCH_SIZE', 500),
+                    flush_interval=getattr(settings, 'MONITOR_LOG_FLUSH_INTERVAL', 1.0),
+                    overflow=getattr(settings, 'MONITOR_LOG_OVERFLOW', 'drop'),
+                    sample_rate=getattr(settings, 'MONITOR_LOG_SAMPLE_RATE', 10),
+                    block_timeout=getattr(settings, 'MONITOR_LOG_BLOCK_TIMEOUT', 5.0),
+                    synchronous=not getattr(settings, 'MONITOR_ASYNC_LOGGING', True),
+                    dedup_window=getattr(settings, 'MONITOR_LOG_DEDUP_WINDOW', 60.0),
+                    dedup_max_open=getattr(settings, 'MONITOR_LOG_DEDUP_MAX_OPEN', 10000),
+                )
+                # Flush on shutdown (runs before daemon threads are killed)
+                atexit.register(_writer.close)
+    return _writer
@@ -1,3 +1,60 @@
-from django.test import TestCase
+import os
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase
+from core.models import DiagnosticReport
+from core.xmlstream import ingest
+from .views import patched_upload
 
-# Create your tests here.
+SECRET = 'plc-admin-password-1234'
+
+
+class XxeUploadTests(TestCase):
+    def setUp(self):
+        # The view saves into media/secure/ under the working directory
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(os.chdir, self.cwd)
+        self.secret_path = os.path.join(self.tmp.name, 'secret.txt')
+        with open(self.secret_path, 'w') as f:
+            f.write(SECRET)
+
+    def xml(self):
+        return (
+            f'<?xml version="1.0"?>\n'
+            f'<!DOCTYPE diagnostics [<!ENTITY xxe SYSTEM "file://{self.secret_path}">]>\n'
+            f'<diagnostics><report technician="A. Smith"><content>leak: &xxe;</content></report></diagnostics>'
+        ).encode()
+
+    def upload(self, name, data):
+        request = RequestFactory().post('/patched/upload/', {'file': SimpleUploadedFile(name, data)})
+        request.session = {'user': {'username': 'tech'}}
+        request._dont_enforce_csrf_checks = True
+        return patched_upload(request)
+
+    def test_external_entity_is_not_resolved(self):
+        response = self.upload('report.xml', self.xml())
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'XML Parsed Safely')
+        self.assertNotContains(response, SECRET)
+        report = DiagnosticReport.objects.get()
+        self.assertNotIn(SECRET, report.content)
+
+    def test_lone_report_keeps_its_content(self):
+        self.upload('report.xml', b'<report><content>valve 3 sticks</content><result name="p">4.2</result></report>')
+        self.assertEqual(DiagnosticReport.objects.get().content, 'valve 3 sticks')
+
+    def test_vulnerable_parse_would_leak_it(self):
+        # The same document with resolution on: proves the test file is a real XXE
+        path = os.path.join(self.tmp.name, 'report.xml')
+        with open(path, 'wb') as f:
+            f.write(self.xml())
+        ingest(path, resolve_entities=True, no_network=True)
+        self.assertIn(SECRET, DiagnosticReport.objects.get().content)
+
+    def test_other_extensions_are_refused(self):
+        response = self.upload('report.php', self.xml())
+        self.assertContains(response, 'Invalid file type')
+        self.assertFalse(DiagnosticReport.objects.exists())
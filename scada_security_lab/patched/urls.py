@@ -8,4 +8,10 @@ urlpatterns = [
     path('report/', views.patched_report, name='patched_report'),
     path('ssrf/', views.patched_ssrf, name='patched_ssrf'),
     path('diagnostics/', views.patched_deserialize, name='patched_deserialize'), # Eklendi
+    path('toggle/bulk/', views.patched_bulk_toggle, name='patched_bulk_toggle'),
+    path('ssrf/fleet/', views.patched_fleet_poll, name='patched_fleet_poll'),
+    path('telemetry/', views.patched_telemetry, name='patched_telemetry'),
+    path('telemetry/latest/', views.patched_telemetry_latest, name='patched_telemetry_latest'),
+    path('telemetry/series/', views.patched_telemetry_series, name='patched_telemetry_series'),
+    path('search/', views.patched_search, name='patched_search'),
 ]
\ No newline at end of file
@@ -1,12 +1,19 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from core.fleet import poll_devices, summary
+from core.xmlstream import ingest
+from core.devices import BulkToggleError, bulk_set_status, device_table_version, parse_bulk_request
 from core.models import Device, DiagnosticReport
+from core.search import SearchError, parse_search_request, search
+from core.telemetry import TelemetryError, get_telemetry, latest_values, parse_ingest_request, parse_series_request, series
 from django.core.files.storage import FileSystemStorage
-from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+import hmac
+import ipaddress
 import uuid
 import os
 import requests
-from lxml import etree
 import json  # Deserialization fix için gerekli
 
 # 1. SECURE LOGIN (Fixes Auth Bypass)
@@ -35,9 +42,14 @@ def patched_dashboard(request):
     # FIX: Django ORM filter() uses parameterization automatically.
     # We deliberately ignore 'connector' or other injection attempts from URL.
     # We only show 'Operational' devices, hiding the secret/maintenance ones.
-    devices = Device.objects.filter(status='Operational')
+    devices = Device.objects.filter(status='Operational').only('name', 'ip_address', 'status')
     
-    context = {'devices': devices, 'user': request.session['user']}
+    # The rendered table is cached per device version (core/devices.py)
+    context = {
+        'devices': devices, 'user': request.session['user'],
+        'table_version': device_table_version(), 'table_cache_seconds': settings.DEVICE_TABLE_CACHE_SECONDS,
+        'telemetry_refresh': settings.TELEMETRY_DASHBOARD_REFRESH,
+    }
     return render(request, 'patched/dashboard.html', context)
 
 # 3. SECURE UPLOAD (Fixes Overwrite, Bad Type, XXE)
@@ -54,6 +66,11 @@ def patched_upload(request):
             context['status'] = "Error: Invalid file type. Only .xml, .txt allowed."
             return render(request, 'patched/upload.html', context)
 
+        # FIX D (Size): Refuse oversized XML before it touches the disk
+        if ext == '.xml' and uploaded_file.size > settings.XML_MAX_BYTES:
+            context['status'] = f"Error: XML larger than {settings.XML_MAX_BYTES} bytes."
+            return render(request, 'patched/upload.html', context)
+
         # FIX B (Overwrite): Use UUID to prevent overwriting existing files
         new_filename = f"{uuid.uuid4()}{ext}"
         fs = FileSystemStorage(location='media/secure/')
@@ -66,9 +83,13 @@ def patched_upload(request):
         if ext == '.xml':
             try:
                 # resolve_entities=False and no_network=True blocks XXE
-                parser = etree.XMLParser(resolve_entities=False, no_network=True)
-                tree = etree.parse(file_path, parser=parser)
-                context['xml_content'] = "XML Parsed Safely (External Entities ignored)."
+                # Streamed with byte / element / depth limits (core/xmlstream.py)
+                result = ingest(file_path, technician=request.session.get('user', {}).get('username', 'anonymous'),
+                                resolve_entities=False, no_network=True)
+                context['xml_content'] = (
+                    f"XML Parsed Safely (External Entities ignored). "
+                    f"{result['elements']} elements, {result['reports']} reports stored."
+                )
             except Exception as e:
                 context['xml_error'] = str(e)
 
@@ -137,4 +158,103 @@ def patched_deserialize(request):
         except Exception as e:
             status = f"Error: {str(e)}"
 
-    return render(request, 'patched/deserialize.html', {'status': status, 'output': output})
\ No newline at end of file
+    return render(request, 'patched/deserialize.html', {'status': status, 'output': output})
+
+# 7. SECURE BULK TOGGLE (Lockout/Tagout for a whole sector)
+@csrf_protect
+def patched_bulk_toggle(request):
+    # FIX: Logged-in technicians only, POST with a CSRF token
+    user_session = request.session.get('user')
+    if not user_session:
+        return JsonResponse({'error': 'Login required'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+    try:
+        # FIX: Only ids/location/status are accepted as filters, nothing from the URL goes into Q(**)
+        results = bulk_set_status(technician=user_session['username'], **parse_bulk_request(request))
+    except BulkToggleError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    changed = sum(1 for r in results if r['result'] == 'changed')
+    return JsonResponse({'changed': changed, 'results': results})
+
+# 8. SECURE FLEET POLL (every device's status at once, see core/fleet.py)
+def is_plant_address(ip_address, networks):
+    # Device.ip_address is whatever the vulnerable app let someone store
+    # there, so it is checked against the plant networks, not trusted.
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+@csrf_protect
+def patched_fleet_poll(request):
+    if not request.session.get('user'):
+        return JsonResponse({'error': 'Login required'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+    # FIX: Only the fixed status path, only known devices (optionally one location)
+    devices = Device.objects.only('id', 'name', 'ip_address').order_by('id')
+    if request.POST.get('location'):
+        devices = devices.filter(location=request.POST['location'])
+    devices = list(devices[:settings.FLEET_POLL_MAX_NODES])
+    # FIX: Only addresses inside FLEET_POLL_ALLOWED_NETWORKS are polled. A
+    # device rewritten to 169.254.169.254 or 127.0.0.1 is reported, not fetched.
+    networks = [ipaddress.ip_network(network) for network in settings.FLEET_POLL_ALLOWED_NETWORKS]
+    allowed, blocked = [], []
+    for device in devices:
+        (allowed if is_plant_address(device.ip_address, networks) else blocked).append(device)
+    results = poll_devices(allowed, settings.FLEET_POLL_PATH) + [
+        {'url': None, 'ok': False, 'status': None, 'error': 'address not allowed', 'elapsed_ms': None, 'cached': False,
+         'device': device.id, 'name': device.name, 'ip_address': device.ip_address}
+        for device in blocked
+    ]
+    return JsonResponse({'summary': summary(results), 'results': results})
+
+# 9. SECURE TELEMETRY (process values from the PLC gateways, see core/telemetry.py)
+# FIX: machines authenticate with a shared token (TELEMETRY_INGEST_TOKEN),
+# compared in constant time. No token configured = nothing is accepted.
+# csrf_exempt: there is no browser session here, the token is the credential.
+@csrf_exempt
+def patched_telemetry(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+    token = settings.TELEMETRY_INGEST_TOKEN
+    sent = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()):
+        return JsonResponse({'error': 'Invalid or missing token'}, status=403)
+    try:
+        accepted = get_telemetry().record_many(parse_ingest_request(request))
+    except TelemetryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'accepted': accepted})
+
+def patched_telemetry_latest(request):
+    if not request.session.get('user'):
+        return JsonResponse({'error': 'Login required'}, status=403)
+    return JsonResponse({'devices': latest_values(), 'refresh': settings.TELEMETRY_DASHBOARD_REFRESH})
+
+def patched_telemetry_series(request):
+    if not request.session.get('user'):
+        return JsonResponse({'error': 'Login required'}, status=403)
+    try:
+        query = parse_series_request(request)
+    except TelemetryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    # FIX: the resolution follows the range (raw only up to 15 minutes), whatever is asked for
+    query['resolution'] = None
+    resolution, points = series(**query)
+    return JsonResponse({'resolution': resolution, 'points': points})
+
+def patched_search(request):
+    if not request.session.get('user'):
+        return JsonResponse({'error': 'Login required'}, status=403)
+    try:
+        # FIX: pages of at most SEARCH_MAX_PER_PAGE rows, and no deeper than
+        # SEARCH_RANK_LIMIT results
+        query = parse_search_request(request, max_per_page=settings.SEARCH_MAX_PER_PAGE)
+        if (query['page'] - 1) * query['per_page'] >= settings.SEARCH_RANK_LIMIT:
+            raise SearchError("Too far back, narrow the search down")
+        return JsonResponse(search(**query))
+    except SearchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
@@ -3,14 +3,23 @@ ASGI config for scada_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live SOC feed (/monitoring/stream/) only streams under ASGI:
+    uvicorn scada_system.asgi:application --host 0.0.0.0 --port 8000
+Production (several workers, DEBUG off): python manage.py serve --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
 
 import os
+import warnings
 
 from django.core.asgi import get_asgi_application
 
+# Static files (WhiteNoise) are FileResponses, which are read with a sync
+# iterator. They are small; don't warn on every request.
+warnings.filterwarnings('ignore', message='StreamingHttpResponse must consume synchronous iterators')
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scada_system.settings')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,7 +24,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-m(tmyfb-5#wkr8%ck5xu$&r1sbmv00(#)jd)3&on0#4br+!a48'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# On by default for the lab; the production profile (manage.py serve) sets DJANGO_DEBUG=0
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ['*']
 
@@ -44,7 +46,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below (/monitoring/metrics)
+    'monitoring.metrics.MetricsMiddleware',
+    # Opt-in sampling profiler, off unless PROFILER_ENABLED (monitoring/profiling.py)
+    'monitoring.profiling.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Serves /static/ from the worker processes (compressed, cached forever)
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,7 +66,9 @@ ROOT_URLCONF = 'scada_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render times for /monitoring/metrics
+        'BACKEND': 'monitoring.metrics.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,12 +87,69 @@ WSGI_APPLICATION = 'scada_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite, tuned for several server workers:
+# - WAL: readers keep reading while one writer commits
+# - timeout: wait up to 20 s for the write lock instead of "database is locked"
+# - IMMEDIATE: take the write lock at BEGIN, so two transactions never deadlock
+#   trying to upgrade from read to write
+# - CONN_MAX_AGE: keep the connection (and its PRAGMAs) between requests
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# The monitoring app (AttackLog and co.) gets a file of its own, same tuning:
+# attack-log writes never wait for, or hold up, the device tables
+# (monitoring/routers.py). Create its tables with
+# `python manage.py migrate --database monitoring`.
+DATABASES['monitoring'] = dict(
+    DATABASES['default'],
+    NAME=os.environ.get('DJANGO_MONITOR_SQLITE_PATH', BASE_DIR / 'monitoring.sqlite3'),
+    OPTIONS=dict(DATABASES['default']['OPTIONS']),
+)
+DATABASE_ROUTERS = ['monitoring.routers.MonitoringRouter']
+
+# Optional PostgreSQL: DJANGO_DB_ENGINE=postgres (needs `pip install "psycopg[binary]"`)
+if os.environ.get('DJANGO_DB_ENGINE') == 'postgres':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'scada'),
+        'USER': os.environ.get('POSTGRES_USER', 'scada'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    DATABASES['monitoring'] = dict(DATABASES['default'], NAME=os.environ.get('POSTGRES_MONITOR_DB', 'scada_monitoring'))
+
+
+# Cache
+# In-process by default. With several server workers every process would
+# have its own copy, and a device change seen by one worker would not reach
+# the cached dashboards of the others: DJANGO_CACHE_DIR switches to a file
+# cache all workers share (manage.py serve sets it when --workers > 1).
+if os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 
 # Password validation
@@ -120,3 +187,190 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+# `manage.py serve` runs collectstatic into this folder
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Without DEBUG: hashed file names + pre-compressed copies, so WhiteNoise
+    # can send them gzipped with a one-year cache header
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+
+# Security monitor (monitoring app)
+
+# Request body inspection: 'stream' scans the body in chunks and stops after
+# MONITOR_BODY_INSPECT_LIMIT bytes, 'buffered' loads the whole body (old way).
+MONITOR_BODY_INSPECTION = 'stream'
+MONITOR_BODY_INSPECT_LIMIT = 1024 * 1024  # bytes
+MONITOR_BODY_CHUNK_SIZE = 64 * 1024
+# Characters of each chunk scanned again with the next one (> 0). Whitespace
+# runs are collapsed before the scan, so every match of the default rules fits;
+# a custom rule with .* in it only matches across chunks within this many.
+MONITOR_BODY_SCAN_OVERLAP = 256
+# Multipart file parts with these content types are not scanned (prefix match)
+MONITOR_BODY_SKIP_CONTENT_TYPES = (
+    'application/octet-stream', 'application/zip', 'application/pdf',
+    'image/', 'audio/', 'video/',
+)
+
+# Attack events are queued and written in batches by a background thread.
+# Set to False to write every event inline (old behaviour).
+MONITOR_ASYNC_LOGGING = True
+MONITOR_LOG_QUEUE_SIZE = 10000
+MONITOR_LOG_BATCH_SIZE = 500
+MONITOR_LOG_FLUSH_INTERVAL = 1.0  # seconds
+# When the queue is full: 'drop', 'sample' (keep 1 of MONITOR_LOG_SAMPLE_RATE) or 'block'
+MONITOR_LOG_OVERFLOW = 'drop'
+MONITOR_LOG_SAMPLE_RATE = 10
+MONITOR_LOG_BLOCK_TIMEOUT = 5.0  # seconds a request waits for room under 'block', then the event is dropped
+# Each distinct payload is stored once. The same payload from the same IP on the
+# same endpoint within MONITOR_LOG_DEDUP_WINDOW seconds adds to one AttackLog row
+# (its count) instead of a new row. The writer remembers at most
+# MONITOR_LOG_DEDUP_MAX_OPEN rows whose window is still open.
+MONITOR_LOG_DEDUP_WINDOW = 60.0
+MONITOR_LOG_DEDUP_MAX_OPEN = 10000
+
+# DATABASES alias of the monitoring app's tables, see DATABASE_ROUTERS.
+# 'default' puts them back in the main database.
+MONITOR_DATABASE = os.environ.get('MONITOR_DATABASE', 'monitoring')
+
+# Sources sending more than MONITOR_THROTTLE_MAX_ATTACKS detected attacks per
+# MONITOR_THROTTLE_WINDOW_SECONDS (sliding window, per REMOTE_ADDR) get a 429
+# before the view runs, for MONITOR_THROTTLE_BLOCK_SECONDS, doubled for each
+# block in a row up to MONITOR_THROTTLE_MAX_BLOCK_SECONDS. What they send while
+# blocked is written as one 'Rate Limited' summary row per source and window.
+MONITOR_THROTTLE_ENABLED = True
+MONITOR_THROTTLE_MAX_ATTACKS = 30
+MONITOR_THROTTLE_WINDOW_SECONDS = 10.0
+MONITOR_THROTTLE_BLOCK_SECONDS = 60.0
+MONITOR_THROTTLE_MAX_BLOCK_SECONDS = 3600.0
+MONITOR_THROTTLE_MAX_SOURCES = 10000  # tracked at once, least recently seen evicted
+
+# SOC page: how long the event totals are cached (seconds)
+MONITOR_COUNT_CACHE_SECONDS = 10
+
+# Where the live feed gets new events from:
+# 'local'    -> straight from this process's AttackLog writer (one server process)
+# 'database' -> one query per MONITOR_FEED_POLL_INTERVAL per process, so viewers
+#               also see attacks that hit the other workers (manage.py serve --workers N)
+MONITOR_FEED_SOURCE = os.environ.get('MONITOR_FEED_SOURCE', 'local')
+MONITOR_FEED_POLL_INTERVAL = 1.0  # seconds
+
+# Offline rescan with the current signatures (manage.py rescan_attacks, monitoring/rescan.py)
+MONITOR_RESCAN_CHUNK_SIZE = 5000  # payloads / captured requests per chunk (one pool task, one transaction)
+MONITOR_RESCAN_CHECKPOINT = BASE_DIR / 'rescan_checkpoint.json'  # an interrupted rescan resumes from here
+
+# Per-view performance metrics at /monitoring/metrics (monitoring/metrics.py).
+# False removes the middleware from the chain, nothing is measured.
+METRICS_ENABLED = True
+
+# Sampling profiler (monitoring/profiling.py), results at /monitoring/profiles/ (staff only).
+# Off: the middleware takes itself out of the chain. On: requests whose path
+# matches PROFILER_URL_PATTERNS, or that send "X-Profile: <PROFILER_HEADER_VALUE>",
+# are sampled. Anyone can send the header: use a secret value in production.
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+PROFILER_URL_PATTERNS = []       # e.g. [r'^/vulnerable/upload/', r'^/monitoring/$']
+PROFILER_HEADER = 'X-Profile'
+PROFILER_HEADER_VALUE = os.environ.get('PROFILER_HEADER_VALUE', '1')
+PROFILER_INTERVAL = 0.005        # seconds between samples
+PROFILER_KEEP = 20               # slowest profiles kept...
+PROFILER_WINDOW_SECONDS = 3600   # ...out of the last hour
+PROFILER_MAX_STACKS = 5000       # distinct stacks per profile
+
+
+# Bulk device toggle API (/vulnerable/toggle/bulk/, /patched/toggle/bulk/): most devices per call
+DEVICE_BULK_MAX = 10000
+# Rendered device tables on the dashboards: invalidated on every Device change,
+# this is only how long an unused one stays around (seconds)
+DEVICE_TABLE_CACHE_SECONDS = 300
+
+
+# Fleet status poll (/vulnerable/ssrf/fleet/, /patched/ssrf/fleet/, core/fleet.py)
+FLEET_POLL_PATH = '/status'     # polled on every device: http://<ip_address>:<port><path>
+FLEET_POLL_PORT = 80
+# The patched fleet poll only contacts device addresses inside these networks
+FLEET_POLL_ALLOWED_NETWORKS = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16')
+FLEET_POLL_MAX_NODES = 2000     # devices per poll
+FLEET_POLL_DEADLINE = 10.0      # seconds for the whole batch
+FLEET_POLL_TIMEOUT = 5.0        # seconds per node
+FLEET_POLL_PER_HOST = 4         # requests in flight to one host
+FLEET_POLL_WORKERS = 64         # threads shared by all polls in this process
+FLEET_POLL_CACHE_SECONDS = 15   # results reused for this long (0 = no cache)
+
+
+# Device telemetry (/vulnerable/telemetry/, /patched/telemetry/, core/telemetry.py)
+# Samples wait in per-series ring buffers and are written in bulk by a background thread.
+TELEMETRY_BUFFER_SAMPLES = 4096          # most samples buffered per device and metric (oldest overwritten)
+TELEMETRY_FLUSH_INTERVAL = 1.0           # seconds
+TELEMETRY_MAX_SERIES = 100000            # device/metric pairs buffered at once per process
+TELEMETRY_MAX_SAMPLES_PER_REQUEST = 50000
+TELEMETRY_MAX_AGE_SECONDS = 86400        # older samples are refused
+# The patched endpoint wants "Authorization: Bearer <token>"; empty = it accepts nothing
+TELEMETRY_INGEST_TOKEN = os.environ.get('TELEMETRY_INGEST_TOKEN', '')
+TELEMETRY_DASHBOARD_REFRESH = 5          # seconds between latest-value updates on the dashboards
+
+
+# PLC simulator (python manage.py simulate_plcs, core/plcsim.py): a Modbus/TCP
+# subset for every Device row, on this host from PLC_SIM_PORT upwards
+PLC_SIM_HOST = '127.0.0.1'
+PLC_SIM_PORT = 15020
+PLC_SIM_LAYOUT = 'gateway'       # 'gateway': PLC_SIM_UNITS_PER_PORT devices per port by unit id; 'device': a port each
+PLC_SIM_UNITS_PER_PORT = 247
+PLC_SIM_SYNC_INTERVAL = 2.0      # seconds between reads of Device.status / is_locked_out
+PLC_SIM_TICK = 1.0               # seconds between process value updates
+
+# Search over reports and maintenance logs (/vulnerable/search/, /patched/search/, core/search.py).
+# SQLite: FTS5 tables kept in step by triggers; PostgreSQL: a GIN index on their tsvector.
+# If results ever look out of date: python manage.py rebuild_search_index
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PER_PAGE = 100           # patched endpoint
+SEARCH_RANK_LIMIT = 10000           # a query matching more rows comes back newest first, unranked
+SEARCH_MAX_TERMS = 8
+SEARCH_POSTGRES_CONFIG = 'english'  # text search configuration (rebuild_search_index --drop after changing it)
+
+# XML uploads (core/xmlstream.py): streamed, limits enforced while parsing
+XML_MAX_BYTES = 600 * 1024 * 1024
+XML_MAX_ELEMENTS = 50_000_000
+XML_MAX_DEPTH = 64
+XML_CHUNK_SIZE = 1024 * 1024    # bytes fed to the parser at a time
+XML_BATCH_SIZE = 1000           # reports per bulk_create
+XML_ECHO_LIMIT = 64 * 1024      # vulnerable upload: characters of parsed XML shown back
+
+# DiagnosticResult payloads (core/payloads.py)
+# 'msgpack', 'cbor', 'json' or 'pickle', optionally '+zstd' / '+zlib'.
+# None: the first of msgpack+zstd, cbor+zstd, msgpack+zlib, json+zlib that is installed.
+DIAGNOSTIC_DATA_FORMAT = None
+DIAGNOSTIC_COMPRESS_MIN_BYTES = 512  # smaller payloads are stored uncompressed
+
+
+# PDF reports (core/reports.py)
+# Rendered PDFs are cached in memory per (report id, content hash), LRU, up to this many bytes per process
+REPORT_PDF_CACHE_BYTES = 32 * 1024 * 1024
+# Most reports one bulk export (/vulnerable/report/bulk/) may contain
+REPORT_BULK_MAX = 5000
+
+
+# Data retention (python manage.py enforce_retention)
+# Rows older than 'days' are archived to gzip JSONL files, then deleted.
+RETENTION_POLICIES = {
+    'monitoring.AttackLog': {
+        'days': 30, 'field': 'timestamp',
+        # With the payload text in the archive, not only its id
+        'archive_fields': ('id', 'timestamp', 'last_seen', 'count', 'ip_address', 'endpoint', 'attack_type',
+                           'payload__text'),
+    },
+    # Payloads no AttackLog row points to any more
+    'monitoring.AttackPayload': {'days': 30, 'field': 'first_seen', 'filter': {'logs__isnull': True}},
+    # Minute-level analytics are only shown for the last 6 hours
+    'monitoring.AttackRollup': {'days': 7, 'field': 'bucket', 'filter': {'resolution': 'minute'}},
+    'core.MaintenanceLog': {'days': 365, 'field': 'timestamp'},
+    # Raw samples for a week; after that the hour rollups tell the story
+    'core.TelemetryChunk': {'days': 7, 'field': 'end'},
+    'core.TelemetryRollup': {'days': 30, 'field': 'bucket', 'filter': {'resolution': 'minute'}},
+}
+RETENTION_ARCHIVE_DIR = BASE_DIR / 'archive'
+RETENTION_CHUNK_SIZE = 5000  # rows per archive chunk / delete transaction
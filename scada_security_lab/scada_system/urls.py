@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.urls import path, include
-from monitoring import views as monitor_views
 from django.views.generic import RedirectView
 
 urlpatterns = [
@@ -8,5 +7,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('vulnerable/', include('vulnerable.urls')),
     path('patched/', include('patched.urls')),
-    path('monitoring/', monitor_views.log_viewer, name='monitoring'),
+    path('monitoring/', include('monitoring.urls')),
 ]
\ No newline at end of file
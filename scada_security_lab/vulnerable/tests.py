@@ -1,3 +1,18 @@
 from django.test import TestCase
+from core.models import Device, MaintenanceLog
 
-# Create your tests here.
+
+class ToggleStatusTests(TestCase):
+    def test_toggles_one_device_without_a_log_row(self):
+        device = Device.objects.create(name='PLC-1', ip_address='10.0.0.1', location='Sector 7', status='Operational')
+        response = self.client.get(f'/vulnerable/toggle/{device.id}/')
+        self.assertRedirects(response, '/vulnerable/dashboard/', fetch_redirect_response=False)
+        device.refresh_from_db()
+        self.assertEqual((device.status, device.is_locked_out), ('Maintenance', True))
+        self.client.get(f'/vulnerable/toggle/{device.id}/')
+        device.refresh_from_db()
+        self.assertEqual((device.status, device.is_locked_out), ('Operational', False))
+        self.assertFalse(MaintenanceLog.objects.exists())
+
+    def test_unknown_device_is_404(self):
+        self.assertEqual(self.client.get('/vulnerable/toggle/999999/').status_code, 404)
@@ -7,7 +7,14 @@ urlpatterns = [
     path('dashboard/', views.vulnerable_dashboard, name='vulnerable_dashboard'),
     path('upload/', views.vulnerable_upload, name='vulnerable_upload'), 
     path('report/', views.vulnerable_report, name='vulnerable_report'),
+    path('report/bulk/', views.vulnerable_report_bulk, name='vulnerable_report_bulk'),
     path('toggle/<int:device_id>/', views.toggle_status, name='toggle_status'),
+    path('toggle/bulk/', views.bulk_toggle, name='bulk_toggle'),
     path('deserialize/', views.vulnerable_deserialize, name='vulnerable_deserialize'),
     path('ssrf/', views.vulnerable_ssrf, name='vulnerable_ssrf'),
+    path('ssrf/fleet/', views.vulnerable_fleet_poll, name='vulnerable_fleet_poll'),
+    path('telemetry/', views.vulnerable_telemetry, name='vulnerable_telemetry'),
+    path('telemetry/latest/', views.vulnerable_telemetry_latest, name='vulnerable_telemetry_latest'),
+    path('telemetry/series/', views.vulnerable_telemetry_series, name='vulnerable_telemetry_series'),
+    path('search/', views.vulnerable_search, name='vulnerable_search'),
 ]
\ No newline at end of file
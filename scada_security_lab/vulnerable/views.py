@@ -1,14 +1,20 @@
+import base64
 import urllib.request
-from lxml import etree # For the XXE vulnerability
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from core.models import Device, MaintenanceLog, DiagnosticReport
 from django.db.models import Q
-from reportlab.pdfgen import canvas
 from core.models import DiagnosticResult
+from core.devices import BulkToggleError, bulk_set_status, device_table_version, parse_bulk_request
+from core.fleet import poll_devices, summary
+from core.search import SearchError, parse_search_request, search
+from core.telemetry import TelemetryError, get_telemetry, latest_values, parse_ingest_request, parse_series_request, series
+from core.xmlstream import ingest  # For the XXE vulnerability
+from core.reports import async_chunks, get_report_pdf, stream_multipage_pdf, stream_zip
 
 
 # SCENARIO 1: Authentication Bypass
@@ -82,11 +88,17 @@ def vulnerable_dashboard(request):
         else:
             query &= Q(**{key: value})
 
-    devices = Device.objects.filter(query)
+    # Lazy: only runs when the cached table below has to be rendered again
+    devices = Device.objects.filter(query).only('id', 'name', 'ip_address', 'status', 'is_locked_out')
     
     context = {
         'devices': devices,
-        'user': request.session['user']
+        'user': request.session['user'],
+        # Rendered table cache: one entry per device version and filter string
+        'table_version': device_table_version(),
+        'table_key': request.GET.urlencode(),
+        'table_cache_seconds': settings.DEVICE_TABLE_CACHE_SECONDS,
+        'telemetry_refresh': settings.TELEMETRY_DASHBOARD_REFRESH,
     }
     return render(request, 'vulnerable/dashboard.html', context)
 
@@ -115,14 +127,15 @@ def vulnerable_upload(request):
         if filename.endswith('.xml'):
             try:
                 # DANGER: resolve_entities=True allows the XML to read local system files
-                parser = etree.XMLParser(resolve_entities=True)
-                tree = etree.parse(file_path, parser=parser)
-                root = tree.getroot()
+                # (Streamed through core/xmlstream.py: diagnostics are stored
+                # as they are parsed, memory stays flat for huge dumps.)
+                result = ingest(file_path, technician=request.session.get('user', {}).get('username', 'anonymous'),
+                                resolve_entities=True, echo_limit=settings.XML_ECHO_LIMIT)
                 
                 # We return the content of the XML back to the user
                 # If the XML contained a system file read, the user sees the system file here.
-                xml_content = etree.tostring(root, pretty_print=True).decode()
-                context['xml_content'] = xml_content
+                context['xml_content'] = result['echo']
+                context['status'] += f" ({result['elements']} elements, {result['reports']} reports stored)"
             except Exception as e:
                 context['xml_error'] = str(e)
 
@@ -141,35 +154,77 @@ def vulnerable_report(request):
     except DiagnosticReport.DoesNotExist:
         return HttpResponse("Report not found", status=404)
 
+    # Rendered in memory (core/reports.py) and cached per report version
+    pdf, cached = get_report_pdf(report_obj)
+
     # VULNERABILITY D: Unsafe Temp Files
-    # We use a static, predictable filename in a shared directory.
-    # An attacker knows this path exists: /tmp/scada_report_temp.pdf
-    temp_filename = "/tmp/scada_report_temp.pdf"
-    
-    # Generate the PDF
-    p = canvas.Canvas(temp_filename)
-    p.drawString(100, 800, f"SCADA CONFIDENTIAL REPORT #{report_obj.id}")
-    p.drawString(100, 780, f"Technician: {report_obj.technician_name}")
-    p.drawString(100, 760, f"Data: {report_obj.content}")
-    p.save()
-    
-    # Return the file to the user
-    # Ideally, we should stream it without saving, or use a unique temp name.
-    return FileResponse(open(temp_filename, 'rb'), as_attachment=True, filename=f"report_{report_id}.pdf")
+    # Every freshly rendered report is still dropped at a static, predictable
+    # path in a shared directory. An attacker knows this path exists:
+    # /tmp/scada_report_temp.pdf -> the last report anyone downloaded.
+    # (The download itself is served from memory, so concurrent requests
+    # no longer get each other's half-written file.)
+    if not cached:
+        with open("/tmp/scada_report_temp.pdf", 'wb') as temp_file:
+            temp_file.write(pdf)
+
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="report_{report_obj.id}.pdf"'
+    return response
+
+# VULNERABILITY A at scale: bulk export, still no ownership check
+# /vulnerable/report/bulk/?from=1&to=500 (or ?ids=1,2,3), &format=zip|pdf
+def vulnerable_report_bulk(request):
+    reports = DiagnosticReport.objects.only('id', 'technician_name', 'content').order_by('id')
+    if request.GET.get('ids'):
+        try:
+            ids = [int(i) for i in request.GET['ids'].split(',') if i.strip()]
+        except ValueError:
+            return HttpResponse("ids must be comma separated numbers", status=400)
+        reports = reports.filter(id__in=ids)
+    else:
+        try:
+            first = int(request.GET.get('from', 1))
+            last = int(request.GET.get('to', first + settings.REPORT_BULK_MAX - 1))
+        except ValueError:
+            return HttpResponse("from/to must be numbers", status=400)
+        reports = reports.filter(id__gte=first, id__lte=last)
+    reports = reports[:settings.REPORT_BULK_MAX]
+
+    # Rows are fetched in chunks and each PDF is sent as soon as it is rendered
+    if request.GET.get('format') == 'pdf':
+        chunks, content_type, filename = stream_multipage_pdf(reports.iterator(chunk_size=500)), 'application/pdf', 'reports.pdf'
+    else:
+        chunks, content_type, filename = stream_zip(reports.iterator(chunk_size=500)), 'application/zip', 'reports.zip'
+    if isinstance(request, ASGIRequest):
+        chunks = async_chunks(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 # CAPABILITY: Place device in maintenance / Release lock
 def toggle_status(request, device_id):
-    device = Device.objects.get(id=device_id)
-    # Simple toggle logic
-    if device.status == 'Operational':
-        device.status = 'Maintenance'
-        device.is_locked_out = True
-    else:
-        device.status = 'Operational'
-        device.is_locked_out = False
-    device.save()
+    # Same atomic path as the bulk API, so two clicks at once can't overwrite
+    # each other. Like before, the button writes no MaintenanceLog row.
+    if bulk_set_status('toggle', ids=[device_id], log=False)[0]['result'] == 'not_found':
+        raise Http404("Device not found")
     return redirect('vulnerable_dashboard')
 
+# CAPABILITY: Lockout/Tagout a whole sector in one call
+# POST /vulnerable/toggle/bulk/  {"action": "lock", "location": "Sector 7"} or {"ids": [...]}
+# VULNERABILITY: no login, no CSRF token. Anyone can lock out the plant.
+@csrf_exempt
+def bulk_toggle(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+    try:
+        results = bulk_set_status(technician=request.session.get('user', {}).get('username', 'anonymous'),
+                                  **parse_bulk_request(request))
+    except BulkToggleError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    changed = sum(1 for r in results if r['result'] == 'changed')
+    return JsonResponse({'changed': changed, 'results': results})
+
 
 @csrf_exempt
 def vulnerable_deserialize(request):
@@ -184,7 +239,7 @@ def vulnerable_deserialize(request):
         if payload:
             try:                
                 # calling get_data() triggers the vulnerability.
-                temp_result = DiagnosticResult(serialized_data=payload)
+                temp_result = DiagnosticResult(data=base64.b64decode(payload), data_format='pickle')
                 
                 # VULNERABILITY
                 data = temp_result.get_data()
@@ -214,4 +269,61 @@ def vulnerable_ssrf(request):
             except Exception as e:
                 status_content = f"Error fetching URL: {str(e)}"
     
-    return render(request, 'vulnerable/ssrf.html', {'content': status_content})
\ No newline at end of file
+    return render(request, 'vulnerable/ssrf.html', {'content': status_content})
+
+# CAPABILITY: Check every node at once (fleet poll, see core/fleet.py)
+# POST /vulnerable/ssrf/fleet/  path=/status  (optional: location=..., status=...)
+# VULNERABILITY: SSRF, fleet edition. The path is glued to each device
+# address unchecked, and the start of the response body is echoed back.
+# path=@169.254.169.254/latest/meta-data/ turns every device address into
+# a username and sends all the requests to that host instead.
+@csrf_exempt
+def vulnerable_fleet_poll(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+    path = request.POST.get('path', settings.FLEET_POLL_PATH)
+    devices = Device.objects.only('id', 'name', 'ip_address').order_by('id')
+    if request.POST.get('location'):
+        devices = devices.filter(location=request.POST['location'])
+    if request.POST.get('status'):
+        devices = devices.filter(status=request.POST['status'])
+    results = poll_devices(devices[:settings.FLEET_POLL_MAX_NODES], path, body_bytes=200)
+    return JsonResponse({'summary': summary(results), 'results': results})
+
+# CAPABILITY: Device telemetry, batched process values (see core/telemetry.py)
+# POST /vulnerable/telemetry/  {"samples": [{"device": 12, "metric": "pressure", "t": [...], "v": [3.2, 3.3]}]}
+# VULNERABILITY: no login, no token, no CSRF. Anyone who can reach the
+# server can feed the operators fake pressures and temperatures.
+@csrf_exempt
+def vulnerable_telemetry(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+    try:
+        accepted = get_telemetry().record_many(parse_ingest_request(request))
+    except TelemetryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'accepted': accepted})
+
+# Latest value of every device and metric (the dashboard polls this)
+def vulnerable_telemetry_latest(request):
+    return JsonResponse({'devices': latest_values(), 'refresh': settings.TELEMETRY_DASHBOARD_REFRESH})
+
+# GET /vulnerable/telemetry/series/?device=12&metric=pressure&minutes=60
+# VULNERABILITY: resolution=raw is honoured for any range. A year of raw
+# samples is decoded into one response: a cheap way to pin a worker.
+def vulnerable_telemetry_series(request):
+    try:
+        resolution, points = series(**parse_series_request(request))
+    except TelemetryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'resolution': resolution, 'points': points})
+
+# GET /vulnerable/search/?q=valve+test&kind=reports|logs&page=1&per_page=20
+# VULNERABILITY: no login, and every report is searchable. ?q=password
+# finds the admin's confidential report. per_page and page have no upper
+# bound either.
+def vulnerable_search(request):
+    try:
+        return JsonResponse(search(**parse_search_request(request)))
+    except SearchError as e:
+        return JsonResponse({'error': str(e)}, status=400)